@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+
+# benchmarks.py
+#
+# Performance measurements for the stages of the compiler.  Each
+# benchmark runs its workload in a fresh child process so that the
+# peak resident set size (RSS) it reports belongs to that workload
+# alone and not to whatever ran before it.
+#
+# To run everything:
+#
+#     bash % python3 benchmarks.py
+#
+# or name the benchmarks you want:
+#
+#     bash % python3 benchmarks.py lexer
+#
+
+import io
+import os
+import sys
+import glob
+import time
+import resource
+import multiprocessing
+from dataclasses import fields
+
+from wabbit.lexer import WabbitLexer
+from wabbit.tokenbuffer import TokenBuffer
+from wabbit.peg import Grammar, Packrat
+from wabbit import pegen
+from wabbit.parser import PEGParser, PEG_GRAMMAR, PEG_TOKENS, peg_actions
+from wabbit.checker import TypeChecker, CheckCache
+from wabbit.irgenerator import IRGenerator
+from wabbit.renderer import WabbitRenderer
+from wabbit.driver import compile_stream
+from wabbit.arena import Arena
+from wabbit.bytecode import Bytecode
+from wabbit import ircache
+from wabbit.passes import PassManager, LEVELS
+from wabbit.interp import Interpreter
+from wabbit import ssa
+from wabbit import cfg
+from wabbit.model import Node, Integer, Float, Name, BinOp, Literal
+from wabbit.visitor import Visitor
+
+# ----------------------------------------------------------------------
+# Support
+#
+# A synthetic, machine-generated looking Wabbit program.  The same
+# statement shapes are repeated until the text reaches the requested
+# size in bytes.
+
+chunk = '''\
+const n{i} = 10;
+var x{i} int = 1;
+var fact{i} int = 1;
+while x{i} < n{i} {{
+    fact{i} = fact{i} * x{i};
+    print float(fact{i}) + 2.5 * 3.0;
+    x{i} = x{i} + 1;
+}}
+func f{i}(x int) int {{
+    return x * {i} + 1;
+}}
+print f{i}(x{i});
+'''
+
+def generate_source(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        part = chunk.format(i=i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return ''.join(parts)
+
+def peak_rss():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _child(queue, workload, args):
+    start = time.perf_counter()
+    count = workload(*args)
+    elapsed = time.perf_counter() - start
+    if isinstance(count, tuple):
+        count, elapsed = count
+    queue.put((count, elapsed, peak_rss()))
+
+def measure(workload, *args):
+    # Run workload(*args) in a child process.  It must return a count of
+    # processed items, or (count, seconds) to time only part of its
+    # work.  Returns (count, seconds, peak rss bytes).
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_child, args=(queue, workload, args))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+def report(name, count, elapsed, rss, unit='tokens'):
+    rate = count / elapsed if elapsed else float('inf')
+    print(f'{name:<28} {count:>10} {unit} {elapsed:8.3f}s {rate:>12,.0f} {unit}/s {rss / 2**20:8.1f} MiB peak RSS')
+
+# ----------------------------------------------------------------------
+# Lexer: the debugging tokenize() path against the streaming path.
+#
+# tokenize() builds a list of every token and prints each one.  The
+# printing goes to /dev/null here, but its cost is still paid.
+
+def lex_tokenize(size):
+    source = generate_source(size)
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sys.stdout:
+        try:
+            return len(WabbitLexer().tokenize(source))
+        finally:
+            sys.stdout = stdout
+
+def lex_stream(size):
+    source = generate_source(size)
+    count = 0
+    for token in WabbitLexer().stream(source):
+        count += 1
+    return count
+
+def bench_lexer(size=4 * 2**20):
+    print(f'lexer: {size / 2**20:.1f} MiB of source')
+    for name, workload in [('tokenize', lex_tokenize), ('stream', lex_stream)]:
+        report(name, *measure(workload, size))
+
+# ----------------------------------------------------------------------
+# Token storage: a list of sly Token objects against a TokenBuffer.
+
+def tokens_list(size):
+    source = generate_source(size)
+    tokens = list(WabbitLexer().stream(source))
+    return len(tokens)
+
+def tokens_buffer(size):
+    source = generate_source(size)
+    buffer = TokenBuffer.scan(source)
+    return len(buffer)
+
+def bench_tokenbuffer(size=4 * 2**20):
+    print(f'tokenbuffer: {size / 2**20:.1f} MiB of source')
+    for name, workload in [('list(stream)', tokens_list), ('TokenBuffer.scan', tokens_buffer)]:
+        report(name, *measure(workload, size))
+
+# ----------------------------------------------------------------------
+# PEG parser: packrat parsing with different memo capacities, and the
+# parser generated by pegen.  The result is the same in every case;
+# only time and memory change.
+
+def peg_parse(size, capacity):
+    buffer = TokenBuffer.scan(generate_source(size))
+    packrat = Packrat(Grammar(PEG_GRAMMAR, PEG_TOKENS), peg_actions, capacity=capacity)
+    packrat.parse(buffer)
+    return len(buffer)
+
+def pegen_parse(size, capacity):
+    buffer = TokenBuffer.scan(generate_source(size))
+    module = pegen.load(Grammar(PEG_GRAMMAR, PEG_TOKENS))
+    pegen.GeneratedParser(module, peg_actions, capacity=capacity).parse(buffer)
+    return len(buffer)
+
+def bench_parser(size=2**20):
+    print(f'parser: {size / 2**20:.1f} MiB of source')
+    for capacity in [16, 256, 2**24]:
+        report(f'packrat capacity={capacity}', *measure(peg_parse, size, capacity))
+    report('pegen capacity=256', *measure(pegen_parse, size, 256))
+
+# ----------------------------------------------------------------------
+# Front end: parse the whole Prog, then check it, then generate IR,
+# against the statement-at-a-time pipeline in driver.py.  "first" stops
+# at the first finished IRFunction to show how soon output is
+# available.
+
+def whole_program(size, first=False):
+    buffer = TokenBuffer.scan(generate_source(size))
+    model = PEGParser().parse(buffer)
+    TypeChecker.check(model)
+    generator = IRGenerator()
+    count = 0
+    for irfunc in generator.generate_stream(model.stmts):
+        count += 1
+        if first:
+            break
+    return count
+
+def pipeline(size, first=False):
+    buffer = TokenBuffer.scan(generate_source(size))
+    count = 0
+    for irfunc in compile_stream(buffer):
+        count += 1
+        if first:
+            break
+    return count
+
+def bench_frontend(size=2**20):
+    print(f'frontend: {size / 2**20:.1f} MiB of source')
+    for name, workload in [('whole program', whole_program), ('pipeline', pipeline)]:
+        report(f'{name}: first function', *measure(workload, size, True), unit='functions')
+        report(f'{name}: all', *measure(workload, size), unit='functions')
+
+# ----------------------------------------------------------------------
+# AST storage: a Prog of dataclass nodes against an Arena built from the
+# same statements.  Both hold the whole tree at the end.
+
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for field in fields(node):
+            value = getattr(node, field.name)
+            if isinstance(value, Node):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+    return count
+
+def tree_dataclasses(size):
+    buffer = TokenBuffer.scan(generate_source(size))
+    model = PEGParser().parse(buffer)
+    return count_nodes(model)
+
+def tree_arena(size):
+    buffer = TokenBuffer.scan(generate_source(size))
+    arena = Arena()
+    arena.program(PEGParser().statements(buffer))
+    return len(arena)
+
+def bench_arena(size=4 * 2**20):
+    print(f'arena: {size / 2**20:.1f} MiB of source')
+    report('dataclass nodes', *measure(tree_dataclasses, size), unit='nodes')
+    report('arena', *measure(tree_arena, size), unit='nodes')
+
+# ----------------------------------------------------------------------
+# Type checker throughput, timing TypeChecker.check alone on an already
+# parsed program.
+
+def check_program(size):
+    model = PEGParser().parse(generate_source(size))
+    nodes = count_nodes(model)
+    start = time.perf_counter()
+    TypeChecker.check(model)
+    return nodes, time.perf_counter() - start
+
+def bench_checker(size=2**20):
+    print(f'checker: {size / 2**20:.1f} MiB of source')
+    report('TypeChecker.check', *measure(check_program, size), unit='nodes')
+
+# ----------------------------------------------------------------------
+# Visitor passes: each pass timed on its own over a parsed (and, for IR
+# generation, checked) program, to measure visit() dispatch.
+
+def run_pass(size, name):
+    model = PEGParser().parse(generate_source(size))
+    nodes = count_nodes(model)
+    if name != 'TypeChecker':
+        TypeChecker.check(model)
+    start = time.perf_counter()
+    if name == 'TypeChecker':
+        TypeChecker.check(model)
+    elif name == 'IRGenerator':
+        IRGenerator.generate(model)
+    else:
+        WabbitRenderer().visit(model)
+    return nodes, time.perf_counter() - start
+
+class DispatchVisitor(Visitor):
+    def visit(self, literal: Literal, env):
+        return literal
+
+    def visit(self, name: Name, env):
+        return name
+
+    def visit(self, binop: BinOp, env):
+        return binop
+
+def dispatch(count):
+    nodes = [Integer(1), Float(2.0), Name('x'), BinOp(Name('+'), Integer(1), Integer(2))] * (count // 4)
+    visitor = DispatchVisitor()
+    start = time.perf_counter()
+    for node in nodes:
+        visitor.visit(node, None)
+    return len(nodes), time.perf_counter() - start
+
+def bench_visitors(size=2**20):
+    print(f'visitors: {size / 2**20:.1f} MiB of source')
+    report('visit() dispatch only', *measure(dispatch, 10**6), unit='calls')
+    for name in ['TypeChecker', 'IRGenerator', 'WabbitRenderer']:
+        report(name, *measure(run_pass, size, name), unit='nodes')
+
+# ----------------------------------------------------------------------
+# Incremental checking: a module of functions is checked once to fill a
+# CheckCache, then one function body is edited and the whole module is
+# checked again with the cache.
+
+func_chunk = '''\
+func g{i}(n int) int {{
+    var total int = 0;
+    var k int = 0;
+    while k < n {{
+        if k * {i} > total {{
+            total = total + k * {i};
+        }} else {{
+            total = total - 1;
+        }}
+        k = k + 1;
+    }}
+    return total;
+}}
+'''
+
+def generate_functions(size):
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        part = func_chunk.format(i=i)
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return ''.join(parts)
+
+def recheck(size, cached):
+    source = generate_functions(size)
+    cache = CheckCache()
+    TypeChecker.check(PEGParser().parse(source), cache=cache)
+    edited = PEGParser().parse(source.replace('total = total - 1;', 'total = total - 2;', 1))
+    start = time.perf_counter()
+    TypeChecker.check(edited, cache=cache if cached else None)
+    elapsed = time.perf_counter() - start
+    if cached:
+        print(f'    {cache}')
+    return len(edited.stmts), elapsed
+
+def bench_incremental(size=2**20):
+    print(f'incremental: {size / 2**20:.1f} MiB of functions, one edited')
+    report('recheck without cache', *measure(recheck, size, False), unit='funcs')
+    report('recheck with CheckCache', *measure(recheck, size, True), unit='funcs')
+
+# ----------------------------------------------------------------------
+# Parallel checking: the same module of functions checked in one process
+# and with the function bodies spread over a pool of worker processes
+# (one per CPU).  The time includes starting the pool and pickling the
+# trees both ways.
+
+def check_functions(size, workers):
+    model = PEGParser().parse(generate_functions(size))
+    start = time.perf_counter()
+    TypeChecker.check(model, workers=workers)
+    return len(model.stmts), time.perf_counter() - start
+
+def bench_parallel(size=4 * 2**20):
+    workers = os.cpu_count()
+    print(f'parallel: {size / 2**20:.1f} MiB of functions, {workers} CPUs')
+    report('TypeChecker.check', *measure(check_functions, size, None), unit='funcs')
+    report(f'check(workers={workers})', *measure(check_functions, size, workers), unit='funcs')
+
+# ----------------------------------------------------------------------
+# Bytecode: the IR of a program as lists of tuples against the same
+# instructions encoded as Bytecode.
+
+def tuple_bytes(code):
+    # The list, its tuples and their operand strings (opcode strings are
+    # shared, so not counted)
+    return sys.getsizeof(code) + sum(
+        sys.getsizeof(instr) + sum(sys.getsizeof(operand) for operand in instr[1:]) for instr in code)
+
+def encode_program(size):
+    model = PEGParser().parse(generate_source(size))
+    TypeChecker.check(model)
+    irmodule = IRGenerator.generate(model)
+    count = sum(len(irfunc.code) for irfunc in irmodule.functions)
+    start = time.perf_counter()
+    encoded = [Bytecode.encode(irfunc.code) for irfunc in irmodule.functions]
+    elapsed = time.perf_counter() - start
+    before = sum(tuple_bytes(irfunc.code) for irfunc in irmodule.functions)
+    after = sum(bytecode.nbytes() + sys.getsizeof(bytecode.consts) + sys.getsizeof(bytecode.names) for bytecode in encoded)
+    print(f'    tuples {before / 2**20:.1f} MiB, bytecode {after / 2**20:.1f} MiB (pools included, pooled values not)')
+    return count, elapsed
+
+def bench_bytecode(size=2**20):
+    print(f'bytecode: {size / 2**20:.1f} MiB of source')
+    report('Bytecode.encode', *measure(encode_program, size), unit='instrs')
+
+# ----------------------------------------------------------------------
+# IR cache: compiling a program whose cache entry is missing (cold)
+# against one whose entry is fresh (warm).
+
+def cached_compile(filename, cache_dir):
+    irmodule = ircache.compile_module(filename, cache_dir)
+    return sum(len(irfunc.code) for irfunc in irmodule.functions)
+
+def bench_ircache(size=2**20):
+    import tempfile
+    print(f'ircache: {size / 2**20:.1f} MiB of source')
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'program.wb')
+        with open(filename, 'w') as f:
+            f.write(generate_source(size))
+        report('cold (front end + store)', *measure(cached_compile, filename, tmp), unit='instrs')
+        report('warm (load)', *measure(cached_compile, filename, tmp), unit='instrs')
+        print(f'    entry {os.path.getsize(ircache.cache_path(filename, tmp)) / 2**20:.1f} MiB')
+
+# ----------------------------------------------------------------------
+# Passes: the IR passes of each optimization level over one program,
+# with the per-pass report of the pass manager.
+
+def optimize(size, level):
+    model = PEGParser().parse(generate_source(size))
+    TypeChecker.check(model)
+    irmodule = IRGenerator.generate(model)
+    count = sum(len(irfunc.code) for irfunc in irmodule.functions)
+    manager = PassManager.level(level)
+    start = time.perf_counter()
+    manager.run(irmodule)
+    elapsed = time.perf_counter() - start
+    manager.report(sys.stdout)
+    return count, elapsed
+
+def bench_passes(size=2**20):
+    print(f'passes: {size / 2**20:.1f} MiB of source')
+    for level in range(4):
+        report(f'-O{level}', *measure(optimize, size, level), unit='instrs')
+
+def optimize_corpus(level):
+    # Instructions removed by each pass over the programs in Tests/
+    removed = {}
+    total = 0
+    for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Tests', '*.wb'))):
+        irmodule = ircache.compile_module(filename)
+        total += sum(len(irfunc.code) for irfunc in irmodule.functions)
+        manager = PassManager.level(level, debug=True)
+        manager.run(irmodule)
+        for stats in manager.stats:
+            removed[stats.name] = removed.get(stats.name, 0) + stats.before - stats.after
+    for name, count in removed.items():
+        print(f'    {name:<20} {count:>6} instrs removed')
+    print(f'    {"total":<20} {sum(removed.values()):>6} of {total}')
+    return total
+
+def bench_corpus():
+    print('corpus: the programs in Tests/')
+    for level in range(1, 4):
+        report(f'-O{level}', *measure(optimize_corpus, level), unit='instrs')
+
+# ----------------------------------------------------------------------
+# SSA: every function of a program into register form and back.
+
+def ssa_roundtrip(size):
+    model = PEGParser().parse(generate_source(size))
+    TypeChecker.check(model)
+    irmodule = IRGenerator.generate(model)
+    count = sum(len(irfunc.code) for irfunc in irmodule.functions)
+    callees = ssa.functions(irmodule)
+    start = time.perf_counter()
+    funcs = [ssa.to_ssa(irfunc, callees) for irfunc in irmodule.functions]
+    middle = time.perf_counter()
+    for func in funcs:
+        ssa.to_stack(func)
+    end = time.perf_counter()
+    print(f'    to_ssa {middle - start:.3f}s, to_stack {end - middle:.3f}s, '
+          f'{sum(len(irfunc.code) for irfunc in irmodule.functions)} instrs after')
+    return count, end - start
+
+def bench_ssa(size=2**20):
+    print(f'ssa: {size / 2**20:.1f} MiB of source')
+    report('to_ssa + to_stack', *measure(ssa_roundtrip, size), unit='instrs')
+
+# ----------------------------------------------------------------------
+# CFG: blocks, dominators and loops of every function of a program,
+# computed and then asked for again while the code is unchanged (which
+# only checks that it is).
+
+def analyze(size, cached):
+    model = PEGParser().parse(generate_source(size))
+    TypeChecker.check(model)
+    irmodule = IRGenerator.generate(model)
+    count = sum(len(irfunc.code) for irfunc in irmodule.functions)
+    for irfunc in irmodule.functions:
+        if cached:
+            cfg.loops(irfunc)
+        else:
+            cfg.invalidate(irfunc)
+    start = time.perf_counter()
+    for irfunc in irmodule.functions:
+        cfg.loops(irfunc)
+    return count, time.perf_counter() - start
+
+def bench_cfg(size=2**20):
+    print(f'cfg: {size / 2**20:.1f} MiB of source')
+    report('cfg + dominators + loops', *measure(analyze, size, False), unit='instrs')
+    report('cached', *measure(analyze, size, True), unit='instrs')
+
+# ----------------------------------------------------------------------
+# LICM: mandelbrot kernels run by the interpreter at -O2, with and
+# without loop-invariant code motion.  mandel.wb and mandel_loop.wb are
+# left with nothing invariant in their loops once constants are folded;
+# in mandel_mapped each pixel's coordinates are computed from the loop
+# counters inside the iteration loop, as kernels often do.
+
+mandel_mapped = '''
+const xmin = -2.0;
+const ymax = 1.5;
+const dx = 3.0 / 80.0;
+const dy = 3.0 / 40.0;
+const threshhold = 1000;
+
+func mandel(width int, height int) int {
+    var ix int;
+    var iy int = 0;
+    var x float;
+    var y float;
+    var xtemp float;
+    var n int;
+    while iy < height {
+        ix = 0;
+        while ix < width {
+            x = 0.0;
+            y = 0.0;
+            n = threshhold;
+            while n > 0 && x*x + y*y <= 4.0 {
+                xtemp = x*x - y*y + (xmin + float(ix)*dx);
+                y = 2.0*x*y + (ymax - float(iy)*dy);
+                x = xtemp;
+                n = n - 1;
+            }
+            if n == 0 {
+                print '*';
+            } else {
+                print '.';
+            }
+            ix = ix + 1;
+        }
+        print '\\n';
+        iy = iy + 1;
+    }
+    return 0;
+}
+
+func main() int {
+    return mandel(80, 40);
+}
+'''
+
+def kernel_source(name):
+    if name.endswith('.wb'):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Tests', name)) as f:
+            return f.read()
+    return kernels[name]
+
+def run_kernel(name, licm):
+    model = PEGParser().parse(kernel_source(name))
+    TypeChecker.check(model)
+    irmodule = IRGenerator.generate(model)
+    PassManager([pass_ for pass_ in LEVELS[2] if licm or pass_.name != 'licm']).run(irmodule)
+    out = io.StringIO()
+    start = time.perf_counter()
+    Interpreter(irmodule, out).run()
+    elapsed = time.perf_counter() - start
+    return len(out.getvalue()), elapsed
+
+def bench_licm():
+    print('licm: mandelbrot kernels at -O2, interpreted')
+    for name in ('mandel.wb', 'mandel_loop.wb', 'mandel_mapped'):
+        report(f'{name} without licm', *measure(run_kernel, name, False), unit='chars')
+        report(f'{name} with licm', *measure(run_kernel, name, True), unit='chars')
+
+# ----------------------------------------------------------------------
+# Inlining: kernels run by the interpreter at -O3, with and without the
+# inliner.  mandel.wb calls in_mandelbrot once per pixel; mandel_calls
+# calls small helpers on every iteration of its innermost loop.
+
+mandel_calls = '''
+const xmin = -2.0;
+const ymax = 1.5;
+const dx = 3.0 / 80.0;
+const dy = 3.0 / 40.0;
+const threshhold = 1000;
+
+func square(v float) float {
+    return v * v;
+}
+
+func escaped(x float, y float) bool {
+    return square(x) + square(y) > 4.0;
+}
+
+func mandel(width int, height int) int {
+    var ix int;
+    var iy int = 0;
+    var x float;
+    var y float;
+    var x0 float;
+    var y0 float;
+    var xtemp float;
+    var n int;
+    while iy < height {
+        y0 = ymax - float(iy)*dy;
+        ix = 0;
+        while ix < width {
+            x0 = xmin + float(ix)*dx;
+            x = 0.0;
+            y = 0.0;
+            n = threshhold;
+            while n > 0 && !escaped(x, y) {
+                xtemp = square(x) - square(y) + x0;
+                y = 2.0*x*y + y0;
+                x = xtemp;
+                n = n - 1;
+            }
+            if n == 0 {
+                print '*';
+            } else {
+                print '.';
+            }
+            ix = ix + 1;
+        }
+        print '\\n';
+        iy = iy + 1;
+    }
+    return 0;
+}
+
+func main() int {
+    return mandel(80, 40);
+}
+'''
+
+kernels = {
+    'mandel_mapped': mandel_mapped,
+    'mandel_calls': mandel_calls,
+}
+
+def run_inlined(name, inline):
+    model = PEGParser().parse(kernel_source(name))
+    TypeChecker.check(model)
+    irmodule = IRGenerator.generate(model)
+    PassManager([pass_ for pass_ in LEVELS[3] if inline or pass_.name != 'inline']).run(irmodule)
+    out = io.StringIO()
+    start = time.perf_counter()
+    Interpreter(irmodule, out).run()
+    elapsed = time.perf_counter() - start
+    return len(out.getvalue()), elapsed
+
+def bench_inline():
+    print('inline: mandelbrot kernels at -O3, interpreted')
+    for name in ('mandel.wb', 'mandel_calls'):
+        report(f'{name} without inlining', *measure(run_inlined, name, False), unit='chars')
+        report(f'{name} with inlining', *measure(run_inlined, name, True), unit='chars')
+
+# ----------------------------------------------------------------------
+# Deep trees: one expression with `depth` nested BinOps, checked, turned
+# into IR and rendered at the default recursion limit.
+
+def deep_expression(depth):
+    source = 'var x int = ' + ' + '.join(['1'] * depth) + ';\nprint x;\n'
+    model = PEGParser().parse(source)
+    nodes = count_nodes(model)
+    start = time.perf_counter()
+    TypeChecker.check(model)
+    IRGenerator.generate(model)
+    WabbitRenderer().visit(model)
+    return nodes, time.perf_counter() - start
+
+def bench_deep(depth=50000):
+    print(f'deep: expression nested {depth} deep, recursion limit {sys.getrecursionlimit()}')
+    report('check + IR + render', *measure(deep_expression, depth), unit='nodes')
+
+benchmarks = {
+    'lexer': bench_lexer,
+    'tokenbuffer': bench_tokenbuffer,
+    'parser': bench_parser,
+    'frontend': bench_frontend,
+    'arena': bench_arena,
+    'checker': bench_checker,
+    'visitors': bench_visitors,
+    'incremental': bench_incremental,
+    'parallel': bench_parallel,
+    'bytecode': bench_bytecode,
+    'ircache': bench_ircache,
+    'passes': bench_passes,
+    'corpus': bench_corpus,
+    'ssa': bench_ssa,
+    'cfg': bench_cfg,
+    'licm': bench_licm,
+    'inline': bench_inline,
+    'deep': bench_deep,
+}
+
+def main(args):
+    for name in args or benchmarks:
+        benchmarks[name]()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -3,9 +3,31 @@
    executable */
 
 #include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
 void _print_int(int val) {
     printf("%i\n", val);
 }
 void _print_float(double val) {
     printf("%lf\n", val);
 }
+void _print_byte(int val) {
+    putchar(val);
+}
+
+/* Memory for PEEK and POKE, grown (and zeroed) by the ^ operator */
+char *_memory = NULL;
+static int _memory_size = 0;
+
+int _grow(int nbytes) {
+    char *memory = realloc(_memory, _memory_size + nbytes);
+    if (memory == NULL) {
+        fprintf(stderr, "out of memory\n");
+        exit(1);
+    }
+    memset(memory + _memory_size, 0, nbytes);
+    _memory = memory;
+    _memory_size += nbytes;
+    return _memory_size;
+}
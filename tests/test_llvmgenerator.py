@@ -0,0 +1,57 @@
+# test_llvmgenerator.py
+#
+# The LLVM backend must give a module LLVM accepts for control flow
+# where only some paths go on: a return, break or continue in one
+# branch of an if.
+
+import pytest
+
+llvm = pytest.importorskip('llvmlite.binding')
+
+from wabbit.parser import PEGParser
+from wabbit.checker import TypeChecker
+from wabbit.irgenerator import IRGenerator
+from wabbit.passes import PassManager
+from wabbit.llvmgenerator import LLVMGenerator
+
+PROGRAMS = {
+    'return in else': '''
+        func f(x int) int { if x > 5 { print 1; } else { return 2; } return 3; }
+        print f(1);
+    ''',
+    'return in then': '''
+        func f(x int) int { if x > 5 { return 2; } else { print 1; } return 3; }
+        print f(1);
+    ''',
+    'return in both': '''
+        func f(x int) int { if x > 5 { return 2; } else { return 1; } }
+        print f(1);
+    ''',
+    'break in else': '''
+        var n int = 0;
+        while n < 10 { if n < 5 { n = n + 1; } else { break; } print n; }
+        print n;
+    ''',
+    'continue in then': '''
+        var n int = 0;
+        while n < 10 { n = n + 1; if n < 5 { continue; } else { print n; } print 0; }
+        print n;
+    ''',
+    'continue in else': '''
+        var n int = 0;
+        while n < 10 { n = n + 1; if n > 5 { print n; } else { continue; } print 0; }
+        print n;
+    ''',
+    'return in loop': '''
+        func f(x int) int { while x < 10 { if x == 7 { return x; } x = x + 1; } return 0; }
+        print f(1);
+    ''',
+}
+
+@pytest.mark.parametrize('level', range(4))
+@pytest.mark.parametrize('name', PROGRAMS)
+def test_module_verifies(name, level):
+    model = PEGParser().parse(PROGRAMS[name])
+    assert TypeChecker.check(model)
+    irmodule = PassManager.level(level, debug=True).run(IRGenerator.generate(model))
+    llvm.parse_assembly(str(LLVMGenerator.generate(irmodule))).verify()
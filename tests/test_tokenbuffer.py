@@ -0,0 +1,46 @@
+# test_tokenbuffer.py
+#
+# TokenBuffer.relex() must give the same tokens as scanning the edited
+# source from scratch.
+
+import glob
+import os
+import random
+
+import pytest
+
+from wabbit.tokenbuffer import TokenBuffer
+
+TESTS = os.path.join(os.path.dirname(__file__), '..', 'Tests')
+
+SNIPPETS = [b'', b' ', b'\n', b'/*', b'*/', b'//', b'x', b'1', b'.5', b'=', b'==',
+            b'var y int = 2;\n', b'/* note */', b'// note\n', b'{', b'}']
+
+def arrays(buffer):
+    return (buffer.kinds, buffer.starts, buffer.lengths, buffer.lines)
+
+def edited(source, offset, deleted, inserted):
+    return source[:offset] + inserted + source[offset + deleted:]
+
+def test_edit_before_first_token():
+    buffer = TokenBuffer.scan(b'/* comment */ var x int = 1;')
+    for offset, deleted, inserted in [(3, 8, b''), (0, 0, b'var y int = 2;\n'), (0, 13, b'')]:
+        expected = TokenBuffer.scan(edited(buffer.source, offset, deleted, inserted))
+        assert arrays(buffer.relex(offset, deleted, inserted)) == arrays(expected)
+
+@pytest.mark.parametrize('filename', sorted(glob.glob(os.path.join(TESTS, '*.wb'))), ids=os.path.basename)
+def test_relex_matches_scan(filename):
+    with open(filename, 'rb') as file:
+        source = file.read()
+    buffer = TokenBuffer.scan(source)
+    rng = random.Random(filename)
+    for _ in range(200):
+        offset = rng.randrange(len(source) + 1)
+        deleted = rng.randrange(min(len(source) - offset, 20) + 1)
+        if rng.random() < 0.5:
+            inserted = rng.choice(SNIPPETS)
+        else:
+            at = rng.randrange(len(source) + 1)
+            inserted = source[at:at + rng.randrange(20)]
+        expected = TokenBuffer.scan(edited(source, offset, deleted, inserted))
+        assert arrays(buffer.relex(offset, deleted, inserted)) == arrays(expected), (offset, deleted, inserted)
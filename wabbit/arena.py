@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+# arena.py
+#
+# Compact AST storage.  An Arena holds any number of trees built from
+# the classes in model.py, but instead of one dataclass instance (with a
+# __dict__) per node it keeps a few typed arrays:
+#
+#    kinds   : node kind code (index into KINDS)
+#    offsets : where the node's fields start in data
+#    data    : the node's fields, in dataclass field order, one int each
+#    types   : the type annotated by the checker (value pool index)
+#    flags   : the lvalue/mutable annotations, as bits
+#
+# Each field is a reference with a two bit tag:
+#
+#    NODE    : index of a child node
+#    LIST    : offset in data of a count followed by that many NODE refs
+#    VALUE   : index into the value pool
+#    NONE    : the field is None
+#
+# The value pool interns names, numbers, operators and Types, so every
+# distinct value is stored once no matter how often it appears.
+#
+# Nodes are numbered in the order they are added, parents before their
+# children.  Visitors walk an arena by node index (see ArenaVisitor),
+# and node() turns any part of it back into model objects.
+#
+#     bash % python3 -m wabbit.arena someprogram.wb
+
+import sys
+from array import array
+from dataclasses import fields, is_dataclass
+
+from wabbit import model
+from wabbit.model import Node, Prog
+
+KINDS = tuple(
+    cls for cls in vars(model).values()
+    if isinstance(cls, type) and issubclass(cls, Node) and is_dataclass(cls)
+)
+KIND_CODES = {cls: code for code, cls in enumerate(KINDS)}
+# Constructor fields only; the checker's annotations are kept in columns
+FIELDS = tuple(tuple(field.name for field in fields(cls) if field.init) for cls in KINDS)
+
+NODE, LIST, VALUE, NONE = range(4)
+
+LVALUE = 1
+MUTABLE = 2
+
+class Arena:
+    __slots__ = ('kinds', 'offsets', 'data', 'types', 'flags', 'values', '_interned')
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.offsets = array('I')
+        self.data = array('i')
+        self.types = array('i')
+        self.flags = array('B')
+        self.values = []
+        self._interned = {}
+
+    def intern(self, value):
+        key = (type(value), value)
+        index = self._interned.get(key)
+        if index is None:
+            index = self._interned[key] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def _allocate(self, node):
+        # Append the node itself with all of its fields NONE
+        index = len(self.kinds)
+        cls = type(node)
+        code = KIND_CODES[cls]
+        self.kinds.append(code)
+        self.offsets.append(len(self.data))
+        self.data.extend([NONE] * len(FIELDS[code]))
+        type_ = None if 'type' in FIELDS[code] else getattr(node, 'type', None)
+        self.types.append(-1 if type_ is None else self.intern(type_))
+        flags = 0
+        if getattr(node, 'lvalue', False):
+            flags |= LVALUE
+        if 'mutable' not in FIELDS[code] and getattr(node, 'mutable', False):
+            flags |= MUTABLE
+        self.flags.append(flags)
+        return index
+
+    def add(self, root):
+        # Add the tree under root and return the index of root.  The tree
+        # is walked with an explicit stack, so its depth does not matter.
+        top = None
+        stack = [(root, -1)]
+        while stack:
+            node, where = stack.pop()
+            index = self._allocate(node)
+            if where < 0:
+                top = index
+            else:
+                self.data[where] = index << 2 | NODE
+            offset = self.offsets[index]
+            pending = []
+            for slot, name in enumerate(FIELDS[self.kinds[index]]):
+                value = getattr(node, name)
+                if isinstance(value, Node):
+                    pending.append((value, offset + slot))
+                elif isinstance(value, list):
+                    start = len(self.data)
+                    self.data[offset + slot] = start << 2 | LIST
+                    self.data.append(len(value))
+                    self.data.extend([NONE] * len(value))
+                    pending.extend((item, start + 1 + n) for n, item in enumerate(value))
+                elif value is not None:
+                    self.data[offset + slot] = self.intern(value) << 2 | VALUE
+            stack.extend(reversed(pending))
+        return top
+
+    def program(self, statements):
+        # Add a Prog from an iterable of top-level statements (for example
+        # PEGParser.statements), one statement at a time, and return its
+        # index.  The statements are numbered before the Prog itself.
+        stmts = array('i', (self.add(stmt) for stmt in statements))
+        index = self._allocate(Prog())
+        start = len(self.data)
+        self.data[self.offsets[index]] = start << 2 | LIST
+        self.data.append(len(stmts))
+        self.data.extend(stmt << 2 | NODE for stmt in stmts)
+        return index
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def kind(self, index):
+        return KINDS[self.kinds[index]]
+
+    def _decode(self, ref):
+        tag = ref & 3
+        if tag == NODE:
+            return ref >> 2
+        if tag == LIST:
+            start = ref >> 2
+            return [item >> 2 for item in self.data[start + 1:start + 1 + self.data[start]]]
+        if tag == VALUE:
+            return self.values[ref >> 2]
+        return None
+
+    def field(self, index, name):
+        # A field of a node: a child index, a list of child indices or a
+        # value.  Use kind() to tell a child index from an int value.
+        code = self.kinds[index]
+        return self._decode(self.data[self.offsets[index] + FIELDS[code].index(name)])
+
+    def fields(self, index):
+        offset = self.offsets[index]
+        names = FIELDS[self.kinds[index]]
+        return {name: self._decode(self.data[offset + slot]) for slot, name in enumerate(names)}
+
+    def type(self, index):
+        # The type the checker annotated the node with, if any
+        type_ = self.types[index]
+        return None if type_ < 0 else self.values[type_]
+
+    def children(self, index):
+        offset = self.offsets[index]
+        for slot in range(len(FIELDS[self.kinds[index]])):
+            ref = self.data[offset + slot]
+            tag = ref & 3
+            if tag == NODE:
+                yield ref >> 2
+            elif tag == LIST:
+                start = ref >> 2
+                for item in self.data[start + 1:start + 1 + self.data[start]]:
+                    yield item >> 2
+
+    def walk(self, index):
+        # Indices of the tree under index, in pre-order
+        stack = [index]
+        while stack:
+            index = stack.pop()
+            yield index
+            stack.extend(reversed(list(self.children(index))))
+
+    def node(self, index):
+        # The tree under index as model objects.  Children are built
+        # before their parents by going through the pre-order backwards.
+        built = {}
+        for current in reversed(list(self.walk(index))):
+            cls = KINDS[self.kinds[current]]
+            kwargs = {}
+            for name, value in self.fields(current).items():
+                ref = self.data[self.offsets[current] + FIELDS[self.kinds[current]].index(name)]
+                if ref & 3 == NODE:
+                    value = built.pop(value)
+                elif ref & 3 == LIST:
+                    value = [built.pop(item) for item in value]
+                kwargs[name] = value
+            obj = cls(**kwargs)
+            if self.types[current] >= 0:
+                obj.type = self.values[self.types[current]]
+            if self.flags[current] & LVALUE:
+                obj.lvalue = True
+            if self.flags[current] & MUTABLE:
+                obj.mutable = True
+            built[current] = obj
+        return built[index]
+
+    def nbytes(self):
+        # Memory used by the arrays (the value pool not included)
+        arrays = (self.kinds, self.offsets, self.data, self.types, self.flags)
+        return sum(len(a) * a.itemsize for a in arrays)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(nodes={len(self)}, values={len(self.values)}, nbytes={self.nbytes()})'
+
+class ArenaVisitor:
+    # Walks an Arena by node index.  visit(index, ...) calls the method
+    # visit_<Class> for the class of the node, or for the nearest base
+    # class that has one (visit_Literal handles Integer, Float, ...).
+    # Without either, generic() visits the node's children.
+
+    def __init__(self, arena):
+        self.arena = arena
+        self.handlers = []
+        for cls in KINDS:
+            names = [f'visit_{base.__name__}' for base in cls.__mro__]
+            handler = next((getattr(self, name) for name in names if hasattr(self, name)), self.generic)
+            self.handlers.append(handler)
+
+    def visit(self, index, *args):
+        return self.handlers[self.arena.kinds[index]](index, *args)
+
+    def generic(self, index, *args):
+        for child in self.arena.children(index):
+            self.visit(child, *args)
+
+def main(args):
+    from wabbit.parser import PEGParser
+    from wabbit.tokenbuffer import TokenBuffer
+    for filename in args:
+        arena = Arena()
+        with TokenBuffer.map(filename) as tokens:
+            index = arena.program(PEGParser().statements(tokens))
+        print(arena)
+        print(arena.node(index))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+# bytecode.py
+#
+# Compact encoding of IR code.  The IR generator produces instructions
+# as tuples such as ('CONSTI', '2') or ('GLOBAL_SET', 'x').  A Bytecode
+# holds the same instructions as integers in one array:
+#
+#     code   : the opcode of each instruction, followed by its operand
+#              (if it has one) as an index into a pool
+#     consts : the constants of CONSTI/CONSTF, as ints and floats
+#     names  : the variable and function names of GLOBAL_*, LOCAL_*
+#              and CALL
+#
+# Each distinct constant or name is stored once.  Opcode numbers the
+# instructions, and OPERANDS says which pool, if any, an opcode takes an
+# operand from.  Backends share the encoding and look up what to do for
+# an opcode in a list indexed by it (see dispatch_table) rather than by
+# building a method name for every instruction.
+#
+#     bash % python3 -m wabbit.bytecode someprogram.wb
+
+import sys
+from array import array
+from enum import IntEnum
+from itertools import islice
+
+class Opcode(IntEnum):
+    # Integer operations
+    CONSTI = 0
+    ADDI = 1
+    SUBI = 2
+    MULI = 3
+    DIVI = 4
+    ANDI = 5
+    ORI = 6
+    LTI = 7
+    LEI = 8
+    GTI = 9
+    GEI = 10
+    EQI = 11
+    NEI = 12
+    PRINTI = 13
+    PEEKI = 14
+    POKEI = 15
+    ITOF = 16
+
+    # Floating point operations
+    CONSTF = 17
+    ADDF = 18
+    SUBF = 19
+    MULF = 20
+    DIVF = 21
+    LTF = 22
+    LEF = 23
+    GTF = 24
+    GEF = 25
+    EQF = 26
+    NEF = 27
+    PRINTF = 28
+    PEEKF = 29
+    POKEF = 30
+    FTOI = 31
+
+    # Byte-oriented operations
+    PRINTB = 32
+    PEEKB = 33
+    POKEB = 34
+
+    # Variable load/store
+    LOCAL_GET = 35
+    LOCAL_SET = 36
+    GLOBAL_GET = 37
+    GLOBAL_SET = 38
+
+    # Function call and return
+    CALL = 39
+    RET = 40
+
+    # Structured control flow
+    IF = 41
+    ELSE = 42
+    ENDIF = 43
+    LOOP = 44
+    CBREAK = 45
+    CONTINUE = 46
+    ENDLOOP = 47
+
+    # Memory
+    GROW = 48
+
+# Operand kinds
+NONE, CONST, NAME = range(3)
+
+OPERANDS = [NONE] * len(Opcode)
+OPERANDS[Opcode.CONSTI] = CONST
+OPERANDS[Opcode.CONSTF] = CONST
+for _op in (Opcode.LOCAL_GET, Opcode.LOCAL_SET, Opcode.GLOBAL_GET, Opcode.GLOBAL_SET, Opcode.CALL):
+    OPERANDS[_op] = NAME
+
+# (pops, pushes) of each opcode that does not touch control flow.  CALL
+# pops as many values as its callee has parameters.
+EFFECTS = {}
+for _op in Opcode:
+    if _op.name.startswith('CONST') or _op.name.endswith('_GET'):
+        EFFECTS[_op] = (0, 1)
+    elif _op.name.startswith('PRINT') or _op.name.endswith('_SET'):
+        EFFECTS[_op] = (1, 0)
+    elif _op.name.startswith('POKE'):
+        EFFECTS[_op] = (2, 0)
+    elif _op.name.startswith('PEEK') or _op in (Opcode.ITOF, Opcode.FTOI, Opcode.GROW):
+        EFFECTS[_op] = (1, 1)
+    elif _op < Opcode.PRINTB:
+        # Binary operations
+        EFFECTS[_op] = (2, 1)
+
+# The same, by opcode name, for code of instruction tuples
+EFFECTS_BY_NAME = {op.name: effect for op, effect in EFFECTS.items()}
+
+# Constants are converted to the type their instruction pushes
+_const_types = {Opcode.CONSTI: int, Opcode.CONSTF: float}
+
+def dispatch_table(cls, prefix):
+    # The method of cls named prefix + opcode name for each opcode (by
+    # number), or None where there is none
+    return [getattr(cls, f'{prefix}{op.name}', None) for op in Opcode]
+
+# Structured walks.  Code after a RET or CONTINUE cannot run, up to the
+# ELSE, ENDIF or ENDLOOP that ends the block it is in (and any blocks
+# opened in it).  reachable() goes through code, as instruction tuples
+# or (Opcode, operand) pairs, and yields (pc, instruction) for all but
+# that code.  The marker that ends it is yielded, as that is where
+# control flow can come back.  live() says whether the code the caller
+# has seen so far falls through; it is asked after every instruction.
+
+_opens = frozenset(('IF', 'LOOP'))
+_closes = frozenset(('ELSE', 'ENDIF', 'ENDLOOP'))
+
+def reachable(code, live, start=0, stop=None):
+    dead = 0
+    skipping = False
+    for pc, instr in enumerate(islice(code, start, stop), start):
+        if skipping:
+            op = instr[0]
+            if op.__class__ is not str:
+                op = op.name
+            if op in _opens:
+                dead += 1
+                continue
+            if op not in _closes:
+                continue
+            if dead:
+                if op != 'ELSE':
+                    dead -= 1
+                continue
+        yield pc, instr
+        skipping = not live()
+
+class Bytecode:
+    __slots__ = ('code', 'consts', 'names', '_consts', '_names')
+
+    def __init__(self):
+        self.code = array('i')
+        self.consts = []
+        self.names = []
+        self._consts = {}
+        self._names = {}
+
+    def const(self, value):
+        # By repr, so that 0.0 and -0.0 (which compare equal) get
+        # entries of their own
+        key = (type(value), repr(value))
+        index = self._consts.get(key)
+        if index is None:
+            index = self._consts[key] = len(self.consts)
+            self.consts.append(value)
+        return index
+
+    def name(self, name):
+        index = self._names.get(name)
+        if index is None:
+            index = self._names[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def append(self, op, operand=None):
+        op = Opcode[op] if isinstance(op, str) else op
+        self.code.append(op)
+        kind = OPERANDS[op]
+        if kind == CONST:
+            self.code.append(self.const(_const_types[op](operand)))
+        elif kind == NAME:
+            self.code.append(self.name(operand))
+
+    @classmethod
+    def encode(cls, instructions):
+        bytecode = cls()
+        for instr in instructions:
+            bytecode.append(*instr)
+        return bytecode
+
+    def __iter__(self):
+        # (Opcode, operand) for each instruction, with the operand taken
+        # from its pool, or None
+        code = self.code
+        pools = (None, self.consts, self.names)
+        pc = 0
+        while pc < len(code):
+            op = code[pc]
+            kind = OPERANDS[op]
+            if kind:
+                yield Opcode(op), pools[kind][code[pc + 1]]
+                pc += 2
+            else:
+                yield Opcode(op), None
+                pc += 1
+
+    def decode(self):
+        # The instructions as tuples again.  Constants come back as ints
+        # and floats rather than strings.
+        return [(op.name,) if operand is None else (op.name, operand) for op, operand in self]
+
+    def __len__(self):
+        # Number of instructions
+        return sum(1 for op in self)
+
+    def nbytes(self):
+        return len(self.code) * self.code.itemsize
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(nbytes={self.nbytes()}, consts={len(self.consts)}, names={len(self.names)})'
+
+def main(args):
+    from wabbit.driver import compile_file
+    for filename in args:
+        for irfunc in compile_file(filename):
+            bytecode = Bytecode.encode(irfunc.code)
+            print(f'{irfunc.name}: {bytecode}')
+            for op, operand in bytecode:
+                print(f'    {op.name}' if operand is None else f'    {op.name} {operand}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
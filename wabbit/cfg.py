@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+# cfg.py
+#
+# Control-flow analysis of IR code.  The code of a function only has
+# structured markers (IF/ELSE/ENDIF, LOOP/CBREAK/CONTINUE/ENDLOOP);
+# this builds, from IRFunction.code:
+#
+#     cfg(irfunc)          basic blocks and the edges between them
+#     dominators(irfunc)   the dominator tree of the blocks
+#     loops(irfunc)        the loop-nesting forest
+#
+# A block is a range of positions in the code, code[start:end].  Its
+# last instruction is the one that may jump (IF, ELSE, CBREAK, CONTINUE,
+# ENDLOOP, RET), and the jumps go where the interpreter sends them: a
+# false IF to just past ELSE (or ENDIF), ELSE to just past ENDIF, a true
+# CBREAK to just past ENDLOOP, and CONTINUE and ENDLOOP to just past
+# LOOP.  So a loop's header is the block that starts right after its
+# LOOP, and LOOP itself ends the block before the loop.  Code that
+# follows a RET or CONTINUE gets blocks of its own, which cannot be
+# reached from the entry.
+#
+# The results are cached on the function (IRFunction.analyses) along
+# with a copy of the code they were computed from.  When a pass has
+# changed the code since, the next request finds the copy no longer
+# equal and computes everything again, so passes never have to
+# invalidate anything by hand.  Checking costs one comparison of the
+# two lists, which for unchanged code compares the very same
+# instruction tuples.
+#
+#     bash % python3 -m wabbit.cfg someprogram.wb
+
+import sys
+
+class Block:
+    __slots__ = ('index', 'start', 'end', 'succs', 'preds')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.succs = []
+        self.preds = []
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.index}, start={self.start}, end={self.end})'
+
+class CFG:
+    __slots__ = ('blocks', 'block_at')
+
+    def __init__(self, blocks, block_at):
+        # The blocks in code order, the entry first
+        self.blocks = blocks
+        # The block of each position in the code
+        self.block_at = block_at
+
+    @property
+    def entry(self):
+        return self.blocks[0] if self.blocks else None
+
+class DominatorTree:
+    __slots__ = ('idom', 'children', 'order', '_first', '_last')
+
+    def __init__(self, idom, children, order, first, last):
+        # By block index: the immediate dominator (None for the entry
+        # and for unreachable blocks) and the blocks it dominates
+        # immediately
+        self.idom = idom
+        self.children = children
+        # The reachable blocks in reverse postorder
+        self.order = order
+        # Preorder numbering of the tree: a dominates b if b's number
+        # falls in a's subtree
+        self._first = first
+        self._last = last
+
+    def reachable(self, block):
+        return self._first[block.index] is not None
+
+    def dominates(self, a, b):
+        first = self._first[b.index]
+        return (first is not None and self._first[a.index] is not None
+                and self._first[a.index] <= first <= self._last[a.index])
+
+class Loop:
+    __slots__ = ('start', 'end', 'header', 'blocks', 'parent', 'children', 'depth')
+
+    def __init__(self, start, end, header):
+        # Positions of the LOOP and ENDLOOP
+        self.start = start
+        self.end = end
+        self.header = header
+        # The blocks of the loop, nested loops' included
+        self.blocks = set()
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+    def __contains__(self, block):
+        return block in self.blocks
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(start={self.start}, end={self.end}, blocks={len(self.blocks)}, depth={self.depth})'
+
+class LoopForest:
+    __slots__ = ('loops', 'roots', '_innermost')
+
+    def __init__(self, loops, roots, innermost):
+        # Every loop, in code order (so outer loops before the ones in
+        # them), and the outermost ones
+        self.loops = loops
+        self.roots = roots
+        self._innermost = innermost
+
+    def innermost(self, block):
+        # The innermost loop containing block, or None
+        return self._innermost[block.index]
+
+# ----------------------------------------------------------------------
+# The cache
+
+def analysis(build):
+    # Wraps build(irfunc) so that its result is cached on the function
+    # until the code changes
+    name = build.__name__
+    def cached(irfunc):
+        cache = irfunc.analyses
+        if cache.get('code') != irfunc.code:
+            cache.clear()
+            cache['code'] = list(irfunc.code)
+        result = cache.get(name)
+        if result is None:
+            result = cache[name] = build(irfunc)
+        return result
+    cached.__name__ = name
+    return cached
+
+def invalidate(irfunc):
+    irfunc.analyses.clear()
+
+# ----------------------------------------------------------------------
+# Analyses
+
+def structure(code):
+    # Position of the instruction each structured one jumps with: the
+    # ELSE (or ENDIF) of an IF, the ENDIF of an ELSE, the ENDLOOP of a
+    # LOOP, and the LOOP of a CBREAK, CONTINUE or ENDLOOP
+    partner = {}
+    blocks = []
+    for pc, instr in enumerate(code):
+        op = instr[0]
+        if op == 'IF' or op == 'LOOP':
+            blocks.append(pc)
+        elif op == 'ELSE':
+            partner[blocks[-1]] = pc
+            blocks[-1] = pc
+        elif op == 'ENDIF':
+            partner[blocks.pop()] = pc
+        elif op == 'ENDLOOP':
+            start = blocks.pop()
+            partner[start] = pc
+            partner[pc] = start
+        elif op == 'CBREAK' or op == 'CONTINUE':
+            partner[pc] = next(start for start in reversed(blocks) if code[start][0] == 'LOOP')
+    return partner
+
+@analysis
+def cfg(irfunc):
+    code = irfunc.code
+    partner = structure(code)
+    # Positions each jump can go to
+    targets = {}
+    for pc, instr in enumerate(code):
+        op = instr[0]
+        if op == 'IF':
+            targets[pc] = [pc + 1, partner[pc] + 1]
+        elif op == 'ELSE':
+            targets[pc] = [partner[pc] + 1]
+        elif op == 'CBREAK':
+            targets[pc] = [pc + 1, partner[partner[pc]] + 1]
+        elif op == 'CONTINUE' or op == 'ENDLOOP':
+            targets[pc] = [partner[pc] + 1]
+        elif op == 'RET':
+            targets[pc] = []
+    leaders = {0}
+    for pc, where in targets.items():
+        leaders.add(pc + 1)
+        leaders.update(where)
+    leaders = sorted(leader for leader in leaders if leader < len(code))
+    blocks = [Block(index, start, end) for index, (start, end)
+              in enumerate(zip(leaders, leaders[1:] + [len(code)]))]
+    block_at = []
+    for block in blocks:
+        block_at += [block] * (block.end - block.start)
+    for block in blocks:
+        last = block.end - 1
+        for target in targets.get(last, [block.end]):
+            if target < len(code):
+                succ = block_at[target]
+                block.succs.append(succ)
+                succ.preds.append(block)
+    return CFG(blocks, block_at)
+
+@analysis
+def dominators(irfunc):
+    # Cooper, Harvey and Kennedy, "A Simple, Fast Dominance Algorithm"
+    graph = cfg(irfunc)
+    count = len(graph.blocks)
+    idom = [None] * count
+    children = [[] for _ in range(count)]
+    first = [None] * count
+    last = [None] * count
+    if not count:
+        return DominatorTree(idom, children, [], first, last)
+    # Reverse postorder of the reachable blocks
+    postorder = []
+    seen = [False] * count
+    seen[0] = True
+    stack = [(graph.entry, iter(graph.entry.succs))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if not seen[succ.index]:
+                seen[succ.index] = True
+                stack.append((succ, iter(succ.succs)))
+                break
+        else:
+            stack.pop()
+            postorder.append(block)
+    number = [None] * count
+    for position, block in enumerate(postorder):
+        number[block.index] = position
+    order = postorder[::-1]
+    doms = [None] * count
+    doms[0] = graph.entry
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new = None
+            for pred in block.preds:
+                if doms[pred.index] is None:
+                    continue
+                if new is None:
+                    new = pred
+                    continue
+                # Intersect
+                a, b = pred, new
+                while a is not b:
+                    while number[a.index] < number[b.index]:
+                        a = doms[a.index]
+                    while number[b.index] < number[a.index]:
+                        b = doms[b.index]
+                new = a
+            if doms[block.index] is not new:
+                doms[block.index] = new
+                changed = True
+    for block in order[1:]:
+        idom[block.index] = doms[block.index]
+        children[doms[block.index].index].append(block)
+    # Number the tree in preorder
+    counter = 0
+    stack = [graph.entry]
+    while stack:
+        block = stack.pop()
+        if block is None:
+            continue
+        if first[block.index] is None:
+            first[block.index] = counter
+            counter += 1
+            stack.append(block)
+            stack.append(None)
+            stack.extend(reversed(children[block.index]))
+        else:
+            last[block.index] = counter - 1
+    return DominatorTree(idom, children, order, first, last)
+
+@analysis
+def loops(irfunc):
+    # One loop for each LOOP whose header is reachable and jumped back
+    # to from inside: its blocks are those that reach a back edge
+    # without going through the header
+    code = irfunc.code
+    graph = cfg(irfunc)
+    tree = dominators(irfunc)
+    partner = structure(code)
+    found = []
+    enclosing = []
+    innermost = [None] * len(graph.blocks)
+    for pc, instr in enumerate(code):
+        op = instr[0]
+        if op == 'ENDLOOP':
+            enclosing.pop()
+            continue
+        if op != 'LOOP':
+            continue
+        header = graph.block_at[pc + 1]
+        latches = [pred for pred in header.preds if tree.dominates(header, pred)]
+        if not latches:
+            enclosing.append(enclosing[-1] if enclosing else None)
+            continue
+        loop = Loop(pc, partner[pc], header)
+        loop.blocks.add(header)
+        work = list(latches)
+        while work:
+            block = work.pop()
+            if block not in loop.blocks and tree.reachable(block):
+                loop.blocks.add(block)
+                work.extend(block.preds)
+        parent = enclosing[-1] if enclosing else None
+        if parent is not None:
+            loop.parent = parent
+            loop.depth = parent.depth + 1
+            parent.children.append(loop)
+        for block in loop.blocks:
+            # Inner loops come later, and overwrite this
+            innermost[block.index] = loop
+        found.append(loop)
+        enclosing.append(loop)
+    return LoopForest(found, [loop for loop in found if loop.parent is None], innermost)
+
+def main(args):
+    from wabbit.ircache import compile_module
+    for filename in args:
+        irmodule = compile_module(filename)
+        if irmodule is None:
+            continue
+        for irfunc in irmodule.functions:
+            graph = cfg(irfunc)
+            tree = dominators(irfunc)
+            forest = loops(irfunc)
+            print(f'func {irfunc.name}')
+            for block in graph.blocks:
+                idom = tree.idom[block.index]
+                loop = forest.innermost(block)
+                print(f'    block {block.index} [{block.start}:{block.end}]'
+                      f' -> {", ".join(str(succ.index) for succ in block.succs) or "exit"}'
+                      f'{"" if idom is None else f"  idom {idom.index}"}'
+                      f'{"" if tree.reachable(block) else "  unreachable"}'
+                      f'{"" if loop is None else f"  loop {loop.start} depth {loop.depth}"}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -12,15 +12,27 @@
 # A key to this part of the project is going to be proper
 # testing.  As you add code, think about how you might test it.
 
-from itertools import chain
+import hashlib
+import multiprocessing
+from dataclasses import fields
+from concurrent.futures import ProcessPoolExecutor
 
 from wabbit.visitor import Visitor
 from wabbit.model import *
 from wabbit.errors import *
-from wabbit.env import Env
+from wabbit.resolver import NameResolver
+from wabbit.env import GlobalsView, Slot, GLOBAL, LOCAL
 
 from leatherman.dbg import dbg
 
+# A memory location has no type of its own.  It takes the type of
+# whatever it is used with: the other operand, the assigned value or
+# the type it is cast to.
+def infer(expr, type):
+    if isinstance(expr, Location) and getattr(expr, 'type', None) is None:
+        if type is not None and type is not Type.undef:
+            expr.type = type
+
 class TypeResolver(Visitor):
 
     _binop_rules = {
@@ -47,38 +59,348 @@ class TypeResolver(Visitor):
         ('<=', 'float', 'float'): 'bool',
         ('==', 'float', 'float'): 'bool',
         ('!=', 'float', 'float'): 'bool',
+
+        ('>', 'char', 'char'): 'bool',
+        ('<', 'char', 'char'): 'bool',
+        ('>=', 'char', 'char'): 'bool',
+        ('<=', 'char', 'char'): 'bool',
+        ('==', 'char', 'char'): 'bool',
+        ('!=', 'char', 'char'): 'bool',
+
+        ('==', 'bool', 'bool'): 'bool',
+        ('!=', 'bool', 'bool'): 'bool',
+        ('&&', 'bool', 'bool'): 'bool',
+        ('||', 'bool', 'bool'): 'bool',
+    }
+
+    _unop_rules = {
+        ('+', 'int'): 'int',
+        ('-', 'int'): 'int',
+        ('^', 'int'): 'int',
+        ('+', 'float'): 'float',
+        ('-', 'float'): 'float',
+        ('!', 'bool'): 'bool',
+    }
+
+    _casts = {
+        ('int', 'float'),
+        ('float', 'int'),
+        ('int', 'char'),
+        ('char', 'int'),
+        ('bool', 'int'),
     }
 
+    # The same rules keyed by (interned) Type objects
+    _binop_types = {(op, Type(left), Type(right)): Type(result) for (op, left, right), result in _binop_rules.items()}
+    _unop_types = {(op, Type(operand)): Type(result) for (op, operand), result in _unop_rules.items()}
+    _cast_types = {(Type(source), Type(target)) for source, target in _casts}
+
     def visit(self, binop: BinOp):
-        key = (binop.operator.value, binop.left.type.value, binop.right.type.value)
-        result = self._binop_rules.get(key)
-        if result:
-            return Type(result)
-        dbg(key, result)
+        return self._binop_types.get((binop.operator.value, binop.left.type, binop.right.type))
+
+    def visit(self, unop: UnOp):
+        return self._unop_types.get((unop.operator.value, unop.expr.type))
+
+    def visit(self, cast: Cast):
+        key = (cast.expr.type, cast.type)
+        if key[0] is key[1] or key in self._cast_types:
+            return cast.type
+        return None
+
+# Incremental checking.  A top-level function is checked the same way
+# every time unless its own tree changes or one of the global names it
+# uses is declared differently.  fingerprint() digests both: the class
+# and values of every node in the tree, and for every name in it, the
+# global slot and the signature (type, mutability, parameter types) it
+# would resolve to.
+# Unchanged functions are then taken, already annotated, from a
+# CheckCache along with the errors found in them.
+
+def signature(decl):
+    if isinstance(decl, (Func, Import)):
+        return ([param.type for param in decl.params], decl.type)
+    if decl is not None:
+        return (decl.type, decl.mutable)
+    return None
+
+# What later statements see of a top-level declaration.  Once a
+# statement has been checked, the global scope keeps this copy in
+# place of the statement itself: a function without its body and a
+# variable without its value.  The scope then holds no tree, and each
+# statement can be dropped as soon as its code has been generated.
+def declaration(decl):
+    if isinstance(decl, Func):
+        copy = Func(Name(decl.name.value), decl.params, decl.type, Block())
+    elif isinstance(decl, Definition):
+        copy = Definition(Name(decl.name.value), decl.type, Undef(), decl.mutable)
+    else:
+        return decl
+    copy.slot = copy.name.slot = decl.slot
+    copy.name.decl = copy
+    return copy
+
+# Constructor fields of each node class, in order
+_fields = {}
+
+def init_fields(cls):
+    names = _fields.get(cls)
+    if names is None:
+        names = _fields[cls] = tuple(field.name for field in fields(cls) if field.init)
+    return names
+
+def nodes(root):
+    # Every node of the tree under root, always in the same order
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        for name in init_fields(node.__class__):
+            value = getattr(node, name)
+            if value.__class__ is list:
+                stack += value
+            elif isinstance(value, Node):
+                stack.append(value)
+
+def fingerprint(func, scope):
+    parts = []
+    names = set()
+    stack = [func]
+    while stack:
+        node = stack.pop()
+        cls = node.__class__
+        names_ = init_fields(cls)
+        parts.append(cls)
+        if cls is Name:
+            names.add(node.value)
+        for name in names_:
+            value = getattr(node, name)
+            if value.__class__ is list:
+                parts.append(len(value))
+                stack += value
+            elif isinstance(value, Node):
+                stack.append(value)
+            else:
+                parts.append(value)
+    # The slot the function itself will get
+    parts.append(len(scope.decls))
+    for name in sorted(names):
+        slot = scope.lookup(name)
+        if slot is not None:
+            parts.append((name, slot.index, signature(scope.decl(slot))))
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).digest()
+
+class CheckCache:
+    # Checked functions and their errors, by fingerprint.  Keep one
+    # around between compiles and pass it to each TypeChecker.  Only
+    # the functions of the latest compile are kept: each TypeChecker
+    # starts a new one (see start()), and whatever the compile before
+    # it did not use is dropped, old versions of edited functions
+    # included.
+    def __init__(self):
+        self.results = {}
+        # Those of the compile before, not used again yet
+        self.previous = {}
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        self.previous = self.results
+        self.results = {}
+
+    def get(self, key):
+        result = self.results.get(key)
+        if result is None:
+            result = self.previous.pop(key, None)
+            if result is not None:
+                self.results[key] = result
         return result
 
+    def __repr__(self):
+        return f'{self.__class__.__name__}(functions={len(self.results)}, hits={self.hits}, misses={self.misses})'
+
 class TypeChecker(Visitor):
 
     resolver: TypeResolver = TypeResolver()
 
-    @classmethod
-    def check(cls, model):
-        checker = cls()
-        env = Env()
-        errors = model.accept(checker, env)
+    # Errors go to an ErrorSink (see errors.py), which prints them as
+    # they are found.  Pass one to set a limit on the number of errors
+    # or to stop at the first one.  With a CheckCache, top-level
+    # functions that have not changed since they were cached are not
+    # checked again.
+    def __init__(self, errors=None, cache=None):
+        self.errors = ErrorSink() if errors is None else errors
+        self.cache = cache
+        if cache is not None:
+            cache.start()
+        # Names are resolved to their declarations (see resolver.py)
+        # just before a statement is checked.  The second argument of
+        # every visit() is the function being checked, or None.
+        self.names = NameResolver(self.errors)
+
+    def _check(self, node):
+        # Returns the checked node: node itself, or the same function
+        # from the cache
+        if self.cache is None or not isinstance(node, Func):
+            self.names.visit(node, self.names.globals)
+            self.visit(node, None)
+            self._declared(node)
+            return node
+        key = fingerprint(node, self.names.globals)
+        cached = self._from_cache(key)
+        if cached is not None:
+            return cached
+        start = len(self.errors)
+        self.names.visit(node, self.names.globals)
+        self.visit(node, None)
+        self._declared(node)
+        self.cache.results[key] = (node, self.errors.errors[start:])
+        return node
+
+    def _declared(self, node):
+        # Replace a checked top-level declaration in the global scope by
+        # its declaration() copy
+        if isinstance(node, (Func, Definition)) and node.slot is not None:
+            self.names.globals.decls[node.slot.index] = declaration(node)
+
+    def _from_cache(self, key):
+        # The cached function for key, declared and with its errors
+        # reported again, or None
+        cached = self.cache.get(key)
+        if cached is None:
+            self.cache.misses += 1
+            return None
+        self.cache.hits += 1
+        node, errors = cached
+        self.names.declare(node, self.names.globals)
+        self._declared(node)
         for error in errors:
-            print(error)
-        else:
-            return True
-        return False
-
-    def visit(self, undef: Undef, env: Env):
-        errors = []
-        return errors
-
-    def visit(self, type: Type, env: Env):
-        errors = []
-        return errors
+            self.errors.report(error.__class__, error.msg, error.node)
+        return node
+
+    # Checks every statement of the program model and returns True if
+    # there were no errors.  Functions taken from the cache, or checked
+    # by a worker process, replace the ones in model.stmts.  With
+    # workers, the bodies of the top-level functions are checked in a
+    # pool of that many processes (see _check_parallel).
+    @classmethod
+    def check(cls, model, errors=None, cache=None, workers=None):
+        checker = cls(errors, cache)
+        try:
+            if workers:
+                checker._check_parallel(model.stmts, workers)
+            else:
+                for index, stmt in enumerate(model.stmts):
+                    model.stmts[index] = checker._check(stmt)
+        except TooManyErrors:
+            pass
+        return not checker.errors
+
+    # Parallel checking.  Everything but the bodies of the top-level
+    # functions is checked here first, in order, with the errors held
+    # back.  That declares every global, and a function's body only
+    # depends on the globals declared before it.  The bodies are then
+    # resolved and checked in forked worker processes, each against a
+    # GlobalsView of the globals as they were at its definition, and
+    # the results are copied onto the trees here (see _check_bodies).
+    # The errors of all statements are reported at the end, in
+    # statement order, so the outcome is the same as checking one
+    # statement after the other.
+    def _check_parallel(self, stmts, workers):
+        global _work
+        sink = self.errors
+        self.errors = self.names.errors = ErrorSink(output=None)
+        found = []
+        # (statement index, globals visible to it, cache key) per body
+        pending = []
+        try:
+            for index, stmt in enumerate(stmts):
+                start = len(self.errors)
+                if isinstance(stmt, Func):
+                    key = None
+                    if self.cache is not None:
+                        key = fingerprint(stmt, self.names.globals)
+                        cached = self._from_cache(key)
+                        if cached is not None:
+                            stmts[index] = cached
+                            found.append(self.errors.errors[start:])
+                            continue
+                    self.names.define(stmt, self.names.globals)
+                    self._declared(stmt)
+                    pending.append((index, len(self.names.globals.decls), key))
+                else:
+                    self.names.visit(stmt, self.names.globals)
+                    self.visit(stmt, None)
+                    self._declared(stmt)
+                found.append(self.errors.errors[start:])
+        finally:
+            self.errors = self.names.errors = sink
+        if pending:
+            bodies = [(index, limit) for index, limit, key in pending]
+            size = -(-len(bodies) // (workers * 4))
+            chunks = [bodies[start:start + size] for start in range(0, len(bodies), size)]
+            _work = (stmts, GlobalsView(self.names.globals.decls))
+            try:
+                context = multiprocessing.get_context('fork')
+                with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                    results = [result for chunk in pool.map(_check_bodies, chunks) for result in chunk]
+            finally:
+                _work = None
+            for (index, limit, key), (values, errors) in zip(pending, results):
+                func = stmts[index]
+                by_position = self._annotate(func, values)
+                found[index] += [cls(msg, by_position[position]) for cls, msg, position in errors]
+                if key is not None:
+                    self.cache.results[key] = (func, found[index])
+        for errors in found:
+            for error in errors:
+                sink.report(error.__class__, error.msg, error.node)
+
+    def _annotate(self, func, values):
+        # Copy the results of _check_bodies onto func, and restore the
+        # references to declarations.  Returns the nodes of func by
+        # position.
+        values = iter(values)
+        ordered = []
+        names = []
+        frame = {}
+        for node in nodes(func):
+            ordered.append(node)
+            for name in annotations(node.__class__):
+                value = next(values)
+                setattr(node, name, value)
+                if value.__class__ is Slot:
+                    if node.__class__ is Name:
+                        names.append(node)
+                    elif value.depth == LOCAL:
+                        frame[value.index] = node
+        func.frame = [frame[index] for index in sorted(frame)]
+        decls = self.names.globals.decls
+        for name in names:
+            if name.slot.depth == GLOBAL:
+                name.decl = decls[name.slot.index]
+            elif name.slot.depth == LOCAL:
+                name.decl = frame.get(name.slot.index)
+        return ordered
+
+    # Checks top-level statements one at a time as they arrive (for
+    # example from PEGParser.statements).  Each statement is passed on as
+    # soon as it has been checked, for as long as no errors have been
+    # found, so that later stages never see an unchecked tree.  Checking
+    # goes on after an error, to find more, until the sink's limit.
+    def check_stream(self, statements):
+        try:
+            for stmt in statements:
+                stmt = self._check(stmt)
+                if not self.errors:
+                    yield stmt
+        except TooManyErrors:
+            pass
+
+    def visit(self, undef: Undef, func):
+        pass
+
+    def visit(self, type: Type, func):
+        pass
 
 #def check_Name(node, env):
 #    if node.name not in env:
@@ -89,16 +411,16 @@ class TypeChecker(Visitor):
 #        node.type = decl.type
 #        node.mutable = decl.mutable
 
-    def visit(self, name: Name, env: Env):
-        errors = []
-        if name.value not in env:
-            errors += [NameLookupError(f'undefined name {name.value}', name)]
-            name.type = Type('undef')
+    def visit(self, name: Name, func):
+        decl = name.decl
+        if decl is None:
+            # Undefined, already reported by the resolver
+            name.type = Type.undef
         else:
-            decl = env[name.value]
+            if isinstance(decl, (Func, Import)):
+                self.errors.report(NameLookupError, f'{name.value} is a function', name)
             name.type = decl.type
-            name.mutable = decl.mutable
-        return errors
+            name.mutable = getattr(decl, 'mutable', False)
 #        result = env.get(name.value)
 #        if result is not None:
 #            name.type = result.type
@@ -108,34 +430,38 @@ class TypeChecker(Visitor):
 #        assert hasattr(name, 'type'), 'uh oh, no type'
 #        return errors
 
-    def visit(self, literal: Literal, env: Env):
-        errors = []
-        return errors
+    def visit(self, literal: Literal, func):
+        pass
 
-    def visit(self, location: Location, env: Env):
-        errors = []
-        return errors
+    def visit(self, location: Location, func):
+        yield location.value, func
+        if location.value.type is not Type.int:
+            self.errors.report(TypeMismatchError, 'memory address must be an int', location)
+        location.mutable = True
 
-    def visit(self, unop: UnOp, env: Env):
-        errors = []
-        errors += self.visit(unop.expr, env)
-        return errors
-
-    def visit(self, binop: BinOp, env: Env):
-        errors = []
-        errors += self.visit(binop.left, env)
-        errors += self.visit(binop.right, env)
+    def visit(self, unop: UnOp, func):
+        yield unop.expr, func
+        infer(unop.expr, Type.int)
+        type = self.resolver.visit(unop)
+        if type:
+            unop.type = type
+        else:
+            unop.type = Type.undef
+            self.errors.report(TypeResolveError, 'type resolve error', unop)
+
+    def visit(self, binop: BinOp, func):
+        yield binop.left, func
+        yield binop.right, func
+        infer(binop.left, binop.right.type)
+        infer(binop.right, binop.left.type)
+        infer(binop.left, Type.int)
+        infer(binop.right, Type.int)
         type = self.resolver.visit(binop)
         if type:
             binop.type = type
         else:
-            import pdb; pdb.set_trace()
-            errors += self.visit(binop.right, env)
-            errors += [TypeResolveError("type resolve error", binop)]
-        assert hasattr(binop, 'type'), dbg('missing type annotation', binop)
-
-        assert type is not None, "uh oh sucker!"
-        return errors
+            binop.type = Type.undef
+            self.errors.report(TypeResolveError, 'type resolve error', binop)
 
 #def check_VariableDefinition(node, env):
 #    # Is it already defined in local scope?  (duplicate definitions)
@@ -151,18 +477,20 @@ class TypeChecker(Visitor):
 #
 #    env[node.name] = node    # Save a reference to the definition
 
-    def visit(self, definition: Definition, env: Env):
-        errors = []
+    def visit(self, definition: Definition, func):
         definition.name.lvalue = True
         if definition.value:
-            self.visit(definition.value, env)
+            yield definition.value, func
+            infer(definition.value, definition.type)
             #if not definition.type:
-            if definition.type == Type('undef') or not definition.type:
+            if definition.type is Type.undef or not definition.type:
                 definition.type = definition.value.type
-            if definition.type != definition.value.type:
-                errors += [TypeMismatchError('type mismatch in definition checker', definition)]
-        env[definition.name.value] = definition
-        return errors
+            if definition.type is not definition.value.type:
+                self.errors.report(TypeMismatchError, 'type mismatch in definition checker', definition)
+        elif not definition.mutable:
+            self.errors.report(DefineError, 'const requires a value', definition)
+        elif definition.type is Type.undef:
+            self.errors.report(DefineError, 'var requires a type or a value', definition)
 #        errors = []
 #        definition.name.lvalue = True
 #        errors += self.visit(definition.value, env)
@@ -182,72 +510,65 @@ class TypeChecker(Visitor):
 #    if not node.location.mutable:
 #        error(f"Can't assign to immutable location")
 
-    def visit(self, assignment: Assignment, env: Env):
-        errors = []
+    def visit(self, assignment: Assignment, func):
         assignment.name.lvalue = True
-        errors += self.visit(assignment.name, env)
-        errors += self.visit(assignment.expr, env)
+        yield assignment.name, func
+        yield assignment.expr, func
+        infer(assignment.name, assignment.expr.type)
 
-        if assignment.name.type != assignment.expr.type:
-            errors += [TypeMismatchError('type mismatch in assignment checker', assignment)]
+        if assignment.name.type is not assignment.expr.type:
+            self.errors.report(TypeMismatchError, 'type mismatch in assignment checker', assignment)
         if not assignment.name.mutable:
-            errors += [ConstAssignmentError('attempted to assign to const', assignment)]
-        return errors
-
-    def visit(self, cast: Cast, env: Env):
-        errors = []
-        errors += self.visit(cast.expr, env)
-        return errors
-
-    def visit(self, block: Block, env: Env):
-        errors = []
-        errors += chain(*[self.visit(stmt, env) for stmt in block.stmts])
-        return errors
-
-    def visit(self, prog: Prog, env: Env):
-        errors = []
-        errors += chain(*[self.visit(stmt, env) for stmt in prog.stmts])
-        return errors
-
-    def visit(self, print: Print, env: Env):
-        errors = []
-        errors += self.visit(print.expr, env)
-        return errors
-
-    def visit(self, if_: If, env: Env):
-        errors = []
-        errors += self.visit(if_.test, env)
-        if if_.test.type != Type('bool'):
-            errors += [PredicateNotBoolError('predicate must be boolean expression', if_)]
-        errors += self.visit(if_.consequence, env)
-        errors += self.visit(if_.alternative, env)
-        return errors
-
-    def visit(self, while_: While, env: Env):
-        errors = []
-        errors += self.visit(while_.test, env)
-        if while_.test.type != Type('bool'):
-            errors += [PredicateNotBoolError('predicate must be boolean expression', while_)]
-        errors += self.visit(while_.block, env)
-        return errors
-
-    def visit(self, break_: Break, env: Env):
-        errors = []
-        return errors
-
-    def visit(self, continue_: Continue, env: Env):
-        errors = []
-        return errors
-
-    def visit(self, return_: Return, env: Env):
-        errors = []
-        errors += self.visit(return_.expr, env)
-        return errors
-
-    def visit(self, param: Parameter, env: Env):
-        errors = []
-        errors += self.visit(param.value, env)
-        return errors
+            self.errors.report(ConstAssignmentError, 'attempted to assign to const', assignment)
+
+    def visit(self, cast: Cast, func):
+        yield cast.expr, func
+        infer(cast.expr, cast.type)
+        if not self.resolver.visit(cast):
+            self.errors.report(TypeResolveError, f'cannot cast to {cast.type.value}', cast)
+
+    def visit(self, block: Block, func):
+        for stmt in block.stmts:
+            yield stmt, func
+
+    def visit(self, prog: Prog, func):
+        for stmt in prog.stmts:
+            yield stmt, func
+
+    def visit(self, print: Print, func):
+        yield print.expr, func
+        infer(print.expr, Type.int)
+
+    def visit(self, if_: If, func):
+        yield if_.test, func
+        if if_.test.type is not Type.bool:
+            self.errors.report(PredicateNotBoolError, 'predicate must be boolean expression', if_)
+        yield if_.consequence, func
+        yield if_.alternative, func
+
+    def visit(self, while_: While, func):
+        yield while_.test, func
+        if while_.test.type is not Type.bool:
+            self.errors.report(PredicateNotBoolError, 'predicate must be boolean expression', while_)
+        yield while_.block, func
+
+    def visit(self, break_: Break, func):
+        pass
+
+    def visit(self, continue_: Continue, func):
+        pass
+
+    def visit(self, return_: Return, func):
+        yield return_.expr, func
+        if func is None:
+            self.errors.report(DefineError, 'return outside of a function', return_)
+        else:
+            infer(return_.expr, func.type)
+            if return_.expr.type is not func.type:
+                self.errors.report(TypeMismatchError, 'type mismatch in return', return_)
+
+    def visit(self, param: Parameter, func):
+        yield param.value, func
 
 #def check_FunctionDefinition(node, env):
 #    # Check for nested functions?
@@ -262,22 +583,73 @@ class TypeChecker(Visitor):
 #    check(node.parameters, local_env)
 #    check(node.statements, local_env)
 
-    def visit(self, func: Func, env: Env):
-        errors = []
-
-        env[func.name] = func
-        func_env = env.new_child()
-        func_env['$func'] = func
-        errors += chain(*[self.visit(param, env) for param in func.params])
-        errors += self.visit(func.block, env)
-        return errors
-
-    def visit(self, import_: Import, env: Env):
-        errors = []
-        errors += chain(*[self.visit(param, env) for param in import_.params])
-        return errors
-
-    def visit(self, call: Call, env: Env):
-        errors = []
-        errors += chain(*[self.visit(param, env) for param in call.params])
-        return errors
+    def visit(self, func_: Func, func):
+        for param in func_.params:
+            yield param, func_
+        yield func_.block, func_
+
+    def visit(self, import_: Import, func):
+        for param in import_.params:
+            yield param, func
+
+    def visit(self, call: Call, func):
+        for param in call.params:
+            yield param, func
+        decl = call.name.decl
+        if not isinstance(decl, (Func, Import)):
+            if decl is not None:
+                self.errors.report(NameLookupError, f'undefined function {call.name.value}', call)
+            call.type = Type.undef
+            return
+        call.type = decl.type
+        if len(call.params) != len(decl.params):
+            self.errors.report(TypeMismatchError, f'{call.name.value} takes {len(decl.params)} arguments', call)
+        for arg, param in zip(call.params, decl.params):
+            infer(arg, param.type)
+            if arg.type is not param.type:
+                self.errors.report(TypeMismatchError, f'argument {param.name.value} must be {param.type.value}', call)
+
+# Process pool workers for TypeChecker._check_parallel.  The pool is
+# forked after _work is set to the statements and a GlobalsView, so
+# the workers start out with the trees and only statement indices are
+# sent to them.  Pickling whole trees costs more than checking them.
+# What comes back for each function is the attributes the resolver and
+# checker set, node by node in the order of nodes(), and its errors
+# with the position of their node in that order.
+
+_work = None
+
+# The attributes sent back for each node class.  References to other
+# declarations (decl and frame) are restored by the parent instead.
+# The checker also sets the type of a definition that has none.
+_annotations = {}
+
+def annotations(cls):
+    names = _annotations.get(cls)
+    if names is None:
+        names = tuple(field.name for field in fields(cls) if not field.init and field.name not in ('decl', 'frame'))
+        if cls is Definition:
+            names += ('type',)
+        _annotations[cls] = names
+    return names
+
+def _check_bodies(chunk):
+    stmts, view = _work
+    checker = TypeChecker(ErrorSink(output=None))
+    results = []
+    for index, limit in chunk:
+        func = stmts[index]
+        view.limit = limit
+        start = len(checker.errors)
+        checker.names.body(func, view)
+        checker.visit(func, None)
+        values = []
+        for node in nodes(func):
+            for name in annotations(node.__class__):
+                values.append(getattr(node, name))
+        errors = checker.errors.errors[start:]
+        if errors:
+            positions = {id(node): position for position, node in enumerate(nodes(func))}
+            errors = [(error.__class__, error.msg, positions[id(error.node)]) for error in errors]
+        results.append((values, errors))
+    return results
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# driver.py
+#
+# Compiler driver.  Runs the compiler over the .wb files named on the
+# command line:
+#
+#     bash % python3 -m wabbit.driver someprogram.wb
+#
+# Input files are memory-mapped (see source.py) and lexed straight from
+# the mapping into a TokenBuffer, so a large generated program is never
+# copied into a Python string.
+#
+# The front end runs as a pipeline, one top-level statement at a time:
+# the parser yields each statement as soon as it has been parsed, the
+# checker checks it and passes it on, and the IR generator turns it
+# into code.  The tree for a statement can be thrown away as soon as its
+# code exists, and each function's IR is available as soon as its
+# definition has gone by rather than after the whole program is parsed.
+
+import sys
+
+from wabbit.tokenbuffer import TokenBuffer
+from wabbit.parser import PEGParser
+from wabbit.checker import TypeChecker
+from wabbit.irgenerator import IRGenerator
+
+def lex_file(filename):
+    return TokenBuffer.map(filename)
+
+def parse_file(filename):
+    with lex_file(filename) as tokens:
+        return PEGParser().parse(tokens)
+
+def compile_stream(tokens, errors=None, cache=None):
+    # Yields each IRFunction of the program in tokens as soon as it is
+    # complete (_init, the top-level code, comes last).  Type errors go
+    # to errors (an ErrorSink, printing them by default), and nothing
+    # more is yielded after one.  cache is a CheckCache to reuse the
+    # checked functions of an earlier compile.
+    checker = TypeChecker(errors, cache)
+    generator = IRGenerator()
+    statements = checker.check_stream(PEGParser().statements(tokens))
+    for irfunc in generator.generate_stream(statements):
+        if checker.errors:
+            return
+        yield irfunc
+
+def compile_file(filename):
+    with lex_file(filename) as tokens:
+        yield from compile_stream(tokens)
+
+def listing(irfunc):
+    params = ', '.join(f'{name} {irtype}' for name, irtype in irfunc.params.items())
+    lines = [f'func {irfunc.name}({params}) {irfunc.return_type}']
+    lines += [f'    local {name} {irtype}' for name, irtype in irfunc.locals.items() if name not in irfunc.params]
+    lines += ['    ' + ' '.join(str(part) for part in instr) for instr in irfunc.code]
+    return '\n'.join(lines)
+
+def main(args):
+    for filename in args:
+        for irfunc in compile_file(filename):
+            print(listing(irfunc))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
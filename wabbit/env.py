@@ -1,6 +1,100 @@
 #!/usr/bin/env python3
 
-from collections import ChainMap
+# env.py
+#
+# Scopes for name resolution.  Wabbit has two levels of scope: the
+# globals of the program and the frame of the function being defined
+# (blocks do not open a scope of their own).  A Scope numbers its
+# declarations in the order they appear, and a name resolves to the
+# Slot of its latest declaration:
+#
+#     Slot(GLOBAL, 3)   : the fourth global (variable, function or import)
+#     Slot(LOCAL, 0)    : the first parameter of the current function
+#
+# Strings are only looked up here, once per use, by the resolver (see
+# resolver.py).  Later passes index by slot.
 
-class Env(ChainMap):
-    pass
+from bisect import bisect_left
+from dataclasses import dataclass
+
+GLOBAL = 0
+LOCAL = 1
+
+@dataclass(slots=True, frozen=True)
+class Slot:
+    depth: int
+    index: int
+
+    def __reduce__(self):
+        return (Slot, (self.depth, self.index))
+
+class Scope:
+    __slots__ = ('parent', 'depth', 'slots', 'decls')
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.depth = GLOBAL if parent is None else parent.depth + 1
+        # Slot of the latest declaration of each name
+        self.slots = {}
+        # The declaring nodes, by slot index
+        self.decls = []
+
+    def child(self):
+        return Scope(self)
+
+    def declare(self, name, decl):
+        slot = self.slots[name] = Slot(self.depth, len(self.decls))
+        self.decls.append(decl)
+        return slot
+
+    def __contains__(self, name):
+        # Declared in this scope (not an enclosing one)
+        return name in self.slots
+
+    def lookup(self, name):
+        slot = self.slots.get(name)
+        if slot is None and self.parent is not None:
+            return self.parent.lookup(name)
+        return slot
+
+    def decl(self, slot):
+        scope = self
+        while scope.depth != slot.depth:
+            scope = scope.parent
+        return scope.decls[slot.index]
+
+class GlobalsView(Scope):
+    # The global scope as it was when only its first `limit`
+    # declarations had been made, given the complete list of them.  One
+    # view serves every function of a program: set limit to the number
+    # of globals declared before the function and resolve its body in a
+    # child of the view.
+    __slots__ = ('history', 'limit', 'resolved')
+
+    def __init__(self, decls):
+        super().__init__()
+        self.decls = decls
+        # Slot indices of the declarations of each name, in order
+        self.history = {}
+        for index, decl in enumerate(decls):
+            self.history.setdefault(decl.name.value, []).append(index)
+        self.limit = len(decls)
+        self.resolved = {}
+
+    def declare(self, name, decl):
+        raise TypeError('GlobalsView is read-only')
+
+    def __contains__(self, name):
+        return self.lookup(name) is not None
+
+    def lookup(self, name):
+        indices = self.history.get(name)
+        if indices:
+            position = bisect_left(indices, self.limit)
+            if position:
+                index = indices[position - 1]
+                slot = self.resolved.get(index)
+                if slot is None:
+                    slot = self.resolved[index] = Slot(GLOBAL, index)
+                return slot
+        return None
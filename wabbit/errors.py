@@ -41,3 +41,35 @@ class PredicateNotBoolError(WabbitError):
 
 class ConstAssignmentError(WabbitError):
     pass
+
+# Errors are reported to an ErrorSink rather than collected in lists
+# and passed back up the tree.  report() takes the error class and its
+# arguments, so nothing is built unless something is actually wrong.
+# Each error is handed to output (print by default, None to stay
+# quiet) as it is reported.  After limit errors, or the first one with
+# fail_fast, report() raises TooManyErrors to abandon the pass.
+
+class TooManyErrors(Exception):
+    pass
+
+class ErrorSink:
+    __slots__ = ('errors', 'limit', 'output')
+
+    def __init__(self, limit=None, fail_fast=False, output=print):
+        self.errors = []
+        self.limit = 1 if fail_fast else limit
+        self.output = output
+
+    def report(self, cls, msg, node):
+        error = cls(msg, node)
+        self.errors.append(error)
+        if self.output is not None:
+            self.output(error)
+        if self.limit is not None and len(self.errors) >= self.limit:
+            raise TooManyErrors(f'stopped after {len(self.errors)} errors')
+
+    def __len__(self):
+        return len(self.errors)
+
+    def __iter__(self):
+        return iter(self.errors)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+# fold.py
+#
+# Constant folding and peephole optimization of IR code (see
+# passes.py for how passes are run).
+#
+# fold() rewrites the code of one function in a single pass
+# (fold_module() that of every function).  As it
+# copies instructions it keeps a stack, like the one the code will run
+# on, of which copied instruction produced each value.  An instruction
+# can then see the instructions that produced its operands, however far
+# back they are, and rewrite them:
+#
+#     CONST a; CONST b; op         ->  CONST (a op b)
+#     x; CONSTI 0; ADDI            ->  x       (also x-0, x*1, x/1)
+#     a; b; LTI; CONSTI 0; EQI     ->  a; b; GEI           (!(a < b))
+#     CONSTI 1; a; b; LTI; NEI     ->  a; b; GEI           (while tests)
+#     CONSTI 0; CONSTI 0; x; SUBI; SUBI  ->  x             (-(-x))
+#     GLOBAL_GET x; GLOBAL_SET x   ->                      (x = x)
+#     CONST c; IF ... ELSE ... ENDIF  ->  the branch c selects
+#     CONSTI 0; CBREAK             ->
+#
+# A double ! is two inverted comparisons, which cancel.  Where a value
+# comes out of an IF (&& and ||), its producer is the ENDIF.
+#
+# Folding follows the run-time semantics exactly.  Integer results that
+# would overflow 32 bits, division by zero and float results that are
+# not finite are left to run time.  Float comparisons other than == and
+# != are not inverted (with a NaN, !(a < b) is not a >= b), and float
+# identities that would change the sign of a zero are not applied.
+#
+# constants() finds the globals that are constant: those stored exactly
+# once, with a constant, at the top level of _init before anything can
+# read them (no call comes before the store).  Every read of one is
+# replaced by the constant and the store is dropped.  Folding _init can
+# reveal more of them (const dx = (xmax - xmin)/width), so it repeats
+# until it finds no more.
+
+import sys
+import math
+
+from wabbit.bytecode import EFFECTS_BY_NAME
+
+_binary = {
+    'ADDI': lambda a, b: a + b,
+    'SUBI': lambda a, b: a - b,
+    'MULI': lambda a, b: a * b,
+    'DIVI': lambda a, b: (-(abs(a) // abs(b)) if (a < 0) != (b < 0) else abs(a) // abs(b)) if b else None,
+    'ANDI': lambda a, b: a & b,
+    'ORI': lambda a, b: a | b,
+    'ADDF': lambda a, b: a + b,
+    'SUBF': lambda a, b: a - b,
+    'MULF': lambda a, b: a * b,
+    'DIVF': lambda a, b: a / b if b else None,
+}
+
+_compare = {
+    'LT': lambda a, b: a < b,
+    'LE': lambda a, b: a <= b,
+    'GT': lambda a, b: a > b,
+    'GE': lambda a, b: a >= b,
+    'EQ': lambda a, b: a == b,
+    'NE': lambda a, b: a != b,
+}
+for _name, _test in _compare.items():
+    _binary[_name + 'I'] = _binary[_name + 'F'] = (lambda test: lambda a, b: int(test(a, b)))(_test)
+
+# The comparison that gives the opposite result
+_inverse = {
+    'LTI': 'GEI', 'GEI': 'LTI', 'LEI': 'GTI', 'GTI': 'LEI',
+    'EQI': 'NEI', 'NEI': 'EQI', 'EQF': 'NEF', 'NEF': 'EQF',
+}
+
+# op: value of the right operand for which x op value is x
+# (ints and floats are told apart by repr, as are 0.0 and -0.0)
+_identities = {
+    'ADDI': 0, 'SUBI': 0, 'MULI': 1, 'DIVI': 1,
+    'SUBF': 0.0, 'MULF': 1.0, 'DIVF': 1.0,
+}
+
+def const_value(instr):
+    # The value a CONSTI/CONSTF instruction pushes, or None
+    if instr[0] == 'CONSTI':
+        return int(instr[1])
+    if instr[0] == 'CONSTF':
+        return float(instr[1])
+    return None
+
+def make_const(value):
+    # The instruction pushing value, or None if it cannot be a constant
+    if isinstance(value, float):
+        return ('CONSTF', repr(value)) if math.isfinite(value) else None
+    return ('CONSTI', str(value)) if -2**31 <= value < 2**31 else None
+
+def skip_block(code, pc):
+    # The position of the ELSE or ENDIF that ends the branch starting at
+    # code[pc]
+    nesting = 0
+    while True:
+        op = code[pc][0]
+        if op == 'IF' or op == 'LOOP':
+            nesting += 1
+        elif op == 'ENDIF' or op == 'ENDLOOP':
+            if nesting == 0:
+                return pc
+            nesting -= 1
+        elif op == 'ELSE' and nesting == 0:
+            return pc
+        pc += 1
+
+def arities(irmodule):
+    # The number of parameters of each function that can be called
+    arity = {callee.name: len(callee.params) for callee in irmodule.imports.values()}
+    arity.update((callee.name, len(callee.params)) for callee in irmodule.functions)
+    return arity
+
+def fold_module(irmodule):
+    arity = arities(irmodule)
+    for irfunc in irmodule.functions:
+        fold(irfunc, arity)
+
+def fold(irfunc, arity=None):
+    if arity is None:
+        arity = arities(irfunc.module)
+    source = irfunc.code
+    code = []           # output; removed instructions become None
+    operands = {}       # output position of a binary op: its operands' producers
+    stack = [None] * len(irfunc.params)
+    blocks = []
+    live = True
+    pc = 0
+    while pc < len(source):
+        instr = source[pc]
+        pc += 1
+        op = instr[0]
+        if op in _binary:
+            left, right = stack[-2:]
+            lvalue = const_value(code[left]) if left is not None else None
+            rvalue = const_value(code[right]) if right is not None else None
+            result = None
+            if lvalue is not None and rvalue is not None:
+                folded = _binary[op](lvalue, rvalue)
+                folded = make_const(folded) if folded is not None else None
+                if folded is not None:
+                    code[left] = code[right] = None
+                    result = len(code)
+                    code.append(folded)
+            elif rvalue is not None and repr(rvalue) == repr(_identities.get(op)):
+                code[right] = None
+                result = left
+            elif op == 'ADDI' and lvalue == 0:
+                code[left] = None
+                result = right
+            elif op == 'SUBI' and lvalue == 0 and right is not None and code[right] == ('SUBI',):
+                # -(-x)
+                inner_left, inner_right = operands[right]
+                if inner_left is not None and const_value(code[inner_left]) == 0:
+                    code[left] = code[right] = code[inner_left] = None
+                    result = inner_right
+            elif op == 'EQI' and rvalue == 0 and left is not None and code[left][0] in _inverse:
+                # !x of a comparison
+                code[right] = None
+                code[left] = (_inverse[code[left][0]],)
+                result = left
+            elif op == 'NEI' and lvalue == 1 and right is not None and code[right][0] in _inverse:
+                # 1 != x of a comparison
+                code[left] = None
+                code[right] = (_inverse[code[right][0]],)
+                result = right
+            if result is not None:
+                stack[-2:] = [result]
+                continue
+            operands[len(code)] = (left, right)
+        elif op == 'ITOF' or op == 'FTOI':
+            value = const_value(code[stack[-1]]) if stack[-1] is not None else None
+            if value is not None:
+                folded = make_const(float(value) if op == 'ITOF' else int(value))
+                if folded is not None:
+                    code[stack[-1]] = folded
+                    continue
+        elif op == 'GLOBAL_SET':
+            producer = stack[-1]
+            if producer is not None and producer == len(code) - 1 and code[producer] == ('GLOBAL_GET', instr[1]):
+                # x = x
+                code[producer] = None
+                stack.pop()
+                continue
+        elif op == 'IF':
+            test = stack.pop()
+            value = const_value(code[test]) if test is not None else None
+            if value is not None:
+                code[test] = None
+                if value:
+                    blocks.append(['TAKEN'])
+                else:
+                    pc = skip_block(source, pc)
+                    if source[pc][0] == 'ELSE':
+                        blocks.append(['TAKEN'])
+                    pc += 1
+                continue
+            blocks.append(['IF', list(stack), None])
+        elif op == 'ELSE':
+            block = blocks[-1]
+            if block[0] == 'TAKEN':
+                # The end of the branch taken: drop the other one
+                blocks.pop()
+                pc = skip_block(source, pc) + 1
+                continue
+            block[2] = (stack, live)
+            stack = list(block[1])
+            live = True
+        elif op == 'ENDIF':
+            block = blocks.pop()
+            if block[0] == 'TAKEN':
+                continue
+            other, other_live = block[2] if block[2] else (block[1], True)
+            if not live:
+                stack = list(other)
+            elif other_live:
+                # Values that differ between the branches come from here
+                here = len(code)
+                stack = [a if a == b else here for a, b in zip(stack, other)]
+            live = live or other_live
+        elif op == 'LOOP':
+            blocks.append(['LOOP', list(stack)])
+        elif op == 'ENDLOOP':
+            stack = list(blocks.pop()[1])
+            live = True
+        elif op == 'CBREAK':
+            test = stack.pop()
+            if test is not None and const_value(code[test]) == 0:
+                code[test] = None
+                continue
+        elif op == 'RET':
+            stack.pop()
+            live = False
+        elif op == 'CONTINUE':
+            live = False
+        if op == 'CALL':
+            del stack[len(stack) - arity[instr[1]]:]
+            stack.append(len(code))
+        elif op in EFFECTS_BY_NAME:
+            pops, pushes = EFFECTS_BY_NAME[op]
+            if pops:
+                del stack[-pops:]
+            if pushes:
+                stack.append(len(code))
+        code.append(instr)
+    irfunc.code[:] = [instr for instr in code if instr is not None]
+
+def constants(irmodule):
+    init = next(irfunc for irfunc in irmodule.functions if irfunc.name == '_init')
+    arity = arities(irmodule)
+    while True:
+        fold(init, arity)
+        stores = {}
+        for irfunc in irmodule.functions:
+            for instr in irfunc.code:
+                if instr[0] == 'GLOBAL_SET':
+                    stores[instr[1]] = stores.get(instr[1], 0) + 1
+        found = {}
+        read = set()
+        nesting = 0
+        for pc, instr in enumerate(init.code):
+            op = instr[0]
+            if op == 'CALL':
+                break
+            elif op == 'IF' or op == 'LOOP':
+                nesting += 1
+            elif op == 'ENDIF' or op == 'ENDLOOP':
+                nesting -= 1
+            elif op == 'GLOBAL_GET':
+                read.add(instr[1])
+            elif op == 'GLOBAL_SET':
+                name = instr[1]
+                if (nesting == 0 and stores[name] == 1 and name not in read and pc
+                        and const_value(init.code[pc - 1]) is not None):
+                    found[name] = init.code[pc - 1]
+        if not found:
+            return
+        for irfunc in irmodule.functions:
+            code = []
+            for instr in irfunc.code:
+                if instr[0] == 'GLOBAL_GET' and instr[1] in found:
+                    code.append(found[instr[1]])
+                elif instr[0] == 'GLOBAL_SET' and instr[1] in found:
+                    code.pop()
+                else:
+                    code.append(instr)
+            irfunc.code[:] = code
+
+def main(args):
+    from wabbit.passes import main as passes_main
+    passes_main(['-O2', *args])
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
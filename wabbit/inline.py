@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+# inline.py
+#
+# Inlining of small functions (see passes.py for how passes are run).
+# A CALL is replaced by a copy of the callee's code, with the callee's
+# locals renamed to locals of the caller (callee.name, so f's x becomes
+# f.x).  The arguments are already on the stack, where the callee's
+# first instructions pop them into its parameters.
+#
+# A callee whose only RET is its last instruction is copied without
+# it, leaving the value it returns on the stack:
+#
+#     CALL square                 LOCAL_SET square.x
+#                          ->     LOCAL_GET square.x
+#                                 LOCAL_GET square.x
+#                                 MULI
+#
+# Otherwise the copy goes in a LOOP that is never repeated, so that
+# each RET can turn into a jump to its end (the merge point): the value
+# goes into a local and a CBREAK leaves.  A RET inside one of the
+# callee's own loops also sets a flag, which is tested after each of
+# those loops to leave the next one out:
+#
+#     CONSTI 0                    (only with RETs inside loops)
+#     LOCAL_SET f.%done
+#     LOOP
+#         ...    LOCAL_SET f.%ret; CONSTI 1; LOCAL_SET f.%done; CONSTI 1; CBREAK
+#         ...    ENDLOOP; LOCAL_GET f.%done; CBREAK
+#     ENDLOOP
+#     LOCAL_GET f.%ret
+#
+# Locals the callee may read before it sets them are set to zero first,
+# as a call would find them.
+#
+# Which calls are inlined:
+#
+#   - never one to the caller itself or to a function that can call the
+#     caller back (anything in the same cycle of the call graph), so
+#     recursion is left alone
+#   - calls to functions of up to SMALL instructions
+#   - inside a loop (see cfg.loops()), where a call is paid for on every
+#     iteration, calls to functions of up to HOT instructions
+#   - the only call to a function, if it has up to ONCE instructions
+#
+# and only until the caller has grown to MAX_CALLER instructions.
+# Functions are done callees first, so what is inlined may already have
+# had its own calls inlined.  The callee's own code is kept (other
+# functions may call it, and main is called from outside).
+
+import sys
+
+from wabbit.bytecode import EFFECTS_BY_NAME
+from wabbit.cfg import cfg, loops
+from wabbit.fold import arities
+
+SMALL = 12
+HOT = 80
+ONCE = 200
+MAX_CALLER = 5000
+
+def call_graph(irmodule):
+    # The functions each function calls
+    return {irfunc.name: {instr[1] for instr in irfunc.code if instr[0] == 'CALL'}
+            for irfunc in irmodule.functions}
+
+def cycles(graph):
+    # The strongly connected components of graph (Tarjan), callees
+    # before their callers
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, edges = work[-1]
+            for succ in edges:
+                if succ not in graph:
+                    # An import
+                    continue
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+class Shape:
+    # How the code of a callee can be copied, or None if it cannot (see
+    # shape())
+    __slots__ = ('body', 'straight', 'loops', 'unset')
+
+    def __init__(self, body, straight, loops, unset):
+        # The code after the instructions popping the arguments
+        self.body = body
+        # Whether its only RET is its last instruction
+        self.straight = straight
+        # Positions in body of the LOOPs with a RET inside
+        self.loops = loops
+        # The locals it may read before setting them
+        self.unset = unset
+
+def shape(irfunc, arity):
+    # The code must start by popping the arguments into the parameters,
+    # and the stack must hold just the value at each RET and be empty
+    # at each LOOP (as the IR generator makes it).  None otherwise.
+    params = list(irfunc.params)
+    prologue = [('LOCAL_SET', name) for name in reversed(params)]
+    code = irfunc.code
+    if code[:len(params)] != prologue:
+        return None
+    body = code[len(params):]
+    depth = 0
+    blocks = []
+    open_loops = []
+    returning = set()
+    for pc, instr in enumerate(body):
+        op = instr[0]
+        if op == 'CALL':
+            pops, pushes = arity[instr[1]], 1
+        elif op in EFFECTS_BY_NAME:
+            pops, pushes = EFFECTS_BY_NAME[op]
+        elif op == 'RET' or op == 'IF' or op == 'CBREAK':
+            pops, pushes = 1, 0
+        else:
+            pops, pushes = 0, 0
+        if op == 'RET' and depth != 1 and depth is not None:
+            return None
+        if depth is not None:
+            depth += pushes - pops
+        if op == 'IF':
+            blocks.append([depth, None])
+        elif op == 'LOOP':
+            if depth != 0 and depth is not None:
+                return None
+            open_loops.append(pc)
+            blocks.append([depth, None])
+        elif op == 'ELSE':
+            blocks[-1][1] = depth if depth is not None else 'dead'
+            depth = blocks[-1][0]
+        elif op == 'ENDIF':
+            entry, consequence = blocks.pop()
+            if consequence is None:
+                consequence = entry
+            if depth is None and consequence != 'dead':
+                depth = consequence
+        elif op == 'ENDLOOP':
+            depth = blocks.pop()[0]
+            open_loops.pop()
+        elif op == 'RET':
+            returning.update(open_loops)
+            depth = None
+        elif op == 'CONTINUE':
+            depth = None
+    returns = sum(1 for instr in body if instr[0] == 'RET')
+    straight = returns == 1 and body[-1][0] == 'RET'
+    # Locals set at the top level before anything reads them need no
+    # zeroing
+    initialized = set(params)
+    for instr in body:
+        op = instr[0]
+        if op == 'LOCAL_SET':
+            initialized.add(instr[1])
+        elif op == 'LOCAL_GET' and instr[1] not in initialized:
+            break
+        elif op in ('IF', 'LOOP', 'RET'):
+            break
+    return Shape(body, straight, returning, set(irfunc.locals) - initialized)
+
+def expand(caller, callee, shape):
+    # The code replacing a CALL to callee in caller
+    prefix = callee.name + '.'
+    renamed = {}
+    for name, irtype in callee.locals.items():
+        renamed[name] = prefix + name
+        caller.locals[prefix + name] = irtype
+    params = list(callee.params)
+    code = [('LOCAL_SET', renamed[name]) for name in reversed(params)]
+    for name in sorted(shape.unset):
+        code += [(f'CONST{callee.locals[name]}', '0'), ('LOCAL_SET', renamed[name])]
+
+    def rename(instr):
+        if instr[0] == 'LOCAL_GET' or instr[0] == 'LOCAL_SET':
+            return (instr[0], renamed[instr[1]])
+        return instr
+
+    if shape.straight:
+        code += [rename(instr) for instr in shape.body[:-1]]
+        return code
+    result = prefix + '%ret'
+    done = prefix + '%done'
+    caller.locals[result] = callee.return_type
+    if shape.loops:
+        caller.locals[done] = 'I'
+        code += [('CONSTI', '0'), ('LOCAL_SET', done)]
+    code.append(('LOOP',))
+    open_loops = []
+    for pc, instr in enumerate(shape.body):
+        op = instr[0]
+        if op == 'RET':
+            code.append(('LOCAL_SET', result))
+            if open_loops:
+                code += [('CONSTI', '1'), ('LOCAL_SET', done)]
+            code += [('CONSTI', '1'), ('CBREAK',)]
+            continue
+        code.append(rename(instr))
+        if op == 'LOOP':
+            open_loops.append(pc)
+        elif op == 'ENDLOOP':
+            if open_loops.pop() in shape.loops:
+                code += [('LOCAL_GET', done), ('CBREAK',)]
+    code += [('ENDLOOP',), ('LOCAL_GET', result)]
+    return code
+
+def inline(irmodule):
+    functions = {irfunc.name: irfunc for irfunc in irmodule.functions}
+    arity = arities(irmodule)
+    graph = call_graph(irmodule)
+    sites = {}
+    for irfunc in irmodule.functions:
+        for instr in irfunc.code:
+            if instr[0] == 'CALL':
+                sites[instr[1]] = sites.get(instr[1], 0) + 1
+    components = cycles(graph)
+    component_of = {name: index for index, component in enumerate(components) for name in component}
+    shapes = {}
+    for component in components:
+        for name in sorted(component):
+            caller = functions[name]
+            forest = loops(caller)
+            at = cfg(caller).block_at
+            code = []
+            for pc, instr in enumerate(caller.code):
+                callee = functions.get(instr[1]) if instr[0] == 'CALL' else None
+                if callee is None or component_of[callee.name] == component_of[name]:
+                    code.append(instr)
+                    continue
+                if callee.name not in shapes:
+                    shapes[callee.name] = shape(callee, arity)
+                form = shapes[callee.name]
+                size = len(callee.code)
+                limit = SMALL
+                if forest.innermost(at[pc]) is not None:
+                    limit = HOT
+                if sites[callee.name] == 1:
+                    limit = max(limit, ONCE)
+                if (form is None or size > limit
+                        or len(code) + len(caller.code) - pc + size > MAX_CALLER):
+                    code.append(instr)
+                    continue
+                code += expand(caller, callee, form)
+            caller.code[:] = code
+            # Its callers see the new code
+            shapes.pop(name, None)
+
+def main(args):
+    from wabbit.passes import main as passes_main
+    passes_main(['-O3', *args])
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -4,19 +4,248 @@ Interpreter Project
 ===================
 
 This is an interpreter than can run wabbit programs directly from the
-generated IR code.  
+generated IR code.
 
 To run a program use::
 
     bash % python3 -m wabbit.interp someprogram.wb
 
+Add -O1, -O2 or -O3 to optimize the IR first (see passes.py).
+
 '''
 
+# The interpreter runs the Bytecode of each IRFunction (see
+# bytecode.py).  Before anything runs, every function is prepared once
+# into two parallel lists, ops and args: operands are taken out of the
+# pools, globals, locals and callees are numbered, and each IF, ELSE,
+# CBREAK, CONTINUE and ENDLOOP gets the position it may jump to.  The
+# main loop then works on plain ints and lists only.
+#
+# Programs start in _init (the top-level code) and then call main, if
+# there is one.  Memory (see GROW, PEEK and POKE) is a bytearray with
+# little-endian 4-byte ints and 8-byte floats.
+#
+# Programs are compiled through the IR cache (see ircache.py), so a
+# program that has not changed since its last run starts right away.
+
+import sys
+import struct
+
+from wabbit.bytecode import Opcode, Bytecode
+
+# Opcode numbers as plain ints, for speed in the main loop
+(CONSTI, CONSTF, ADDI, SUBI, MULI, DIVI, ANDI, ORI, LTI, LEI, GTI, GEI, EQI, NEI,
+ ADDF, SUBF, MULF, DIVF, LTF, LEF, GTF, GEF, EQF, NEF, ITOF, FTOI,
+ PRINTI, PRINTF, PRINTB, PEEKI, PEEKF, PEEKB, POKEI, POKEF, POKEB, GROW,
+ LOCAL_GET, LOCAL_SET, GLOBAL_GET, GLOBAL_SET, CALL, RET,
+ IF, ELSE, ENDIF, LOOP, CBREAK, CONTINUE, ENDLOOP) = (int(Opcode[name]) for name in '''
+ CONSTI CONSTF ADDI SUBI MULI DIVI ANDI ORI LTI LEI GTI GEI EQI NEI
+ ADDF SUBF MULF DIVF LTF LEF GTF GEF EQF NEF ITOF FTOI
+ PRINTI PRINTF PRINTB PEEKI PEEKF PEEKB POKEI POKEF POKEB GROW
+ LOCAL_GET LOCAL_SET GLOBAL_GET GLOBAL_SET CALL RET
+ IF ELSE ENDIF LOOP CBREAK CONTINUE ENDLOOP'''.split())
+
+class InterpreterError(Exception):
+    pass
+
+class Function:
+    __slots__ = ('name', 'ops', 'args', 'nlocals')
+
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+        self.args = []
+        self.nlocals = 0
+
+class Interpreter:
+
+    def __init__(self, irmodule, out=None):
+        self.out = sys.stdout if out is None else out
+        self.memory = bytearray()
+        self.global_index = {name: index for index, name in enumerate(irmodule.globals)}
+        self.globals = [0.0 if irtype == 'F' else 0 for irtype in irmodule.globals.values()]
+        self.function_index = {irfunc.name: index for index, irfunc in enumerate(irmodule.functions)}
+        self.functions = [self.prepare(irfunc) for irfunc in irmodule.functions]
 
+    def prepare(self, irfunc):
+        func = Function(irfunc.name)
+        locals_ = {name: index for index, name in enumerate(irfunc.locals)}
+        blocks = []
+        for op, operand in Bytecode.encode(irfunc.code):
+            pc = len(func.ops)
+            arg = operand
+            if op == Opcode.GLOBAL_GET or op == Opcode.GLOBAL_SET:
+                arg = self.global_index[operand]
+            elif op == Opcode.LOCAL_GET or op == Opcode.LOCAL_SET:
+                if operand not in locals_:
+                    raise InterpreterError(f'{irfunc.name}: undefined local {operand}')
+                arg = locals_[operand]
+            elif op == Opcode.CALL:
+                if operand not in self.function_index:
+                    raise InterpreterError(f'{irfunc.name}: call to undefined function {operand}')
+                arg = self.function_index[operand]
+            elif op == Opcode.IF or op == Opcode.LOOP:
+                blocks.append([pc])
+            elif op == Opcode.ELSE:
+                blocks[-1].append(pc)
+            elif op == Opcode.CBREAK or op == Opcode.CONTINUE:
+                loop = next((block for block in reversed(blocks) if func.ops[block[0]] == LOOP), None)
+                if loop is None:
+                    raise InterpreterError(f'{irfunc.name}: {op.name} outside a loop')
+                if op == Opcode.CBREAK:
+                    loop.append(pc)
+                else:
+                    # Back to the start of the innermost loop
+                    arg = loop[0] + 1
+            elif op == Opcode.ENDIF:
+                # A false test skips to just past ELSE (or here), and
+                # the end of the consequence to just past ENDIF
+                start, *rest = blocks.pop()
+                if rest:
+                    func.args[start] = rest[0] + 1
+                    func.args[rest[0]] = pc + 1
+                else:
+                    func.args[start] = pc + 1
+            elif op == Opcode.ENDLOOP:
+                start, *breaks = blocks.pop()
+                for where in breaks:
+                    func.args[where] = pc + 1
+                arg = start + 1
+            func.ops.append(int(op))
+            func.args.append(arg)
+        func.nlocals = len(locals_)
+        return func
 
+    def run(self):
+        self.call(self.function_index['_init'], [])
+        if 'main' in self.function_index:
+            return self.call(self.function_index['main'], [])
 
+    def call(self, index, stack):
+        # Runs the function until RET and returns the value it returns,
+        # which is also left on stack.  Arguments are passed on stack.
+        func = self.functions[index]
+        ops = func.ops
+        args = func.args
+        globals_ = self.globals
+        locals_ = [0] * func.nlocals
+        memory = self.memory
+        write = self.out.write
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        while True:
+            op = ops[pc]
+            pc += 1
+            if op == GLOBAL_GET:
+                push(globals_[args[pc - 1]])
+            elif op == CONSTI or op == CONSTF:
+                push(args[pc - 1])
+            elif op == GLOBAL_SET:
+                globals_[args[pc - 1]] = pop()
+            elif op == LOCAL_GET:
+                push(locals_[args[pc - 1]])
+            elif op == LOCAL_SET:
+                locals_[args[pc - 1]] = pop()
+            elif op == ADDI or op == ADDF:
+                right = pop()
+                stack[-1] += right
+            elif op == SUBI or op == SUBF:
+                right = pop()
+                stack[-1] -= right
+            elif op == MULI or op == MULF:
+                right = pop()
+                stack[-1] *= right
+            elif op == DIVI:
+                right = pop()
+                left = pop()
+                # Truncates toward zero, as in C
+                quotient = abs(left) // abs(right)
+                push(-quotient if (left < 0) != (right < 0) else quotient)
+            elif op == DIVF:
+                right = pop()
+                stack[-1] /= right
+            elif op == LTI or op == LTF:
+                right = pop()
+                stack[-1] = 1 if stack[-1] < right else 0
+            elif op == LEI or op == LEF:
+                right = pop()
+                stack[-1] = 1 if stack[-1] <= right else 0
+            elif op == GTI or op == GTF:
+                right = pop()
+                stack[-1] = 1 if stack[-1] > right else 0
+            elif op == GEI or op == GEF:
+                right = pop()
+                stack[-1] = 1 if stack[-1] >= right else 0
+            elif op == EQI or op == EQF:
+                right = pop()
+                stack[-1] = 1 if stack[-1] == right else 0
+            elif op == NEI or op == NEF:
+                right = pop()
+                stack[-1] = 1 if stack[-1] != right else 0
+            elif op == ANDI:
+                right = pop()
+                stack[-1] &= right
+            elif op == ORI:
+                right = pop()
+                stack[-1] |= right
+            elif op == IF:
+                if not pop():
+                    pc = args[pc - 1]
+            elif op == ELSE or op == CONTINUE or op == ENDLOOP:
+                pc = args[pc - 1]
+            elif op == CBREAK:
+                if pop():
+                    pc = args[pc - 1]
+            elif op == ENDIF or op == LOOP:
+                pass
+            elif op == CALL:
+                self.call(args[pc - 1], stack)
+            elif op == RET:
+                return stack[-1]
+            elif op == ITOF:
+                stack[-1] = float(stack[-1])
+            elif op == FTOI:
+                stack[-1] = int(stack[-1])
+            elif op == PRINTI:
+                write(f'{pop()}\n')
+            elif op == PRINTF:
+                write(f'{pop():f}\n')
+            elif op == PRINTB:
+                write(chr(pop()))
+            elif op == PEEKI:
+                push(struct.unpack_from('<i', memory, pop())[0])
+            elif op == PEEKF:
+                push(struct.unpack_from('<d', memory, pop())[0])
+            elif op == PEEKB:
+                push(memory[pop()])
+            elif op == POKEI:
+                value = pop()
+                struct.pack_into('<i', memory, pop(), value)
+            elif op == POKEF:
+                value = pop()
+                struct.pack_into('<d', memory, pop(), value)
+            elif op == POKEB:
+                value = pop()
+                memory[pop()] = value & 0xff
+            elif op == GROW:
+                memory.extend(bytes(pop()))
+                push(len(memory))
+            else:
+                raise InterpreterError(f'{func.name}: bad opcode {op}')
 
+def main(args):
+    from wabbit.ircache import compile_module
+    from wabbit.passes import PassManager
+    level = 0
+    for arg in args:
+        if arg.startswith('-O'):
+            level = int(arg[2:] or 1)
+            continue
+        irmodule = compile_module(arg)
+        if irmodule is not None:
+            PassManager.level(level).run(irmodule)
+            Interpreter(irmodule).run()
 
-        
-        
-        
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# ircache.py
+#
+# On-disk cache of compiled IR, in the manner of Python's .pyc files.
+# Compiling someprogram.wb stores its IRModule in
+# __pycache__/someprogram.wbc next to it.  The next time the program is
+# compiled, the entry is used if it is still fresh, and the front end
+# does not run at all (the lexer, parser and checker are not even
+# imported).
+#
+# An entry starts with a header:
+#
+#     MAGIC                   4 bytes
+#     VERSION                 4 bytes, the entry format
+#     compiler digest        16 bytes, see compiler_digest()
+#     source digest          16 bytes, of the .wb file's contents
+#
+# followed by the module, marshalled.  The entry is stale if any header
+# field differs from what the current compiler and source give, in which
+# case the program is compiled again and the entry rewritten.  Entries
+# are read through a memory mapping and written to a temporary file that
+# replaces the old one, so a reader never sees a half-written entry.
+# Programs with errors are not cached.
+#
+#     bash % python3 -m wabbit.ircache someprogram.wb
+
+import os
+import sys
+import mmap
+import struct
+import marshal
+import hashlib
+import tempfile
+
+from wabbit.source import SourceFile
+from wabbit.irgenerator import IRModule, IRFunction
+
+MAGIC = b'WBIR'
+VERSION = 1
+
+HEADER = struct.Struct('<4sI16s16s')
+
+def digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+_compiler_digest = None
+
+def compiler_digest():
+    # Digest of the compiler's own source files, so that any change to
+    # the compiler makes every entry stale
+    global _compiler_digest
+    if _compiler_digest is None:
+        package = os.path.dirname(os.path.abspath(__file__))
+        h = hashlib.blake2b(digest_size=16)
+        for name in sorted(os.listdir(package)):
+            if name.endswith('.py'):
+                with open(os.path.join(package, name), 'rb') as f:
+                    h.update(name.encode('utf-8'))
+                    h.update(f.read())
+        _compiler_digest = h.digest()
+    return _compiler_digest
+
+def cache_path(filename, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), '__pycache__')
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(cache_dir, f'{stem}.wbc')
+
+def dumps(irmodule):
+    functions = [(irfunc.name, irfunc.return_type, irfunc.code, irfunc.params, irfunc.locals)
+                 for irfunc in irmodule.functions]
+    imports = [(irfunc.name, irfunc.return_type, irfunc.params)
+               for irfunc in irmodule.imports.values()]
+    return marshal.dumps((functions, irmodule.globals, imports))
+
+def loads(data):
+    functions, globals_, imports = marshal.loads(data)
+    irmodule = IRModule(globals=globals_)
+    irmodule.functions = [IRFunction(irmodule, *function) for function in functions]
+    for name, return_type, params in imports:
+        irmodule.imports[name] = IRFunction(irmodule, name, return_type, [], params)
+    return irmodule
+
+def load(path, source_digest):
+    # The cached IRModule in path, or None if there is none or it is stale
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, compiler, source = HEADER.unpack_from(data)
+                if (magic, version, compiler, source) != (MAGIC, VERSION, compiler_digest(), source_digest):
+                    return None
+                with memoryview(data)[HEADER.size:] as view:
+                    return loads(view)
+    except (OSError, EOFError, ValueError, TypeError):
+        # Missing, unreadable or corrupt
+        return None
+
+def store(path, source_digest, irmodule):
+    header = HEADER.pack(MAGIC, VERSION, compiler_digest(), source_digest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp = tempfile.mkstemp(suffix='.wbc', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(dumps(irmodule))
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+    except OSError:
+        # Unwritable cache: the program just gets compiled every time
+        pass
+
+def compile_module(filename, cache_dir=None, errors=None):
+    # The IRModule of the program in filename, from the cache if the
+    # entry there is fresh and compiled (and cached) otherwise.  Returns
+    # None if the program has errors; they go to errors (an ErrorSink,
+    # printing them by default).
+    with SourceFile(filename) as source:
+        source_digest = digest(source.data)
+    path = cache_path(filename, cache_dir)
+    irmodule = load(path, source_digest)
+    if irmodule is not None:
+        return irmodule
+    # A miss: run the front end
+    from wabbit.errors import ErrorSink
+    from wabbit.driver import lex_file, compile_stream
+    errors = ErrorSink() if errors is None else errors
+    with lex_file(filename) as tokens:
+        for irfunc in compile_stream(tokens, errors):
+            irmodule = irfunc.module
+    if errors or irmodule is None:
+        return None
+    store(path, source_digest, irmodule)
+    return irmodule
+
+def main(args):
+    from wabbit.driver import listing
+    for filename in args:
+        irmodule = compile_module(filename)
+        if irmodule is not None:
+            for irfunc in irmodule.functions:
+                print(listing(irfunc))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -196,6 +196,7 @@ from dataclasses import dataclass
 
 from wabbit.model import *
 from wabbit.visitor import Visitor
+from wabbit.env import GLOBAL, LOCAL
 
 @dataclass
 class IRFunction:
@@ -205,14 +206,24 @@ class IRFunction:
     code: List[tuple]
     params: Dict[str, str] = field(default_factory=dict)
     locals: Dict[str, str] = field(default_factory=dict)
+    # Analyses of the code, cached (see cfg.py)
+    analyses: Dict[str, object] = field(default_factory=dict, repr=False, compare=False)
 
 @dataclass
 class IRModule:
-    functions = List[IRFunction]
+    functions: List[IRFunction] = field(default_factory=list)
     globals: Dict[str, str] = field(default_factory=dict)
+    imports: Dict[str, IRFunction] = field(default_factory=dict)
 
 class IRGenerator(Visitor):
 
+    _irtypes = {
+        'int': 'I',
+        'bool': 'I',
+        'char': 'I',
+        'float': 'F',
+    }
+
     _binop_instructions = {
         ('+', 'int', 'int'): ('ADDI',),
         ('-', 'int', 'int'): ('SUBI',),
@@ -237,100 +248,236 @@ class IRGenerator(Visitor):
         ('<=', 'float', 'float'): ('LEF',),
         ('==', 'float', 'float'): ('EQF',),
         ('!=', 'float', 'float'): ('NEF',),
+
+        ('>', 'char', 'char'): ('GTI',),
+        ('<', 'char', 'char'): ('LTI',),
+        ('>=', 'char', 'char'): ('GEI',),
+        ('<=', 'char', 'char'): ('LEI',),
+        ('==', 'char', 'char'): ('EQI',),
+        ('!=', 'char', 'char'): ('NEI',),
+
+        ('==', 'bool', 'bool'): ('EQI',),
+        ('!=', 'bool', 'bool'): ('NEI',),
+    }
+
+    _print_instructions = {
+        'int': ('PRINTI',),
+        'bool': ('PRINTI',),
+        'char': ('PRINTB',),
+        'float': ('PRINTF',),
     }
 
+    _memory_suffixes = {
+        'int': 'I',
+        'bool': 'I',
+        'char': 'B',
+        'float': 'F',
+    }
+
+    _cast_instructions = {
+        ('int', 'float'): [('ITOF',)],
+        ('float', 'int'): [('FTOI',)],
+    }
+
+    def __init__(self):
+        self.module = IRModule()
+        # All top-level code goes into _init (see "Functions" above)
+        self.init = IRFunction(self.module, '_init', 'I', [])
+        self.module.functions.append(self.init)
+        # IR names of the variables, indexed by the slots the resolver
+        # gave them: the globals and the frame of the current function
+        self.names = ([], [])
+
     @classmethod
     def generate(cls, model):
         assert model is not None, "model=None passed to IRGenerator.generate"
         generator = cls()
-        module = IRModule()
-        main = IRFunction(module, "main", None, [], [])
-        model.accept(generator, main)
-        module.functions = [main]
-        return module
+        for irfunc in generator.generate_stream(model.stmts):
+            pass
+        return generator.module
+
+    # Generates code for top-level statements one at a time as they
+    # arrive (for example from TypeChecker.check_stream).  Each function
+    # is yielded as soon as it is complete: user functions as soon as
+    # their definition has gone by and _init, which holds the top-level
+    # code, at the end.  All of them are also collected in self.module.
+    def generate_stream(self, statements):
+        for stmt in statements:
+            self.visit(stmt, self.init)
+            if isinstance(stmt, Func):
+                yield self.module.functions[-1]
+        self.init.code += [('CONSTI', '0'), ('RET',)]
+        yield self.init
+
+    def declare(self, decl, func):
+        # Top-level variables are module globals.  Those of a function
+        # (its parameters first) are its locals, in the order of their
+        # slots.
+        slot = decl.slot
+        irname = decl.name.value
+        if slot.depth == GLOBAL:
+            variables = self.module.globals
+        else:
+            variables = func.locals
+            if irname in variables:
+                # Declared again further on: a slot of its own
+                irname = f'{irname}.{slot.index}'
+        names = self.names[slot.depth]
+        if len(names) <= slot.index:
+            names.extend([None] * (slot.index + 1 - len(names)))
+        names[slot.index] = irname
+        variables[irname] = self._irtypes[decl.type.value]
+        return irname
 
     def visit(self, block: Block, func):
-        errors = []
-        errors += [self.visit(stmt, func) for stmt in block.stmts]
-        return errors
+        for stmt in block.stmts:
+            yield stmt, func
 
     def visit(self, print: Print, func):
-        errors = []
-        errors += self.visit(print.expr, func)
-        if print.expr.type == Type('int'):
-            func.code += [('PRINTI',)]
-        elif print.expr.type  == Type('float'):
-            func.code += [('PRINTF',)]
-        return errors
+        yield print.expr, func
+        func.code += [self._print_instructions[print.expr.type.value]]
 
     def visit(self, binop: BinOp, func):
-        errors = []
-        errors += self.visit(binop.left, func)
-        errors += self.visit(binop.right, func)
+        # && and || only evaluate the right side if they have to
+        if binop.operator.value == '&&':
+            yield binop.left, func
+            func.code += [('IF',)]
+            yield binop.right, func
+            func.code += [('ELSE',), ('CONSTI', '0'), ('ENDIF',)]
+            return
+        if binop.operator.value == '||':
+            yield binop.left, func
+            func.code += [('IF',), ('CONSTI', '1'), ('ELSE',)]
+            yield binop.right, func
+            func.code += [('ENDIF',)]
+            return
+        yield binop.left, func
+        yield binop.right, func
         key = (
             binop.operator.value,
             binop.left.type.value,
             binop.right.type.value
         )
         func.code += [self._binop_instructions[key]]
-        return errors
+
+    def visit(self, unop: UnOp, func):
+        suffix = self._irtypes[unop.type.value]
+        if unop.operator.value == '-':
+            func.code += [(f'CONST{suffix}', '0')]
+            yield unop.expr, func
+            func.code += [(f'SUB{suffix}',)]
+        elif unop.operator.value == '!':
+            yield unop.expr, func
+            func.code += [('CONSTI', '0'), ('EQI',)]
+        elif unop.operator.value == '^':
+            yield unop.expr, func
+            func.code += [('GROW',)]
+        else:
+            yield unop.expr, func
 
     def visit(self, integer: Integer, func):
-        errors = []
         func.code += [('CONSTI', str(integer.value))]
-        return errors
 
     def visit(self, float: Float, func):
-        errors = []
         func.code += [('CONSTF', str(float.value))]
-        return errors
+
+    def visit(self, boolean: Boolean, func):
+        func.code += [('CONSTI', str(int(boolean.value)))]
+
+    def visit(self, char: Char, func):
+        func.code += [('CONSTI', str(ord(char.value)))]
 
     def visit(self, name: Name, func):
-        errors = []
+        irname = self.names[name.slot.depth][name.slot.index]
+        kind = 'GLOBAL' if name.slot.depth == GLOBAL else 'LOCAL'
         if getattr(name, 'lvalue', False):
-            func.code += [('GLOBAL_SET', name.value)]
+            func.code += [(f'{kind}_SET', irname)]
         else:
-            func.code += [('GLOBAL_GET', name.value)]
-        return errors
+            func.code += [(f'{kind}_GET', irname)]
 
-    def visit(self, definition: Definition, func):
-        errors = []
-        if definition.type in (Type('int'), Type('bool'), Type('char')):
-            g_irtype = 'I'
-        elif definition.type  == Type('float'):
-            g_irtype = 'F'
+    def visit(self, location: Location, func):
+        yield location.value, func
+        func.code += [(f'PEEK{self._memory_suffixes[location.type.value]}',)]
+
+    def visit(self, cast: Cast, func):
+        yield cast.expr, func
+        func.code += self._cast_instructions.get((cast.expr.type.value, cast.type.value), [])
 
-        func.module.globals[definition.name.value] = g_irtype
+    def visit(self, call: Call, func):
+        for arg in call.params:
+            yield arg, func
+        func.code += [('CALL', call.name.value)]
 
+    def visit(self, definition: Definition, func):
+        irname = self.declare(definition, func)
         if definition.value:
-            self.visit(definition.value, func)
-            func.code += [('GLOBAL_SET', definition.name.value)]
-        return errors
+            yield definition.value, func
+        else:
+            func.code += [(f'CONST{self._irtypes[definition.type.value]}', '0')]
+        func.code += [('GLOBAL_SET' if definition.slot.depth == GLOBAL else 'LOCAL_SET', irname)]
 
     def visit(self, assignment: Assignment, func):
-        errors = []
         assert assignment.name.lvalue, 'assignment.name must be lvalue'
-        errors += self.visit(assignment.expr, func)
-        errors += self.visit(assignment.name, func)
-        return errors
+        if isinstance(assignment.name, Location):
+            # The address goes on the stack before the value
+            location = assignment.name
+            yield location.value, func
+            yield assignment.expr, func
+            func.code += [(f'POKE{self._memory_suffixes[location.type.value]}',)]
+            return
+        yield assignment.expr, func
+        yield assignment.name, func
 
     def visit(self, if_: If, func):
-        errors = []
-        self.visit(if_.test, func)
+        yield if_.test, func
         func.code += [('IF',)]
-        self.visit(if_.consequence, func)
+        yield if_.consequence, func
         func.code += [('ELSE',)]
-        self.visit(if_.alternative, func)
+        yield if_.alternative, func
         func.code += [('ENDIF',)]
-        return errors
 
     def visit(self, while_: While, func):
-        errors = []
         func.code += [('LOOP',)]
         func.code += [('CONSTI', 1)]
-        self.visit(while_.test, func)
+        yield while_.test, func
         func.code += [('NEI', )]    # invert the test
         func.code += [('CBREAK',)]  # conditional break
-        self.visit(while_.block, func)
+        yield while_.block, func
         func.code += [('ENDLOOP',)]
-        return errors
+
+    def visit(self, break_: Break, func):
+        func.code += [('CONSTI', '1'), ('CBREAK',)]
+
+    def visit(self, continue_: Continue, func):
+        func.code += [('CONTINUE',)]
+
+    def visit(self, return_: Return, func):
+        yield return_.expr, func
+        func.code += [('RET',)]
+
+    def visit(self, func_: Func, func):
+        irfunc = IRFunction(
+            self.module,
+            func_.name.value,
+            self._irtypes[func_.type.value],
+            [],
+            {param.name.value: self._irtypes[param.type.value] for param in func_.params})
+        self.module.functions.append(irfunc)
+        self.names[LOCAL].clear()
+        for param in func_.params:
+            self.declare(param, irfunc)
+        # Arguments arrive on the stack, the last one on top
+        for irname in reversed(irfunc.params):
+            irfunc.code += [('LOCAL_SET', irname)]
+        yield func_.block, irfunc
+        # In case the end of the function is reachable
+        irfunc.code += [(f'CONST{irfunc.return_type}', '0'), ('RET',)]
+        self.names[LOCAL].clear()
+
+    def visit(self, import_: Import, func):
+        self.module.imports[import_.name.value] = IRFunction(
+            self.module,
+            import_.name.value,
+            self._irtypes[import_.type.value],
+            [],
+            {param.name.value: self._irtypes[param.type.value] for param in import_.params})
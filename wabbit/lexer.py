@@ -36,6 +36,12 @@ class WabbitLexer(Lexer):
             print(token)
         return tokens
 
+    # Streaming mode: tokens are yielded as soon as they are matched and
+    # nothing is printed or retained, so memory stays flat regardless of
+    # how large text is.  Use this instead of tokenize() for real input.
+    def stream(self, text):
+        yield from super().tokenize(text)
+
 #    def tokenize(self, text):
 #        tokens = []
 #        for token in super().tokenize(text):
@@ -114,6 +120,7 @@ class WabbitLexer(Lexer):
         OP_LOR      , # '||'
         OP_LNOT     , # '!'
         OP_GROW     , # '^'
+        OP_DEREF    , # '`'
 
         # Miscellaneous Symbols
         SYN_SEMI    , # ';'
@@ -125,6 +132,10 @@ class WabbitLexer(Lexer):
     }
     ignore = ' \t'
 
+    # Comments.  These come first so that '/' is not taken as OP_DIV.
+    ignore_comment = r'/\*[\s\S]*?\*/'
+    ignore_linecomment = r'//.*'
+
     # Identifiers:
     ID              = r'[a-zA-Z_][a-zA-Z0-9_]*'
 
@@ -149,24 +160,26 @@ class WabbitLexer(Lexer):
     ID['false']     = LIT_BOOL
     LIT_FLOAT       = r'\d+\.\d*|\.\d+'
     LIT_INT         = r'\d+'
-    LIT_CHAR        = r'[A-Za-z0-9]'
+    LIT_CHAR        = r"'(?:\\x[0-9a-fA-F]{2}|\\.|[^\\'])'"
 
-    # Operators:
+    # Operators.  Rules are tried in order, so two character operators
+    # must come before their one character prefixes.
+    OP_LE           = r'<='
+    OP_GE           = r'>='
+    OP_EQ           = r'=='
+    OP_NE           = r'!='
     OP_ASSIGN       = r'='
     OP_ADD          = r'\+'
     OP_SUB          = r'-'
     OP_MUL          = r'\*'
     OP_DIV          = r'/'
     OP_LT           = r'<'
-    OP_LE           = r'<='
     OP_GT           = r'>'
-    OP_GE           = r'>='
-    OP_EQ           = r'=='
-    OP_NE           = r'!='
     OP_LAND         = r'&&'
     OP_LOR          = r'\|\|'
     OP_LNOT         = r'!'
     OP_GROW         = r'\^'
+    OP_DEREF        = r'`'
 
     # OP              = r'=|\+|-|\*|/|<|<=|>|>=|==|!=|&&|\|\||!|\^'
 
@@ -187,6 +200,9 @@ class WabbitLexer(Lexer):
     def ignore_newline(self, t):
         self.lineno += t.value.count('\n')
 
+    def ignore_comment(self, t):
+        self.lineno += t.value.count('\n')
+
     def error(self, t):
         print("Illegal character '%s'" % t.value[0])
         self.index += 1
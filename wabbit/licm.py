@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+# licm.py
+#
+# Loop-invariant code motion (see passes.py for how passes are run).
+#
+# Within a loop (the code from a LOOP to its ENDLOOP, see cfg.loops()),
+# an expression is invariant if its leaves are constants and variables
+# the loop never stores to, and everything in it is pure arithmetic,
+# comparison or conversion (or a load from memory the loop never
+# changes).  Each largest such expression is computed once, just before
+# the LOOP, into a new local, and read from that local where it was:
+#
+#     LOOP                              GLOBAL_GET y
+#     ...                               ITOF
+#     GLOBAL_GET y                      CONSTF 2.0
+#     ITOF                    ->        MULF
+#     CONSTF 2.0                        LOCAL_SET %licm0
+#     MULF                              LOOP
+#     ...                               ...
+#                                       LOCAL_GET %licm0
+#                                       ...
+#
+# An expression that is just a constant or one variable is left alone:
+# reading the new local would cost as much.  The same expression found
+# twice in a loop shares one local.
+#
+# A loop stores to the locals and globals it sets, and to whatever any
+# function it calls may set (directly or through further calls, see
+# effects()).  Memory (PEEK) counts as changed if the loop pokes, grows
+# or calls a function that may.  Imported functions may do anything.
+# PRINTs, calls and stores are never moved.
+#
+# The loop may run no times at all, so an expression is only moved if
+# computing it early cannot go wrong.  Division, FTOI and memory loads
+# can fail at run time.  They are only moved from the start of the
+# loop's header block (the part of the loop test before its CBREAK,
+# which runs whenever the LOOP does), and only if nothing before them
+# there prints or calls.  Elsewhere in the loop, the same expression as
+# one moved from there uses its value.
+#
+# Loops are done outermost first, so an expression goes out of as many
+# loops as it is invariant in.
+
+import sys
+
+from wabbit.bytecode import EFFECTS_BY_NAME, reachable
+from wabbit.cfg import cfg, loops
+from wabbit.fold import arities
+
+# Pure operations that combine two values, and those on one
+_binary = frozenset(name for name, effect in EFFECTS_BY_NAME.items() if effect == (2, 1))
+_unary = frozenset(('ITOF', 'FTOI', 'PEEKI', 'PEEKF', 'PEEKB'))
+
+# Those that can fail at run time
+_trapping = frozenset(('DIVI', 'DIVF', 'FTOI', 'PEEKI', 'PEEKF', 'PEEKB'))
+
+_markers = frozenset(('IF', 'ELSE', 'ENDIF', 'LOOP', 'CBREAK', 'CONTINUE', 'ENDLOOP', 'RET'))
+
+# The IR type each operation pushes, where its name does not end in it
+_result_types = {
+    'ITOF': 'F', 'FTOI': 'I', 'PEEKB': 'I',
+    'LTF': 'I', 'LEF': 'I', 'GTF': 'I', 'GEF': 'I', 'EQF': 'I', 'NEF': 'I',
+}
+
+def result_type(irfunc, instr):
+    op = instr[0]
+    if op == 'GLOBAL_GET':
+        return irfunc.module.globals[instr[1]]
+    if op == 'LOCAL_GET':
+        return irfunc.locals[instr[1]]
+    return _result_types.get(op, op[-1])
+
+def effects(irmodule):
+    # The globals each function may store to and whether it may change
+    # memory, through the functions it calls as well
+    everything = (frozenset(irmodule.globals), True)
+    stores = {irfunc.name: everything for irfunc in irmodule.imports.values()}
+    calls = {}
+    for irfunc in irmodule.functions:
+        stored = set()
+        memory = False
+        callees = set()
+        for instr in irfunc.code:
+            op = instr[0]
+            if op == 'GLOBAL_SET':
+                stored.add(instr[1])
+            elif op == 'CALL':
+                callees.add(instr[1])
+            elif op.startswith('POKE') or op == 'GROW':
+                memory = True
+        stores[irfunc.name] = (frozenset(stored), memory)
+        calls[irfunc.name] = callees
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in calls.items():
+            stored, memory = stores[name]
+            for callee in callees:
+                stored = stored | stores[callee][0]
+                memory = memory or stores[callee][1]
+            if (stored, memory) != stores[name]:
+                stores[name] = (stored, memory)
+                changed = True
+    return stores
+
+class Expression:
+    # The code in [start, end] computes one value
+    __slots__ = ('start', 'end', 'operands', 'safe')
+
+    def __init__(self, start, end, operands=(), safe=True):
+        self.start = start
+        self.end = end
+        # The expressions it combines (none for a constant or variable)
+        self.operands = operands
+        # Whether computing it before the loop cannot fail where the
+        # loop would not
+        self.safe = safe
+
+def invariants(irfunc, loop, stores, arity):
+    # The largest invariant expressions of loop, as (start, end) pairs
+    # in code order
+    code = irfunc.code
+    graph = cfg(irfunc)
+    stored = set()
+    locals_ = set()
+    memory = False
+    for instr in code[loop.start + 1:loop.end]:
+        op = instr[0]
+        if op == 'GLOBAL_SET':
+            stored.add(instr[1])
+        elif op == 'LOCAL_SET':
+            locals_.add(instr[1])
+        elif op == 'CALL':
+            stored.update(stores[instr[1]][0])
+            memory = memory or stores[instr[1]][1]
+        elif op.startswith('POKE') or op == 'GROW':
+            memory = True
+    header = loop.header
+
+    def safe(start):
+        # Whether an expression starting at start that may fail can be
+        # computed before the loop instead
+        if graph.block_at[start] is not header:
+            return False
+        return not any(instr[0] == 'CALL' or instr[0].startswith('PRINT')
+                       for instr in code[header.start:start])
+
+    found = []
+
+    def take(entry):
+        if entry is not None and entry.operands:
+            found.append(entry)
+
+    # Invariant expressions on the stack, None for other values
+    stack = []
+    # Stack depths at the open IFs and LOOPs inside the loop:
+    # [opcode, depth at entry, depth at the end of the consequence]
+    blocks = []
+    live = True
+
+    def pop():
+        return stack.pop() if stack else None
+
+    for pc, instr in reachable(code, lambda: live, loop.start + 1, loop.end):
+        op = instr[0]
+        if op in _markers:
+            # Nothing is tracked across control flow
+            if live:
+                if op in ('IF', 'CBREAK', 'RET'):
+                    take(pop())
+                for entry in stack:
+                    take(entry)
+                stack = [None] * len(stack)
+            if op == 'IF' or op == 'LOOP':
+                blocks.append([op, len(stack), None])
+            elif op == 'ELSE':
+                blocks[-1][0] = 'ELSE'
+                blocks[-1][2] = len(stack) if live else None
+                stack = [None] * blocks[-1][1]
+                live = True
+            elif op == 'ENDIF':
+                kind, entry, consequence = blocks.pop()
+                if kind == 'IF':
+                    # No ELSE: the alternative is empty
+                    consequence = entry
+                if not live:
+                    stack = [None] * (entry if consequence is None else consequence)
+                live = live or consequence is not None
+            elif op == 'ENDLOOP':
+                stack = [None] * blocks.pop()[1]
+                live = True
+            elif op == 'CONTINUE' or op == 'RET':
+                live = False
+            continue
+        if op == 'CONSTI' or op == 'CONSTF':
+            stack.append(Expression(pc, pc))
+        elif op == 'GLOBAL_GET':
+            stack.append(Expression(pc, pc) if instr[1] not in stored else None)
+        elif op == 'LOCAL_GET':
+            stack.append(Expression(pc, pc) if instr[1] not in locals_ else None)
+        elif op in _binary:
+            right = pop()
+            left = pop()
+            if (left is not None and right is not None
+                    and right.start == left.end + 1 and pc == right.end + 1):
+                stack.append(Expression(left.start, pc, (left, right),
+                                        left.safe and right.safe and (op not in _trapping or safe(left.start))))
+            else:
+                take(left)
+                take(right)
+                stack.append(None)
+        elif op in _unary:
+            operand = pop()
+            if (operand is not None and pc == operand.end + 1
+                    and (not op.startswith('PEEK') or not memory)):
+                stack.append(Expression(operand.start, pc, (operand,),
+                                        operand.safe and (op not in _trapping or safe(operand.start))))
+            else:
+                take(operand)
+                stack.append(None)
+        else:
+            if op == 'CALL':
+                pops, pushes = arity[instr[1]], 1
+            else:
+                pops, pushes = EFFECTS_BY_NAME[op]
+            for _ in range(pops):
+                take(pop())
+            stack.extend([None] * pushes)
+    for entry in stack:
+        take(entry)
+    # One that is not safe can still use the value of the same
+    # expression computed where it is; otherwise its operands may move
+    hoisted = {tuple(code[entry.start:entry.end + 1]) for entry in found if entry.safe}
+    result = []
+    while found:
+        entry = found.pop()
+        if entry.safe or tuple(code[entry.start:entry.end + 1]) in hoisted:
+            result.append((entry.start, entry.end))
+        else:
+            found.extend(operand for operand in entry.operands if operand.operands)
+    result.sort()
+    return result
+
+def hoist(irfunc, loop, found):
+    # Rewrites the code to compute the expressions found before loop
+    code = irfunc.code
+    names = {}
+    before = []
+    replaced = {}
+    for start, end in found:
+        expression = tuple(code[start:end + 1])
+        name = names.get(expression)
+        if name is None:
+            number = len(irfunc.locals)
+            while f'%licm{number}' in irfunc.locals:
+                number += 1
+            name = names[expression] = f'%licm{number}'
+            irfunc.locals[name] = result_type(irfunc, code[end])
+            before += [*expression, ('LOCAL_SET', name)]
+        replaced[start] = (end, name)
+    new = code[:loop.start] + before
+    pc = loop.start
+    while pc < len(code):
+        if pc in replaced:
+            end, name = replaced[pc]
+            new.append(('LOCAL_GET', name))
+            pc = end + 1
+        else:
+            new.append(code[pc])
+            pc += 1
+    irfunc.code[:] = new
+
+def licm(irmodule):
+    stores = effects(irmodule)
+    arity = arities(irmodule)
+    for irfunc in irmodule.functions:
+        index = 0
+        # Hoisting only adds code before a LOOP, so the loops keep their
+        # order (outer ones first) while the code changes under them
+        while index < len(loops(irfunc).loops):
+            loop = loops(irfunc).loops[index]
+            found = invariants(irfunc, loop, stores, arity)
+            if found:
+                hoist(irfunc, loop, found)
+            index += 1
+
+def main(args):
+    from wabbit.passes import main as passes_main
+    passes_main(['-O2', *args])
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
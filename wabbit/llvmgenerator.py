@@ -6,36 +6,75 @@
 
 # Create LLVM from IRModule (from the intermediate code stage)
 # Convert stack machine to LLVM.
+#
+# Every IRFunction becomes an LLVM function with the signature of its
+# parameters and return type.  Its locals (parameters included) are
+# allocas at the top of the entry block, set to zero there, which LLVM's
+# mem2reg pass turns into registers; the arguments are pushed on the
+# stack at entry, where the function's first instructions pop them into
+# their locals.  Globals are LLVM globals.
+#
+# The stack only exists at generation time: it holds the LLVM values of
+# the entries.  Where control flow meets (after ENDIF, at the top of a
+# loop and after it) the entries that differ between the paths become
+# phis.  Code after a RET, CONTINUE or a loop that is never left cannot
+# run and is not generated.
+#
+# The Wabbit program's main is renamed _wabbit_main and _init (the
+# top-level code) _wabbit_init, which keeps it clear of the C runtime's
+# own _init in crti.o.  The module gets a C main that runs _wabbit_init
+# and then _wabbit_main.  Printing
+# and memory (_memory and _grow) are in the runtime, print.c:
+#
+#     bash % python3 -m wabbit.llvmgenerator someprogram.wb > someprogram.ll
+#     bash % clang print.c someprogram.ll -o someprogram
+
+import sys
 
 from llvmlite.ir import (
     Module, Function, FunctionType, IntType, DoubleType, VoidType,
     Constant, IRBuilder, GlobalVariable
     )
 
+from wabbit.bytecode import Bytecode, dispatch_table, reachable
+
 from leatherman.dbg import dbg
 
 # Create LLVM versions of the low-level datatypes used in IR code
 int_type = IntType(32)
 float_type = DoubleType()
+byte_type = IntType(8)
 void_type = VoidType()
 
-#def generate_llvm(irmodule):
-#    gen = LLVMGenerator()
-#    for irfunc in irmodule.functions:
-#        gen.generate_function(irfunc)
-#    return gen.module
+_llvm_types = {
+    'I': int_type,
+    'F': float_type,
+}
+
+# Symbol names for IR functions that would clash with C
+_symbols = {
+    'main': '_wabbit_main',
+    '_init': '_wabbit_init',
+}
 
 class IfBlock:
-    def __init__(self, func):
+    def __init__(self, func, stack):
         self.consequence = func.append_basic_block()
         self.alternative = func.append_basic_block()
         self.merge = func.append_basic_block()
+        # The stack at the start of each branch
+        self.stack = stack
+        # (block, stack) at the end of each branch that reaches merge
+        self.states = []
 
 class WhileBlock:
-    def __init__(self, func):
+    def __init__(self, func, stack):
         self.loop_test = func.append_basic_block()
-        self.loop_body = func.append_basic_block()
         self.loop_exit = func.append_basic_block()
+        # The stack at the top of the loop (phis, if it is not empty)
+        self.stack = stack
+        # (block, stack) at each CBREAK
+        self.states = []
 
 class LLVMGenerator:
 
@@ -44,6 +83,8 @@ class LLVMGenerator:
         self.blockstack = []
         self.module = Module()      # The LLVM module
         self.globals = {}
+        self.functions = {}         # LLVM function of each IR function and import, by IR name
+        self.locals = {}            # alloca of each local of the current function
 
         # Declare external functions needed for runtime functionality such as printing.
         # This code must be implemented in C and linked with the final LLVM output.
@@ -57,26 +98,34 @@ class LLVMGenerator:
             FunctionType(void_type, [float_type]),
             name="_print_float")
 
+        self._print_byte = Function(
+            self.module,
+            FunctionType(void_type, [int_type]),
+            name="_print_byte")
+
+        # Memory: grows by the given number of bytes and returns the new size
+        self._grow = Function(
+            self.module,
+            FunctionType(int_type, [int_type]),
+            name="_grow")
+
+        self._memory = GlobalVariable(self.module, byte_type.as_pointer(), "_memory")
+
     @classmethod
     def generate(cls, irmodule):
         generator = cls()
         for name, g_irtype in irmodule.globals.items():
             generator.define_global(name, g_irtype)
+        # Declare everything first, so calls can go either way
+        for irfunc in irmodule.imports.values():
+            generator.declare_function(irfunc, irfunc.name)
+        for irfunc in irmodule.functions:
+            generator.declare_function(irfunc, _symbols.get(irfunc.name, irfunc.name))
         for irfunc in irmodule.functions:
             generator.generate_function(irfunc)
+        generator.generate_main()
         return generator.module
 
-#    def __init__(self):
-#        self.stack = []
-#        self.module = Module()      # The LLVM module
-#
-#        # Declare external functions needed for runtime functionality such as printing.
-#        # This code must be implemented in C and linked with the final LLVM output.
-#        self._print_int = Function(self.module,
-#                                    FunctionType(void_type, [int_type]),
-#                                    name="_print_int")
-
-
     def define_global(self, name, g_irtype):
         assert g_irtype in ('I', 'F'), 'define_global requires I or F'
         if g_irtype == 'I':
@@ -89,19 +138,48 @@ class LLVMGenerator:
         self.globals[name] = GlobalVariable(self.module, g_llvmtype, name)
         self.globals[name].initializer = initializer
 
+    def declare_function(self, irfunc, name):
+        functype = FunctionType(_llvm_types[irfunc.return_type],
+                                [_llvm_types[irtype] for irtype in irfunc.params.values()])
+        self.functions[irfunc.name] = Function(self.module, functype, name=name)
+
+    def generate_main(self):
+        # int main() { _wabbit_init(); return _wabbit_main(); }
+        func = Function(self.module, FunctionType(int_type, []), name='main')
+        builder = IRBuilder(func.append_basic_block('entry'))
+        builder.call(self.functions['_init'], [])
+        main = self.functions.get('main')
+        if main is not None and not main.args and main.ftype.return_type == int_type:
+            builder.ret(builder.call(main, []))
+        else:
+            if main is not None:
+                builder.call(main, [])
+            builder.ret(Constant(int_type, 0))
 
     def generate_function(self, irfunc):
         # Make LLVM code for an IRFunction
-        # From exercise (follow the template). Fill in details.
-        # Note: Need to fix function signatures later (for model5 and upwards)
-        self.func = Function(self.module, FunctionType(int_type, []), name=irfunc.name)
+        self.func = self.functions[irfunc.name]
         block = self.func.append_basic_block('entry')
         self.builder = IRBuilder(block)
-        for op, *opargs in irfunc.code:
-            getattr(self, f'gen_{op}')(*opargs)
-
-        # Function assumes an "int" return. Fake it.
-        self.builder.ret(Constant(int_type, 0))
+        self.locals = {name: self.builder.alloca(_llvm_types[irtype], name=name)
+                       for name, irtype in irfunc.locals.items()}
+        for name, irtype in irfunc.locals.items():
+            self.builder.store(Constant(_llvm_types[irtype], 0), self.locals[name])
+        self.stack = list(self.func.args)
+        self.blockstack = []
+        self.live = True
+        handlers = self._handlers
+        for pc, (op, operand) in reachable(Bytecode.encode(irfunc.code), lambda: self.live):
+            handler = handlers[op]
+            if handler is None:
+                raise NotImplementedError(f'{self.__class__.__name__} cannot generate {op.name}')
+            if operand is None:
+                handler(self)
+            else:
+                handler(self, operand)
+        if self.live:
+            # The IR generator ends every function with a RET
+            self.builder.unreachable()
 
     def push(self, item):
         self.stack.append(item)
@@ -114,6 +192,29 @@ class LLVMGenerator:
         left = self.pop()
         return left, right
 
+    def merge(self, states):
+        # The stack where the paths of states (block, stack) meet, at
+        # the start of the current block
+        stack = []
+        for values in zip(*(stack for block, stack in states)):
+            if all(value is values[0] for value in values):
+                stack.append(values[0])
+            else:
+                phi = self.builder.phi(values[0].type)
+                for (block, _), value in zip(states, values):
+                    phi.add_incoming(value, block)
+                stack.append(phi)
+        return stack
+
+    def test(self):
+        # The value on top of the stack as an i1
+        return self.builder.icmp_signed('!=', self.pop(), Constant(int_type, 0))
+
+    def address(self, pointee):
+        # Pointer to the memory address on top of the stack
+        pointer = self.builder.gep(self.builder.load(self._memory), [self.pop()])
+        return self.builder.bitcast(pointer, pointee.as_pointer())
+
     def gen_CONSTI(self, value):
         self.push(Constant(int_type, value))
 
@@ -129,6 +230,12 @@ class LLVMGenerator:
     def gen_DIVI(self):
         self.push(self.builder.sdiv(*self.pop_left_right()))
 
+    def gen_ANDI(self):
+        self.push(self.builder.and_(*self.pop_left_right()))
+
+    def gen_ORI(self):
+        self.push(self.builder.or_(*self.pop_left_right()))
+
     def gen_GTI(self):
         result = self.builder.icmp_signed('>', *self.pop_left_right())
         self.push(self.builder.zext(result, int_type))
@@ -173,70 +280,176 @@ class LLVMGenerator:
         self.push(self.builder.fdiv(*self.pop_left_right()))
 
     def gen_GTF(self):
-        result = self.buildler.fcmp_ordered('>', *self.pop_left_right())
-        self.push(self.builder.zext(result, float_type))
+        result = self.builder.fcmp_ordered('>', *self.pop_left_right())
+        self.push(self.builder.zext(result, int_type))
 
     def gen_LTF(self):
-        result = self.buildler.fcmp_ordered('<', *self.pop_left_right())
-        self.push(self.builder.zext(result, float_type))
+        result = self.builder.fcmp_ordered('<', *self.pop_left_right())
+        self.push(self.builder.zext(result, int_type))
 
     def gen_GEF(self):
-        result = self.buildler.fcmp_ordered('>=', *self.pop_left_right())
-        self.push(self.builder.zext(result, float_type))
+        result = self.builder.fcmp_ordered('>=', *self.pop_left_right())
+        self.push(self.builder.zext(result, int_type))
 
     def gen_LEF(self):
-        result = self.buildler.fcmp_ordered('<=', *self.pop_left_right())
-        self.push(self.builder.zext(result, float_type))
+        result = self.builder.fcmp_ordered('<=', *self.pop_left_right())
+        self.push(self.builder.zext(result, int_type))
 
     def gen_EQF(self):
-        result = self.buildler.fcmp_ordered('==', *self.pop_left_right())
-        self.push(self.builder.zext(result, float_type))
+        result = self.builder.fcmp_ordered('==', *self.pop_left_right())
+        self.push(self.builder.zext(result, int_type))
 
     def gen_NEF(self):
-        result = self.buildler.fcmp_ordered('!=', *self.pop_left_right())
-        self.push(self.builder.zext(result, float_type))
+        # True if either side is a NaN, as in the interpreter
+        result = self.builder.fcmp_unordered('!=', *self.pop_left_right())
+        self.push(self.builder.zext(result, int_type))
 
     def gen_PRINTF(self):
         self.builder.call(self._print_float, [self.pop()])
 
+    def gen_ITOF(self):
+        self.push(self.builder.sitofp(self.pop(), float_type))
+
+    def gen_FTOI(self):
+        self.push(self.builder.fptosi(self.pop(), int_type))
+
+    def gen_PRINTB(self):
+        self.builder.call(self._print_byte, [self.pop()])
+
+    def gen_PEEKI(self):
+        self.push(self.builder.load(self.address(int_type), align=1))
+
+    def gen_PEEKF(self):
+        self.push(self.builder.load(self.address(float_type), align=1))
+
+    def gen_PEEKB(self):
+        self.push(self.builder.zext(self.builder.load(self.address(byte_type)), int_type))
+
+    def gen_POKEI(self):
+        value = self.pop()
+        self.builder.store(value, self.address(int_type), align=1)
+
+    def gen_POKEF(self):
+        value = self.pop()
+        self.builder.store(value, self.address(float_type), align=1)
+
+    def gen_POKEB(self):
+        value = self.builder.trunc(self.pop(), byte_type)
+        self.builder.store(value, self.address(byte_type))
+
+    def gen_GROW(self):
+        self.push(self.builder.call(self._grow, [self.pop()]))
+
+    def gen_LOCAL_GET(self, name):
+        self.push(self.builder.load(self.locals[name]))
+
+    def gen_LOCAL_SET(self, name):
+        self.builder.store(self.pop(), self.locals[name])
+
     def gen_GLOBAL_GET(self, name):
         self.push(self.builder.load(self.globals[name]))
 
     def gen_GLOBAL_SET(self, name):
         self.builder.store(self.pop(), self.globals[name])
 
+    def gen_CALL(self, name):
+        func = self.functions[name]
+        args = self.stack[len(self.stack) - len(func.args):]
+        del self.stack[len(self.stack) - len(func.args):]
+        self.push(self.builder.call(func, args))
+
+    def gen_RET(self):
+        self.builder.ret(self.pop())
+        self.live = False
+
     def gen_IF(self):
-        block = IfBlock(self.func)
-        self.builder.cbranch(self.builder.trunc(self.pop(), IntType(1)),
-            block.consequence,
-            block.alternative)
+        test = self.test()
+        block = IfBlock(self.func, list(self.stack))
+        self.builder.cbranch(test, block.consequence, block.alternative)
         self.blockstack.append(block)
         self.builder.position_at_end(block.consequence)
 
     def gen_ELSE(self):
         block = self.blockstack[-1]
-        self.builder.branch(block.merge)
+        if self.live:
+            block.states.append((self.builder.block, self.stack))
+            self.builder.branch(block.merge)
+        self.stack = list(block.stack)
+        self.live = True
         self.builder.position_at_end(block.alternative)
 
     def gen_ENDIF(self):
         block = self.blockstack.pop()
-        self.builder.branch(block.merge)
+        if self.live:
+            block.states.append((self.builder.block, self.stack))
+            self.builder.branch(block.merge)
         self.builder.position_at_end(block.merge)
+        if block.states:
+            self.stack = self.merge(block.states)
+            self.live = True
+        else:
+            # Both branches returned
+            self.live = False
+            self.builder.unreachable()
 
     def gen_LOOP(self):
-        block = WhileBlock(self.func)
+        entry = self.builder.block
+        block = WhileBlock(self.func, [])
         self.builder.branch(block.loop_test)
         self.builder.position_at_end(block.loop_test)
+        for value in self.stack:
+            phi = self.builder.phi(value.type)
+            phi.add_incoming(value, entry)
+            block.stack.append(phi)
+        self.stack = list(block.stack)
         self.blockstack.append(block)
 
+    def loop(self):
+        # The innermost loop
+        return next(block for block in reversed(self.blockstack) if isinstance(block, WhileBlock))
+
+    def gen_CONTINUE(self):
+        block = self.loop()
+        for phi, value in zip(block.stack, self.stack):
+            phi.add_incoming(value, self.builder.block)
+        self.builder.branch(block.loop_test)
+        self.live = False
+
     def gen_ENDLOOP(self):
+        if self.live:
+            self.gen_CONTINUE()
         block = self.blockstack.pop()
-        self.builder.branch(block.loop_test)
         self.builder.position_at_end(block.loop_exit)
+        if block.states:
+            self.stack = self.merge(block.states)
+            self.live = True
+        else:
+            # The loop is never left
+            self.builder.unreachable()
 
     def gen_CBREAK(self):
-        block = self.blockstack[-1]
-        self.builder.cbranch(self.builder.trunc(self.pop(), IntType(1)),
-                             block.loop_exit,
-                             block.loop_body)
-        self.builder.position_at_end(block.loop_body)
+        block = self.loop()
+        test = self.test()
+        block.states.append((self.builder.block, list(self.stack)))
+        rest = self.func.append_basic_block()
+        self.builder.cbranch(test, block.loop_exit, rest)
+        self.builder.position_at_end(rest)
+
+# The gen_ method for each opcode, by number
+LLVMGenerator._handlers = dispatch_table(LLVMGenerator, 'gen_')
+
+def main(args):
+    from wabbit.ircache import compile_module
+    from wabbit.passes import PassManager
+    level = 0
+    for arg in args:
+        if arg.startswith('-O'):
+            level = int(arg[2:] or 1)
+            continue
+        irmodule = compile_module(arg)
+        if irmodule is not None:
+            PassManager.level(level).run(irmodule)
+            print(LLVMGenerator.generate(irmodule))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -12,144 +12,193 @@ NL = '\n'
 def printf(expr):
     sys.stdout.write(expr)
 
-@dataclass
 class Type:
-    value: str
-
-@dataclass
+    # Types are interned: Type('int') always returns the same object, so
+    # types are compared with "is".  The primitive types are also
+    # available as Type.int, Type.float, Type.bool, Type.char and
+    # Type.undef.
+    __slots__ = ('value',)
+    _interned = {}
+
+    def __new__(cls, value):
+        type = cls._interned.get(value)
+        if type is None:
+            type = cls._interned[value] = super().__new__(cls)
+            type.value = value
+        return type
+
+    def __reduce__(self):
+        # Unpickling interns again
+        return (Type, (self.value,))
+
+    def __repr__(self):
+        return f'Type(value={self.value!r})'
+
+Type.int = Type('int')
+Type.float = Type('float')
+Type.bool = Type('bool')
+Type.char = Type('char')
+Type.undef = Type('undef')
+
+# Attributes the resolver and checker fill in.  They are declared (so
+# that nodes can use __slots__) but are not constructor arguments and
+# do not take part in comparisons or repr.
+def annotation(default=None):
+    return field(default=default, init=False, repr=False, compare=False)
+
+@dataclass(slots=True)
 class Node:
     def accept(self, visitor: Visitor, *args, **kwargs):
         return visitor.visit(self, *args, **kwargs)
 
-@dataclass
+@dataclass(slots=True)
 class Expression(Node):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Statement(Node):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Block(Node):
     stmts: List[Statement] = field(default_factory=list)
 
-@dataclass
+@dataclass(slots=True)
 class Prog(Block):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Literal(Expression):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Integer(Literal):
     value: int
-    type: Type = Type('int')
+    type: Type = Type.int
 
-@dataclass
+@dataclass(slots=True)
 class Float(Literal):
     value: float
-    type: Type = Type('float')
+    type: Type = Type.float
 
-@dataclass
+@dataclass(slots=True)
 class Boolean(Literal):
     value: bool
-    type: Type = Type('bool')
+    type: Type = Type.bool
 
-@dataclass
+@dataclass(slots=True)
 class Char(Literal):
     value: str
-    type: Type = Type('char')
+    type: Type = Type.char
 
-@dataclass
+@dataclass(slots=True)
 class Undef(Expression):
-    type: Type = Type('undef')
+    type: Type = Type.undef
     value: Expression = None
 
     def __bool__(self):
         return False
 
-@dataclass
+@dataclass(slots=True)
 class Name(Expression):
     value: str
+    type: Type = annotation()
+    mutable: bool = annotation(False)
+    lvalue: bool = annotation(False)
+    slot: Any = annotation()
+    decl: Any = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Definition(Statement):
     name: Name
     type: Type
-    value: Expression = Undef()
+    value: Expression = field(default_factory=Undef)
     mutable: bool = True
+    slot: Any = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class BinOp(Expression):
     operator: Name
     left: Expression
     right: Expression
+    type: Type = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class UnOp(Expression):
     operator: Name
     expr: Expression
+    type: Type = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Location(Node):
     value: int
+    type: Type = annotation()
+    mutable: bool = annotation(False)
+    lvalue: bool = annotation(False)
 
-@dataclass
+@dataclass(slots=True)
 class Assignment(Statement):
     name: Name
     expr: Expression
 
-@dataclass
+@dataclass(slots=True)
 class Cast(Expression):
     expr: Expression
+    type: Type = None
 
-@dataclass
+@dataclass(slots=True)
 class Print(Statement):
     expr: Expression
 
-@dataclass
+@dataclass(slots=True)
 class If(Statement):
     test: Expression
     consequence: Block
     alternative: Block
 
-@dataclass
+@dataclass(slots=True)
 class While(Statement):
     test: Expression
     block: Block
 
-@dataclass
+@dataclass(slots=True)
 class Break(Statement):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Continue(Statement):
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Return(Statement):
     expr: Expression
 
-@dataclass
+@dataclass(slots=True)
 class Parameter(Node):
     name: Name
     type: Type
-    value: Expression = Undef()
+    value: Expression = field(default_factory=Undef)
+    mutable: bool = True
+    slot: Any = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Func(Statement):
     name: Name
     params: [Parameter]
     type: Type
     block: Block
+    slot: Any = annotation()
+    frame: list = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Import(Statement):
     name: Name
     params: [Parameter]
+    type: Type = None
+    slot: Any = annotation()
 
-@dataclass
+@dataclass(slots=True)
 class Call(Expression):
     name: Name
     params: [Expression]
+    type: Type = annotation()
@@ -18,435 +18,453 @@
 # Names in all-caps are assumed to be tokens from the tokenize.py file.
 # EOF is "End of File".
 #
-# program <- statement* EOF
+# The grammar is PEG_GRAMMAR below.  PEGParser runs it with a parser
+# generated from it by pegen.py (cached on disk); PACKRAT runs the same
+# grammar directly with the packrat engine in peg.py.  WabbitParser is
+# an older, operator precedence (Pratt) parser that only handles
+# expressions and print.
 #
-# statement <- assignment
-#           /  vardecl
-#           /  funcdel
-#           /  if_stmt
-#           /  while_stmt
-#           /  break_stmt
-#           /  continue_stmt
-#           /  return_stmt
-#           /  print_stmt
-#
-# assignment <- location '=' expression ';'
-#
-# vardecl <- ('var'/'const') ID type? ('=' expression)? ';'
-#
-# funcdecl <- 'import'? 'func' ID '(' parameters ')' type '{' statement* '}'
-#
-# if_stmt <- 'if' expression '{' statement* '}'
-#         /  'if' expression '{' statement* '}' else '{' statement* '}'
-#
-# while_stmt <- 'while' expression '{' statement* '}'
-#
-# break_stmt <- 'break' ';'
-#
-# continue_stmt <- 'continue' ';'
-#
-# return_stmt <- 'return' expression ';'
-#
-# print_stmt <- 'print' expression ';'
-#
-# parameters <- ID type (',' ID type)*
-#            /  empty
-#
-# type <- 'int' / 'float' / 'char' / 'bool'
-#
-# location <- ID
-#          /  '`' expression
-#
-# expression <- orterm ('||' orterm)*
-#
-# orterm <- andterm ('&&' andterm)*
-#
-# andterm <- relterm (('<' / '>' / '<=' / '>=' / '==' / '!=') reltime)*
-#
-# relterm <- addterm (('+' / '-') addterm)*
-#
-# addterm <- factor (('*' / '/') factor)*
-#
-# factor <- literal
-#        / ('+' / '-' / '^') expression
-#        / '(' expression ')'
-#        / type '(' expression ')'
-#        / ID '(' arguments ')'
-#        / location
-#
-# arguments <- expression (',' expression)*
-#          / empty
-#
-# literal <- INTEGER / FLOAT / CHAR / bool
-#
-# bool <- 'true' / 'false'
-
 # see http://effbot.org/zone/simple-top-down-parsing.htm
 
 import re
 import sys
+import codecs
 
-from multimethod import multimeta
+from sly.lex import Token
 
-from wabbit.symbol import Symbol
+from wabbit.symbol import Symbol, SymbolTable, Grammar
+from wabbit.peg import Grammar as PEG, Packrat
+from wabbit import pegen
+from wabbit.tokenbuffer import TokenBuffer
 from wabbit.model import *
 from leatherman.dbg import dbg
 
-#class WabbitParser(metaclass=multimeta):
-class WabbitParser:
-
-    def symbolize(self, tokens):
-        for token in tokens:
-            symbol_class = Symbol.Table[token]
-            s = symbol_class(self, token)
-            yield s
-
-    def parse(self, tokens=None):
-        self.symbols = list(self.symbolize(list(tokens) if tokens else self.tokens))
-        for symbol in self.symbols:
-            print(symbol)
-        return self.program()
+PEG_GRAMMAR = r'''
+program <- statement* EOF
 
-#    def __repr__(self):
-#        fields = ', '.join([
-#            f'tokens={self.tokens}',
-#            f'index={self.index}',
-#        ])
-#        return f'{self.__class__.__name__}({fields})'
+statement <- assignment
+          /  vardecl
+          /  funcdecl
+          /  if_stmt
+          /  while_stmt
+          /  break_stmt
+          /  continue_stmt
+          /  return_stmt
+          /  print_stmt
 
-    def __init__(self, tokens=None):
-        self.tokens = list(tokens) if tokens else []
-        self.symbols = []
-        self.index = 0
+assignment <- location '=' expression ';'
 
-        symbol = self.symbol
-        infix = self.infix
-        infix_r = self.infix_r
-        prefix = self.prefix
-        method = self.method
-        constant = self.constant
+vardecl <- ('var' / 'const') ID type? ('=' expression)? ';'
 
-        symbol('const')
-        symbol('var')
-        symbol('int')
-        symbol('float')
+funcdecl <- import_decl / func_decl
 
-        # python expression syntax
-        symbol('print', 10)
+import_decl <- 'import' 'func' ID '(' parameters ')' type ';'
 
-        #symbol("lambda", 20)
-        symbol("if", 20); symbol("else") # ternary form
-        symbol('while', 20)
+func_decl <- 'func' ID '(' parameters ')' type '{' statement* '}'
 
-        #infix_r("or", 30); infix_r("and", 40); prefix("not", 50)
+if_stmt <- 'if' expression '{' statement* '}' ('else' '{' statement* '}')?
 
-        #infix("in", 60); infix("not", 60) # not in
-        #infix("is", 60);
-        infix("<", 60); infix("<=", 60)
-        infix(">", 60); infix(">=", 60)
-        infix("<>", 60); infix("!=", 60); infix("==", 60)
+while_stmt <- 'while' expression '{' statement* '}'
 
-        infix("|", 70); infix("^", 80); infix("&", 90)
+break_stmt <- 'break' ';'
 
-        infix("<<", 100); infix(">>", 100)
+continue_stmt <- 'continue' ';'
 
-        infix("+", 110); infix("-", 110)
+return_stmt <- 'return' expression ';'
 
-        infix("*", 120); infix("/", 120); infix("//", 120)
-        infix("%", 120)
+print_stmt <- 'print' expression ';'
 
-        prefix("-", 130); prefix("+", 130); prefix("~", 130)
+parameters <- (parameter (',' parameter)*)?
 
-        infix_r("**", 140)
+parameter <- ID type
 
-        symbol(".", 150); symbol("[", 150); symbol("(", 150)
+type <- 'int' / 'float' / 'char' / 'bool'
 
-        symbol(';')
+location <- name / deref
 
-        # additional behaviour
+name <- ID
 
-        #symbol("(name)").nud = lambda self: self
-        #symbol("(literal)").nud = lambda self: self
-        symbol('ID').nud = lambda self: Name(self.value)
-        symbol('LIT_INT').nud = lambda self: Integer(self.value)
-        symbol('LIT_BOOL').nud = lambda self: Boolean(self.value)
-        symbol('LIT_FLOAT').nud = lambda self: Float(self.value)
+deref <- '`' factor
 
-        @method(symbol('LIT'))
-        def nud(self):
-            if self.token.type == 'LIT_INT':
-                return Integer(self.token.value)
-            elif self.token.type == 'LIT_BOOL':
-                return Boolean(self.token.value)
-            elif self.token.type == 'LIT_FLOAT':
-                return Float(self.token.value)
-            raise SyntaxError('unknown literal')
+expression <- orterm ('||' orterm)*
 
-        #symbol("(end)")
-        symbol('EOF')
+orterm <- andterm ('&&' andterm)*
 
-        symbol(")")
+andterm <- relterm (('<' / '>' / '<=' / '>=' / '==' / '!=') relterm)*
 
-        @method(symbol("("))
-        def nud(self):
-            # parenthesized form; replaced by tuple former below
-            expr = self.parser.expression()
-            #advance(")")
-            self.parser.consume(')')
-            return expr
-
-        symbol("else")
+relterm <- addterm (('+' / '-') addterm)*
 
-        @method(symbol("if"))
-        def led(self, left):
-            self.fst = left
-            self.snd = self.parser.expression()
-            #advance("else")
-            self.parser.consume('else')
-            self.trd = self.parser.expression()
-            return self
-
-        @method(symbol("."))
-        def led(self, left):
-            #if token.id != "(name)":
-            curr = self.parser.look_ahead()
-            if curr.type != 'ID':
-                SyntaxError("Expected an attribute ID.")
-            self.fst = left
-            self.snd = curr
-            #advance()
-            self.parser.consume()
-            return self
-
-        symbol("]")
-
-        @method(symbol("["))
-        def led(self, left):
-            self.fst = left
-            self.snd = self.parser.expression()
-            self.parser.consume(']')
-            return self
-
-        symbol(")"); symbol(",")
-
-        @method(symbol("("))
-        def led(self, left):
-            self.fst = left
-            self.snd = []
-            #if token.id != ")":
-            if not self.parser.is_look_ahead(')'):
-                while 1:
-                    self.snd.append(self.parser.expression())
-                    #if token.id != ",":
-                    if not self.parser.is_look_ahead(','):
-                        break
-                    #advance(",")
-                    self.parser.consume(',')
-            #advance(")")
-            self.parser.consume(')')
-            return self
+addterm <- factor (('*' / '/') factor)*
 
-        symbol(":"); symbol("=")
+factor <- literal
+       /  unary
+       /  group
+       /  cast
+       /  call
+       /  location
 
-        # constants
+unary <- ('+' / '-' / '^' / '!') factor
 
-        constant("None")
-        constant("True")
-        constant("False")
+group <- '(' expression ')'
 
-        # multitoken operators
+cast <- type '(' expression ')'
 
-        @method(symbol("not"))
-        def led(self, left):
-            #if token.id != "in":
-            if not self.parser.is_look_ahead('in'):
-                raise SyntaxError("Invalid syntax")
-            #advance()
-            self.parser.consume()
-            self.type = "not in"
-            self.fst = left
-            self.snd = self.parser.expression(60)
-            return self
+call <- ID '(' arguments ')'
 
-        @method(symbol("is"))
-        def led(self, left):
-            if self.parser.look_ahead() == 'not':
-                #advance()
-                self.parser.consume()
-                self.type = "is not"
-            self.fst = left
-            self.snd = self.parser.expression(60)
-            return self
+arguments <- (expression (',' expression)*)?
 
-        # displays
+literal <- integer / float / char / bool
 
-        @method(symbol("("))
-        def nud(self):
-            self.fst = []
-            comma = False
-            #if token.id != ")":
-            if not self.parser.is_look_ahead(')'):
-                while 1:
-                    #if token.id == ")":
-                    if self.parser.look_ahead(')'):
-                        break
-                    self.fst.append(self.parser.expression())
-                    #if token.id != ",":
-                    if not self.parser.look_ahead(','):
-                        break
-                    comma = True
-                    #advance(",")
-                    self.parser.consume(',')
-            #advance(")")
-            self.parser.consume(')')
-            if not self.fst or comma:
-                return self # tuple
-            else:
-                return self.fst[0]
-
-        symbol("]")
-
-        @method(symbol("["))
-        def nud(self):
-            self.fst = []
-            #if token.id != "]":
-            if not self.parser.is_look_ahead(']'):
-                while 1:
-                    #if token.id == "]":
-                    if self.parser.is_look_ahead(']'):
-                        break
-                    self.fst.append(self.parser.expression())
-                    #if token.id != ",":
-                    if not self.parser.is_look_ahead(','):
-                        break
-                    #advance(",")
-                    self.parser.consume(',')
-            #advance("]")
-            self.parser.consume(']')
-            return self
+integer <- INTEGER
 
-        symbol("}")
+float <- FLOAT
 
-        @method(symbol("{"))
-        def nud(self):
-            self.fst = []
-            #if token.id != "}":
-            if not self.parser.is_look_ahead('}'):
-                while 1:
-                    #if token.id == "}":
-                    if self.parser.is_look_ahead('}'):
-                        break
-                    self.fst.append(self.parser.expression())
-                    #advance(":")
-                    self.parser.conume(':')
-                    self.fst.append(self.parser.expression())
-                    #if token.id != ",":
-                    if not self.parser.is_look_ahead(','):
-                        break
-                    #advance(",")
-                    self.parser.consume(',')
-            #advance("}")
-            self.parser.consume('}')
-            return self
+char <- CHAR
 
-#    def look_ahead(self, *types, distance=1):
-#        assert distance > 0, f'distance={distance} must be > 0'
-#        index = self.index
-#        token =  None
-#        while distance:
-#            token = self.tokens[index]
-#            distance -= 1
-#            index += 1
-#        distance = index - self.index
-#        if types:
-#            if Symbol.Table.make_key(token) in types:
-#                return True
-#            return False
-#        return token
+bool <- 'true' / 'false'
+'''
 
-    def look_ahead(self, *types, distance=1):
-        assert distance > 0, f'distance={distance} must be > 0'
-        index = self.index
-        symbol = None
-        while distance:
-            symbol = self.symbols[index]
-            distance -= 1
-            index += 1
-        distance = index - self.index
-        if types:
-            if symbol.type in types:
-                return True
-            return False
-        return symbol
+# The symbol classes (binding powers and nud/led/std methods) are built
+# once, when this module is imported, and frozen into GRAMMAR.  Parsers
+# only hold per-parse state (symbols and position), so creating one is
+# cheap and any number of them can run at once in different threads.
 
-    def consume(self, *types, distance=1):
-        result = self.look_ahead(*types, distance)
-        dbg(index=self.index)
-        assert result, f'cannot consume! types={types}, distance={distance}'
-        self.index += distance
-        return self.symbols[self.index-1]
+def _build_grammar():
+    table = SymbolTable()
 
-    def symbol(self, key, bp=0):
+    def symbol(key, bp=0):
         try:
-            symbol_class = Symbol.Table[key]
+            symbol_class = table[key]
         except KeyError:
-            parser = self
-            def __init__(self):
-                Symbol.__init__(
-                    self,
-                    parser,
-                    token,
-                )
-            symbol_class = type(f'Symbol {key}', (Symbol,), {
-                #'__init__': lambda self, parser, token: Symbol.__init__(self, parser, token)
-            })
-            Symbol.Table[key] = symbol_class
-            symbol_class.lbp = bp
+            symbol_class = Symbol.subclass(key, bp)
+            table[key] = symbol_class
         else:
             symbol_class.lbp = max(bp, symbol_class.lbp)
         return symbol_class
 
-    def infix(self, type, bp):
+    def infix(type, bp):
         def led(self, left):
-            return BinOp(type, left, self.parse.expression(bp))
-        self.symbol(type, bp).led = led
+            return BinOp(Name(type), left, self.parser.expression(bp))
+        symbol(type, bp).led = led
 
-    def infix_r(self, type, bp):
+    def infix_r(type, bp):
         def led(self, left):
-            return BinOp(type, left, self.parser.expression(bp-1))
-        self.symbol(type, bp).led = led
+            return BinOp(Name(type), left, self.parser.expression(bp-1))
+        symbol(type, bp).led = led
 
-    def prefix(self, type, bp):
+    def prefix(type, bp):
         def nud(self):
-            return UnOp(type, self.parser.expression(bp))
-        self.symbol(type).nud = nud
+            return UnOp(Name(type), self.parser.expression(bp))
+        symbol(type).nud = nud
 
-    def method(self, s):
+    def method(s):
         assert issubclass(s, Symbol)
         def bind(func):
             setattr(s, func.__name__, func)
         return bind
 
-    def constant(self, type):
-        @self.method(self.symbol(type))
+    def constant(type):
+        @method(symbol(type))
         def nud(self):
             self.type = 'LITERAL'
             self.value = type
             return self
 
+    symbol('const')
+    symbol('var')
+    symbol('int')
+    symbol('float')
+
+    # python expression syntax
+    symbol('print', 10)
+
+    #symbol("lambda", 20)
+    symbol("if", 20); symbol("else") # ternary form
+    symbol('while', 20)
+
+    #infix_r("or", 30); infix_r("and", 40); prefix("not", 50)
+
+    #infix("in", 60); infix("not", 60) # not in
+    #infix("is", 60);
+    infix("<", 60); infix("<=", 60)
+    infix(">", 60); infix(">=", 60)
+    infix("<>", 60); infix("!=", 60); infix("==", 60)
+
+    infix("|", 70); infix("^", 80); infix("&", 90)
+
+    infix("<<", 100); infix(">>", 100)
+
+    infix("+", 110); infix("-", 110)
+
+    infix("*", 120); infix("/", 120); infix("//", 120)
+    infix("%", 120)
+
+    prefix("-", 130); prefix("+", 130); prefix("~", 130)
+
+    infix_r("**", 140)
+
+    symbol(".", 150); symbol("[", 150); symbol("(", 150)
+
+    symbol(';')
+
+    # additional behaviour
+
+    #symbol("(name)").nud = lambda self: self
+    #symbol("(literal)").nud = lambda self: self
+    symbol('ID').nud = lambda self: Name(self.token.value)
+
+    @method(symbol('LIT'))
+    def nud(self):
+        if self.token.type == 'LIT_INT':
+            return Integer(int(self.token.value))
+        elif self.token.type == 'LIT_BOOL':
+            return Boolean(self.token.value == 'true')
+        elif self.token.type == 'LIT_FLOAT':
+            return Float(float(self.token.value))
+        raise SyntaxError('unknown literal')
+
+    @method(symbol('print'))
+    def std(self):
+        return Print(self.parser.expression())
+
+    #symbol("(end)")
+    symbol('EOF')
+
+    symbol(")")
+
+    @method(symbol("("))
+    def nud(self):
+        # parenthesized form; replaced by tuple former below
+        expr = self.parser.expression()
+        #advance(")")
+        self.parser.consume(')')
+        return expr
+
+    symbol("else")
+
+    @method(symbol("if"))
+    def led(self, left):
+        self.fst = left
+        self.snd = self.parser.expression()
+        #advance("else")
+        self.parser.consume('else')
+        self.trd = self.parser.expression()
+        return self
+
+    @method(symbol("."))
+    def led(self, left):
+        #if token.id != "(name)":
+        curr = self.parser.look_ahead()
+        if curr.type != 'ID':
+            SyntaxError("Expected an attribute ID.")
+        self.fst = left
+        self.snd = curr
+        #advance()
+        self.parser.consume()
+        return self
+
+    symbol("]")
+
+    @method(symbol("["))
+    def led(self, left):
+        self.fst = left
+        self.snd = self.parser.expression()
+        self.parser.consume(']')
+        return self
+
+    symbol(")"); symbol(",")
+
+    @method(symbol("("))
+    def led(self, left):
+        self.fst = left
+        self.snd = []
+        #if token.id != ")":
+        if not self.parser.is_look_ahead(')'):
+            while 1:
+                self.snd.append(self.parser.expression())
+                #if token.id != ",":
+                if not self.parser.is_look_ahead(','):
+                    break
+                #advance(",")
+                self.parser.consume(',')
+        #advance(")")
+        self.parser.consume(')')
+        return self
+
+    symbol(":"); symbol("=")
+
+    # constants
+
+    constant("None")
+    constant("True")
+    constant("False")
+
+    # multitoken operators
+
+    @method(symbol("not"))
+    def led(self, left):
+        #if token.id != "in":
+        if not self.parser.is_look_ahead('in'):
+            raise SyntaxError("Invalid syntax")
+        #advance()
+        self.parser.consume()
+        self.type = "not in"
+        self.fst = left
+        self.snd = self.parser.expression(60)
+        return self
+
+    @method(symbol("is"))
+    def led(self, left):
+        if self.parser.look_ahead() == 'not':
+            #advance()
+            self.parser.consume()
+            self.type = "is not"
+        self.fst = left
+        self.snd = self.parser.expression(60)
+        return self
+
+    # displays
+
+    @method(symbol("("))
+    def nud(self):
+        self.fst = []
+        comma = False
+        #if token.id != ")":
+        if not self.parser.is_look_ahead(')'):
+            while 1:
+                #if token.id == ")":
+                if self.parser.look_ahead(')'):
+                    break
+                self.fst.append(self.parser.expression())
+                #if token.id != ",":
+                if not self.parser.look_ahead(','):
+                    break
+                comma = True
+                #advance(",")
+                self.parser.consume(',')
+        #advance(")")
+        self.parser.consume(')')
+        if not self.fst or comma:
+            return self # tuple
+        else:
+            return self.fst[0]
+
+    symbol("]")
+
+    @method(symbol("["))
+    def nud(self):
+        self.fst = []
+        #if token.id != "]":
+        if not self.parser.is_look_ahead(']'):
+            while 1:
+                #if token.id == "]":
+                if self.parser.is_look_ahead(']'):
+                    break
+                self.fst.append(self.parser.expression())
+                #if token.id != ",":
+                if not self.parser.is_look_ahead(','):
+                    break
+                #advance(",")
+                self.parser.consume(',')
+        #advance("]")
+        self.parser.consume(']')
+        return self
+
+    symbol("}")
+
+    @method(symbol("{"))
+    def nud(self):
+        self.fst = []
+        #if token.id != "}":
+        if not self.parser.is_look_ahead('}'):
+            while 1:
+                #if token.id == "}":
+                if self.parser.is_look_ahead('}'):
+                    break
+                self.fst.append(self.parser.expression())
+                #advance(":")
+                self.parser.consume(':')
+                self.fst.append(self.parser.expression())
+                #if token.id != ",":
+                if not self.parser.is_look_ahead(','):
+                    break
+                #advance(",")
+                self.parser.consume(',')
+        #advance("}")
+        self.parser.consume('}')
+        return self
+
+    return Grammar(table)
+
+GRAMMAR = _build_grammar()
+
+def _eof():
+    eof = Token()
+    eof.type = 'EOF'
+    eof.value = 'eof'
+    eof.lineno = -1
+    eof.index = -1
+    eof.end = -1
+    return eof
+
+#class WabbitParser(metaclass=multimeta):
+class WabbitParser:
+
+    def __init__(self, tokens=None, grammar=GRAMMAR):
+        self.grammar = grammar
+        self.tokens = tokens if tokens is not None else []
+        self.symbols = []
+        self.index = 0
+
+    def symbolize(self, tokens):
+        table = self.grammar
+        for token in tokens:
+            symbol_class = table[token]
+            s = symbol_class(self, token)
+            yield s
+        yield table['EOF'](self, _eof())
+
+    # tokens may be any sequence of sly Tokens, including a TokenBuffer,
+    # which is consumed in place rather than copied into a list first.
+    def parse(self, tokens=None):
+        self.symbols = list(self.symbolize(tokens if tokens is not None else self.tokens))
+        self.index = 0
+        return self.program()
+
+#    def __repr__(self):
+#        fields = ', '.join([
+#            f'tokens={self.tokens}',
+#            f'index={self.index}',
+#        ])
+#        return f'{self.__class__.__name__}({fields})'
+
+    def look_ahead(self, *types, distance=1):
+        assert distance > 0, f'distance={distance} must be > 0'
+        symbol = self.symbols[min(self.index + distance, len(self.symbols)) - 1]
+        if types:
+            return symbol.id in types
+        return symbol
+
+    def is_look_ahead(self, *types, distance=1):
+        return self.look_ahead(*types, distance=distance)
+
+    def consume(self, *types, distance=1):
+        if types and not self.look_ahead(*types, distance=distance):
+            raise SyntaxError(f'expected {" or ".join(types)}, got {self.look_ahead(distance=distance).token}')
+        self.index += distance
+        return self.symbols[self.index-1]
+
     def expression(self, rbp=0):
         curr_symbol = self.consume()
-        if curr_symbol.nud:
-            self.index -= 1
-            return None
-        left = curr_symbol.nud(curr_symbol.type)
+        if not curr_symbol.nud:
+            raise SyntaxError(f'unexpected {curr_symbol.token}')
+        left = curr_symbol.nud()
         next_symbol = self.look_ahead()
         while rbp < next_symbol.lbp:
             curr_symbol = self.consume()
-            if curr_symbol.led:
-                self.index -= 1
-                return None
-            left = curr_symbol.led(left, curr_symbol.type)
+            if not curr_symbol.led:
+                raise SyntaxError(f'unexpected {curr_symbol.token}')
+            left = curr_symbol.led(left)
             next_symbol = self.look_ahead()
         return left
 
@@ -454,23 +472,129 @@ class WabbitParser:
         next_symbol = self.look_ahead()
         if next_symbol.std != None:
             self.consume()
-            return next_symbol.std()
-        return self.expression()
+            stmt = next_symbol.std()
+        else:
+            stmt = self.expression()
+        self.consume(';')
+        return stmt
 
     def statements(self):
         statements = []
-        statement = self.statement()
-        while statement:
-            statements += [statement]
-            statement = self.statement() if self.consume('EOF') else None
+        while not self.look_ahead('EOF'):
+            statements += [self.statement()]
         return statements
 
     def program(self):
-        stms = self.statements()
+        stmts = self.statements()
         return Prog(stmts)
 
+# Building the model from PEG_GRAMMAR.  Each action receives the value
+# matched by the rule of the same name (see peg.py for how values are
+# shaped) and returns a model node.
+
+# Token names in PEG_GRAMMAR that differ from the lexer's
+PEG_TOKENS = {
+    'INTEGER': 'LIT_INT',
+    'FLOAT': 'LIT_FLOAT',
+    'CHAR': 'LIT_CHAR',
+}
+
+def _vardecl(value):
+    keyword, name, type, init, _ = value
+    return Definition(
+        Name(name),
+        type or Type('undef'),
+        init[1] if init else Undef(),
+        mutable=keyword == 'var')
+
+def _listing(value):
+    if value is None:
+        return []
+    first, rest = value
+    return [first] + [item for _, item in rest]
+
+def _binops(value):
+    left, rest = value
+    for operator, right in rest:
+        left = BinOp(Name(operator), left, right)
+    return left
+
+def _unary(value):
+    operator, expr = value
+    if operator in '+-' and isinstance(expr, (Integer, Float)):
+        return expr.__class__(-expr.value if operator == '-' else expr.value)
+    return UnOp(Name(operator), expr)
+
+def _char(value):
+    return Char(codecs.decode(value[1:-1], 'unicode_escape'))
+
+peg_actions = {
+    'program':          lambda v: Prog(v[0]),
+    'assignment':       lambda v: Assignment(v[0], v[2]),
+    'vardecl':          _vardecl,
+    'import_decl':      lambda v: Import(Name(v[2]), v[4], v[6]),
+    'func_decl':        lambda v: Func(Name(v[1]), v[3], v[5], Block(v[7])),
+    'if_stmt':          lambda v: If(v[1], Block(v[3]), Block(v[5][2] if v[5] else [])),
+    'while_stmt':       lambda v: While(v[1], Block(v[3])),
+    'break_stmt':       lambda v: Break(),
+    'continue_stmt':    lambda v: Continue(),
+    'return_stmt':      lambda v: Return(v[1]),
+    'print_stmt':       lambda v: Print(v[1]),
+    'parameters':       _listing,
+    'parameter':        lambda v: Parameter(Name(v[0]), v[1]),
+    'type':             Type,
+    'name':             Name,
+    'deref':            lambda v: Location(v[1]),
+    'expression':       _binops,
+    'orterm':           _binops,
+    'andterm':          _binops,
+    'relterm':          _binops,
+    'addterm':          _binops,
+    'unary':            _unary,
+    'group':            lambda v: v[1],
+    'cast':             lambda v: Cast(v[2], v[0]),
+    'call':             lambda v: Call(Name(v[0]), v[2]),
+    'arguments':        _listing,
+    'integer':          lambda v: Integer(int(v)),
+    'float':            lambda v: Float(float(v)),
+    'char':             _char,
+    'bool':             lambda v: Boolean(v == 'true'),
+}
+
+PACKRAT = Packrat(PEG(PEG_GRAMMAR, PEG_TOKENS), peg_actions)
+
+_generated = None
+
+def generated_parser():
+    # The pegen parser for PEG_GRAMMAR, loaded on first use
+    global _generated
+    if _generated is None:
+        module = pegen.load(PACKRAT.grammar)
+        _generated = pegen.GeneratedParser(module, peg_actions)
+    return _generated
+
+class PEGParser:
+    # Parses whole programs with PEG_GRAMMAR.  engine is anything with a
+    # parse(source) method: the generated parser by default, or PACKRAT.
+    # Engines are shared; each parse has its own memo table, so parsers
+    # can run concurrently.
+
+    def __init__(self, engine=None):
+        self.engine = engine or generated_parser()
+
+    # source may be text (str or bytes) or a TokenBuffer
+    def parse(self, source):
+        return self.engine.parse(source)
+
+    # Yields the top-level statements of source one at a time, each as
+    # soon as it has been parsed, without building the whole Prog
+    def statements(self, source):
+        return self.engine.stream(source, 'statement')
+
 def main(args):
-    dbg(args)
+    for filename in args:
+        with TokenBuffer.map(filename) as tokens:
+            print(PEGParser().parse(tokens))
 
 if __name__ == '__main__':
     main(sys.argv[1:])
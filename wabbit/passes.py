@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+# passes.py
+#
+# IR optimization passes and the pass manager that runs them.  A pass
+# rewrites the IR of a module in place, between the IR generator and a
+# backend:
+#
+#     irmodule = compile_module(filename)
+#     PassManager.level(2).run(irmodule)
+#     Interpreter(irmodule).run()
+#
+# FunctionPass wraps a function f(irfunc) that rewrites one IRFunction
+# and runs it over every function of the module; ModulePass wraps one
+# that takes the whole IRModule (for work across functions).  The
+# passes for each optimization level, -O0 to -O3, are listed in LEVELS.
+# New optimizations are added there.
+#
+# With debug set, the manager verifies the IR (see verify()) before the
+# first pass and after each one, so a pass that breaks the IR is caught
+# right where it did so.  For every pass it records the wall time and
+# the number of instructions before and after (see report()).
+#
+#     bash % python3 -m wabbit.passes -O2 -g someprogram.wb
+
+import sys
+import time
+
+from wabbit.bytecode import Opcode, OPERANDS, NONE, EFFECTS, reachable
+from wabbit.fold import fold_module, constants
+from wabbit.licm import licm
+from wabbit.inline import inline
+
+class VerifyError(Exception):
+    pass
+
+class FunctionPass:
+    __slots__ = ('name', 'function')
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def run(self, irmodule):
+        for irfunc in irmodule.functions:
+            self.function(irfunc)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r})'
+
+class ModulePass(FunctionPass):
+
+    def run(self, irmodule):
+        self.function(irmodule)
+
+class PassStats:
+    __slots__ = ('name', 'seconds', 'before', 'after')
+
+    def __init__(self, name, seconds, before, after):
+        self.name = name
+        self.seconds = seconds
+        self.before = before
+        self.after = after
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.name!r}, seconds={self.seconds:.6f}, before={self.before}, after={self.after})'
+
+def instructions(irmodule):
+    return sum(len(irfunc.code) for irfunc in irmodule.functions)
+
+class PassManager:
+
+    def __init__(self, passes=(), debug=False):
+        self.passes = list(passes)
+        self.debug = debug
+        self.stats = []
+
+    @classmethod
+    def level(cls, level, debug=False):
+        return cls(LEVELS[level], debug)
+
+    def run(self, irmodule):
+        if self.debug:
+            verify(irmodule, 'IR generator')
+        for pass_ in self.passes:
+            before = instructions(irmodule)
+            start = time.perf_counter()
+            pass_.run(irmodule)
+            seconds = time.perf_counter() - start
+            self.stats.append(PassStats(pass_.name, seconds, before, instructions(irmodule)))
+            if self.debug:
+                verify(irmodule, pass_.name)
+        return irmodule
+
+    def report(self, out=None):
+        out = sys.stderr if out is None else out
+        for stats in self.stats:
+            delta = stats.after - stats.before
+            print(f'{stats.name:<20} {stats.seconds * 1000:10.3f} ms {stats.before:>10} -> {stats.after:<10} instrs ({delta:+})', file=out)
+
+# ----------------------------------------------------------------------
+# Verification
+#
+# Checks that the code of every function is well formed: known opcodes
+# with the right operands, properly nested IF/ELSE/ENDIF and
+# LOOP/ENDLOOP with CBREAK and CONTINUE only inside a loop, defined
+# globals and callees, and a stack of the same depth wherever control
+# flow meets.  The code must not be able to run off the end of the
+# function.
+
+def verify(irmodule, after='IR generator'):
+    callees = {irfunc.name: len(irfunc.params) for irfunc in irmodule.imports.values()}
+    callees.update((irfunc.name, len(irfunc.params)) for irfunc in irmodule.functions)
+    for irfunc in irmodule.functions:
+        try:
+            verify_function(irfunc, irmodule.globals, callees)
+        except VerifyError as err:
+            raise VerifyError(f'after {after}: {irfunc.name}: {err}') from None
+
+def verify_function(irfunc, globals_, callees):
+    # depth is the stack depth, or None where the code is unreachable.
+    # Each open IF and LOOP has an entry in blocks: [opcode, depth at
+    # entry, depth at the end of the consequence].  The arguments are on
+    # the stack at the start.
+    depth = len(irfunc.params)
+    blocks = []
+    for pc, instr in enumerate(irfunc.code):
+        where = f'{pc}: {" ".join(str(part) for part in instr)}'
+        op = Opcode.__members__.get(instr[0])
+        if op is None:
+            raise VerifyError(f'{where}: unknown opcode')
+        if len(instr) != (1 if OPERANDS[op] == NONE else 2):
+            raise VerifyError(f'{where}: wrong number of operands')
+        if op == Opcode.GLOBAL_GET or op == Opcode.GLOBAL_SET:
+            if instr[1] not in globals_:
+                raise VerifyError(f'{where}: undefined global')
+        elif op == Opcode.LOCAL_GET or op == Opcode.LOCAL_SET:
+            if instr[1] not in irfunc.locals:
+                raise VerifyError(f'{where}: undefined local')
+        if op in EFFECTS:
+            pops, pushes = EFFECTS[op]
+        elif op == Opcode.CALL:
+            if instr[1] not in callees:
+                raise VerifyError(f'{where}: call to undefined function')
+            pops, pushes = callees[instr[1]], 1
+        elif op == Opcode.RET or op == Opcode.IF or op == Opcode.CBREAK:
+            pops, pushes = 1, 0
+        else:
+            pops, pushes = 0, 0
+        if depth is not None:
+            if depth < pops:
+                raise VerifyError(f'{where}: stack underflow')
+            depth += pushes - pops
+        if op == Opcode.IF or op == Opcode.LOOP:
+            blocks.append([op, depth, None])
+        elif op == Opcode.ELSE:
+            if not blocks or blocks[-1][0] != Opcode.IF:
+                raise VerifyError(f'{where}: ELSE outside IF')
+            blocks[-1][0] = Opcode.ELSE
+            blocks[-1][2] = depth
+            depth = blocks[-1][1]
+        elif op == Opcode.ENDIF:
+            if not blocks or blocks[-1][0] not in (Opcode.IF, Opcode.ELSE):
+                raise VerifyError(f'{where}: ENDIF outside IF')
+            kind, entry, consequence = blocks.pop()
+            if kind == Opcode.IF:
+                # No ELSE: the alternative is empty
+                consequence = entry
+            if depth is None:
+                depth = consequence
+            elif consequence is not None and consequence != depth:
+                raise VerifyError(f'{where}: stack depth {consequence} after the consequence, {depth} after the alternative')
+        elif op in (Opcode.CBREAK, Opcode.CONTINUE, Opcode.ENDLOOP):
+            loop = next((block for block in reversed(blocks) if block[0] == Opcode.LOOP), None)
+            if loop is None:
+                raise VerifyError(f'{where}: {op.name} outside LOOP')
+            if depth is not None and loop[1] is not None and depth != loop[1]:
+                raise VerifyError(f'{where}: stack depth {depth}, {loop[1]} at LOOP')
+            if op == Opcode.ENDLOOP:
+                if blocks[-1] is not loop:
+                    raise VerifyError(f'{where}: ENDLOOP closes an IF')
+                blocks.pop()
+                # Only a CBREAK leaves a loop; assume one is reachable
+                depth = loop[1]
+            elif op == Opcode.CONTINUE:
+                depth = None
+        elif op == Opcode.RET:
+            depth = None
+    if blocks:
+        raise VerifyError(f'{blocks[-1][0].name} not closed')
+    if depth is not None:
+        raise VerifyError('control reaches the end of the function without RET')
+
+# ----------------------------------------------------------------------
+# Unreachable code
+#
+# Drops the instructions that follow a RET or CONTINUE up to the end of
+# the enclosing block (the ELSE, ENDIF or ENDLOOP that closes it), or of
+# the function.  Every function ends with a default return that is
+# unreachable whenever its body returns on the way out (see
+# IRGenerator.visit(Func)).
+
+def unreachable(irfunc):
+    code = []
+
+    def falls_through():
+        return code[-1][0] not in ('RET', 'CONTINUE')
+
+    for pc, instr in reachable(irfunc.code, falls_through):
+        code.append(instr)
+    irfunc.code[:] = code
+
+# ----------------------------------------------------------------------
+# Optimization levels
+
+# Each level runs the passes of the one below it and possibly more
+
+LEVELS = {
+    0: [],
+    1: [ModulePass('fold', fold_module),
+        FunctionPass('unreachable', unreachable)],
+    2: [ModulePass('constants', constants),
+        ModulePass('fold', fold_module),
+        FunctionPass('unreachable', unreachable),
+        ModulePass('licm', licm)],
+    3: [ModulePass('constants', constants),
+        ModulePass('fold', fold_module),
+        FunctionPass('unreachable', unreachable),
+        ModulePass('inline', inline),
+        ModulePass('licm', licm)],
+}
+
+def main(args):
+    from wabbit.ircache import compile_module
+    from wabbit.driver import listing
+    level = 0
+    debug = False
+    filenames = []
+    for arg in args:
+        if arg.startswith('-O'):
+            level = int(arg[2:] or 1)
+        elif arg == '-g':
+            debug = True
+        else:
+            filenames.append(arg)
+    for filename in filenames:
+        irmodule = compile_module(filename)
+        if irmodule is None:
+            continue
+        manager = PassManager.level(level, debug)
+        manager.run(irmodule)
+        for irfunc in irmodule.functions:
+            print(listing(irfunc))
+        manager.report()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
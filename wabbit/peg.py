@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+# peg.py
+#
+# A packrat PEG (Parsing Expression Grammar) engine.
+#
+# Grammar reads rules written in the PEG syntax documented at the top
+# of parser.py:
+#
+#     name <- e1 e2 / ( e3 / e4 )* e5? e6+
+#
+# and Packrat runs them over a TokenBuffer.  The terminals are:
+#
+#    'quoted'   : a token whose text is the quoted text
+#    NAME       : a token of kind NAME (names in all-caps)
+#    EOF        : the end of the input (matches without consuming)
+#
+# Quoted terminals are resolved to a token kind when the grammar is
+# compiled, so matching one is a single integer comparison against the
+# buffer's kind array (plus a text comparison for identifiers such as
+# 'char' that the lexer does not treat as keywords).
+#
+# Every rule application is memoized by (position, rule), so no rule is
+# ever tried twice at the same position and backtracking stays linear.
+# The memo is bounded: it holds entries for at most `capacity` token
+# positions and evicts the oldest position when it is full.  Parsing
+# mostly moves forward, so old positions are the least likely to be
+# revisited, and an eviction can only cost time, never change a result.
+#
+# Values produced while matching:
+#
+#    'quoted'         : the quoted text
+#    NAME             : the token text (EOF gives None)
+#    e1 e2 ...        : a list of the values of e1, e2, ...
+#    e1 / e2          : the value of whichever alternative matched
+#    e?               : the value of e, or None
+#    e* and e+        : a list of values
+#    rule             : action(value) if the rule has an action
+#
+# On failure a SyntaxError is raised that points at the furthest token
+# any terminal was tried against, which is almost always the real error.
+#
+# stream(source, rule) matches rule over and over until the input runs
+# out, yielding each value as soon as it is matched.  It accepts the
+# same input as a start rule "rule* EOF", but never holds more than one
+# value, and the memo is emptied after each match since the parse never
+# backs up past a completed match.
+
+import re
+from array import array
+
+from wabbit.tokenbuffer import TokenBuffer, KIND_CODES, EOF
+
+_meta = re.compile(r'''\s*(?:(?P<arrow><-)|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|'(?P<literal>[^']*)'|(?P<op>[/()?*+]))''')
+
+class Grammar:
+    # A set of PEG rules read from text.  Each rule is kept as a small
+    # expression tree of tuples:
+    #
+    #    ('seq', [e, ...])    ('choice', [e, ...])
+    #    ('opt', e)           ('star', e)           ('plus', e)
+    #    ('literal', text)    ('token', NAME)       ('rule', name)
+    #
+    # aliases maps token names used in the grammar to lexer token kinds
+    # (for example INTEGER -> LIT_INT).
+
+    def __init__(self, text, aliases=None):
+        self.text = text
+        self.aliases = dict(aliases or {})
+        self.tokens = self._tokenize(text)
+        self.index = 0
+        self.rules = {}
+        while self.index < len(self.tokens):
+            name = self._expect('name')
+            self._expect('arrow')
+            if name in self.rules:
+                raise ValueError(f'rule {name} defined twice')
+            self.rules[name] = self._choice()
+        del self.tokens
+        self.start = next(iter(self.rules))
+        for name in self.references():
+            if name not in self.rules:
+                raise ValueError(f'undefined rule {name}')
+
+    @staticmethod
+    def _tokenize(text):
+        tokens = []
+        index = 0
+        text = text.rstrip()
+        while index < len(text):
+            match = _meta.match(text, index)
+            if not match:
+                raise ValueError(f'bad grammar text at {text[index:index+20]!r}')
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            index = match.end()
+        return tokens
+
+    def _peek(self, distance=0):
+        index = self.index + distance
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def _expect(self, kind, value=None):
+        token = self._peek()
+        if token[0] != kind or (value is not None and token[1] != value):
+            raise ValueError(f'grammar: expected {value or kind}, got {token[1]!r}')
+        self.index += 1
+        return token[1]
+
+    def _at_rule(self):
+        return self._peek()[0] == 'name' and self._peek(1)[0] == 'arrow'
+
+    def _choice(self):
+        alternatives = [self._sequence()]
+        while self._peek() == ('op', '/'):
+            self.index += 1
+            alternatives.append(self._sequence())
+        return alternatives[0] if len(alternatives) == 1 else ('choice', alternatives)
+
+    def _sequence(self):
+        items = []
+        while True:
+            kind, value = self._peek()
+            if kind is None or self._at_rule() or (kind == 'op' and value in '/)'):
+                break
+            items.append(self._suffix())
+        if not items:
+            raise ValueError('grammar: empty sequence')
+        return items[0] if len(items) == 1 else ('seq', items)
+
+    def _suffix(self):
+        expr = self._primary()
+        kind, value = self._peek()
+        if kind == 'op' and value in '?*+':
+            self.index += 1
+            expr = ({'?': 'opt', '*': 'star', '+': 'plus'}[value], expr)
+        return expr
+
+    def _primary(self):
+        kind, value = self._peek()
+        self.index += 1
+        if kind == 'literal':
+            return ('literal', value)
+        if kind == 'name':
+            return ('token', value) if value.isupper() else ('rule', value)
+        if (kind, value) == ('op', '('):
+            expr = self._choice()
+            self._expect('op', ')')
+            return expr
+        raise ValueError(f'grammar: unexpected {value!r}')
+
+    def references(self, expr=None):
+        # Names of all rules referenced by expr (or by the whole grammar)
+        exprs = [expr] if expr else list(self.rules.values())
+        names = []
+        while exprs:
+            op, arg = exprs.pop()
+            if op == 'rule':
+                names.append(arg)
+            elif op in ('seq', 'choice'):
+                exprs.extend(arg)
+            elif op in ('opt', 'star', 'plus'):
+                exprs.append(arg)
+        return names
+
+    def terminal(self, op, arg):
+        # The (kind code, text) a terminal matches.  text is None when the
+        # kind alone decides the match.
+        if op == 'token':
+            kind = self.aliases.get(arg, arg)
+            if kind not in KIND_CODES:
+                raise ValueError(f'unknown token {arg}')
+            return KIND_CODES[kind], None
+        buffer = TokenBuffer.scan(arg)
+        if len(buffer) != 1 or buffer.lengths[0] != len(buffer.source):
+            raise ValueError(f'literal {arg!r} is not a single token')
+        kind = buffer.kind(0)
+        if kind == 'ID' or kind.startswith('LIT_'):
+            return buffer.kinds[0], arg.encode('utf-8')
+        return buffer.kinds[0], None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(rules={len(self.rules)}, start={self.start!r})'
+
+class State:
+    # Everything that belongs to a single parse, so that one Packrat can
+    # be used by several threads at once.
+    __slots__ = ('buffer', 'kinds', 'memo', 'capacity', 'furthest', 'expected')
+
+    def __init__(self, buffer, capacity):
+        self.buffer = buffer
+        self.kinds = buffer.kinds + array('B', [EOF])
+        self.memo = {}
+        self.capacity = capacity
+        self.furthest = -1
+        self.expected = set()
+
+    def fail(self, pos, what):
+        if pos > self.furthest:
+            self.furthest = pos
+            self.expected = {what}
+        elif pos == self.furthest:
+            self.expected.add(what)
+
+    def error(self):
+        return syntax_error(self.buffer, self.furthest, self.expected)
+
+def syntax_error(buffer, pos, expected):
+    expected = ', '.join(sorted(expected))
+    if 0 <= pos < len(buffer):
+        return SyntaxError(f'line {buffer.lines[pos]}: unexpected {buffer.text(pos)!r}, expected {expected}')
+    return SyntaxError(f'unexpected end of input, expected {expected}')
+
+class Rule:
+    __slots__ = ('name', 'body', 'action')
+
+    def __init__(self, name, action=None):
+        self.name = name
+        self.body = None
+        self.action = action
+
+class Packrat:
+
+    def __init__(self, grammar, actions=None, capacity=256):
+        assert capacity > 0, 'capacity must be > 0'
+        self.grammar = grammar
+        self.actions = dict(actions or {})
+        self.capacity = capacity
+        self.rules = {name: Rule(name, self.actions.get(name)) for name in grammar.rules}
+        self.matchers = {name: self._apply(rule) for name, rule in self.rules.items()}
+        for name, expr in grammar.rules.items():
+            self.rules[name].body = self._compile(expr)
+
+    def parse(self, source, start=None):
+        buffer = source if isinstance(source, TokenBuffer) else TokenBuffer.scan(source)
+        state = State(buffer, self.capacity)
+        result = self.matchers[start or self.grammar.start](state, 0)
+        if result is None:
+            raise state.error()
+        return result[0]
+
+    def stream(self, source, rule):
+        buffer = source if isinstance(source, TokenBuffer) else TokenBuffer.scan(source)
+        state = State(buffer, self.capacity)
+        match = self.matchers[rule]
+        pos = 0
+        while pos < len(buffer):
+            result = match(state, pos)
+            if result is None:
+                state.fail(pos, 'EOF')
+                raise state.error()
+            value, pos = result
+            state.memo.clear()
+            yield value
+
+    def _apply(self, rule):
+        name = rule.name
+        missing = object()
+        def apply(s, pos):
+            memo = s.memo
+            entries = memo.get(pos)
+            if entries is None:
+                entries = memo[pos] = {}
+                if len(memo) > s.capacity:
+                    del memo[next(iter(memo))]
+            else:
+                result = entries.get(name, missing)
+                if result is not missing:
+                    return result
+            result = rule.body(s, pos)
+            if result is not None and rule.action:
+                result = (rule.action(result[0]), result[1])
+            entries[name] = result
+            return result
+        return apply
+
+    def _compile(self, expr):
+        op, arg = expr
+        if op == 'rule':
+            return self.matchers[arg]
+        if op in ('literal', 'token'):
+            return self._terminal(op, arg)
+        if op == 'seq':
+            return self._seq([self._compile(item) for item in arg])
+        if op == 'choice':
+            return self._choice([self._compile(item) for item in arg])
+        return getattr(self, f'_{op}')(self._compile(arg))
+
+    def _terminal(self, op, arg):
+        code, text = self.grammar.terminal(op, arg)
+        what = f"'{arg}'" if op == 'literal' else arg
+        if code == EOF:
+            def match(s, pos):
+                if s.kinds[pos] == EOF:
+                    return None, pos
+                s.fail(pos, what)
+                return None
+        elif text is not None:
+            value = arg
+            def match(s, pos):
+                if s.kinds[pos] == code and s.buffer.lexeme(pos) == text:
+                    return value, pos + 1
+                if pos >= s.furthest:
+                    s.fail(pos, what)
+                return None
+        elif op == 'literal':
+            value = arg
+            def match(s, pos):
+                if s.kinds[pos] == code:
+                    return value, pos + 1
+                if pos >= s.furthest:
+                    s.fail(pos, what)
+                return None
+        else:
+            def match(s, pos):
+                if s.kinds[pos] == code:
+                    return s.buffer.text(pos), pos + 1
+                if pos >= s.furthest:
+                    s.fail(pos, what)
+                return None
+        return match
+
+    def _seq(self, items):
+        def match(s, pos):
+            values = []
+            for item in items:
+                result = item(s, pos)
+                if result is None:
+                    return None
+                value, pos = result
+                values.append(value)
+            return values, pos
+        return match
+
+    def _choice(self, alternatives):
+        def match(s, pos):
+            for alternative in alternatives:
+                result = alternative(s, pos)
+                if result is not None:
+                    return result
+            return None
+        return match
+
+    def _opt(self, item):
+        def match(s, pos):
+            result = item(s, pos)
+            return result if result is not None else (None, pos)
+        return match
+
+    def _star(self, item):
+        def match(s, pos):
+            values = []
+            while True:
+                result = item(s, pos)
+                if result is None or result[1] == pos:
+                    return values, pos
+                value, pos = result
+                values.append(value)
+        return match
+
+    def _plus(self, item):
+        star = self._star(item)
+        def match(s, pos):
+            result = item(s, pos)
+            if result is None:
+                return None
+            value, pos = result
+            values, pos = star(s, pos)
+            return [value] + values, pos
+        return match
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(grammar={self.grammar}, capacity={self.capacity})'
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+# pegen.py
+#
+# PEG parser generator.  Instead of interpreting a grammar through the
+# closures built by peg.Packrat, this module writes a recursive descent
+# parser for it as Python source:
+#
+#    - every rule becomes a function with the packrat memo inlined
+#    - sequences become straight-line code, choices become if-chains,
+#      repetitions become while loops
+#    - terminals become inline comparisons against token kind codes,
+#      e.g. "if kinds[pos] == 17:"
+#
+# The generated module is cached on disk (under wabbit/__pycache__ by
+# default) in a file whose name is a digest of everything the generated
+# code depends on: the grammar text, the token aliases, the lexer's kind
+# codes and the generator version.  It is only regenerated when one of
+# those changes.  Python byte-compiles it and caches that as usual.
+#
+# To show the generated source for the Wabbit grammar:
+#
+#     bash % python3 -m wabbit.pegen
+
+import os
+import sys
+import hashlib
+import tempfile
+import importlib.util
+
+from wabbit.peg import syntax_error
+from wabbit.tokenbuffer import TokenBuffer, KINDS, EOF
+
+VERSION = 2
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+
+class Generator:
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        self.functions = []
+        self.helpers = 0
+
+    def digest(self):
+        text = '\n'.join([
+            f'pegen {VERSION}',
+            self.grammar.text,
+            repr(sorted(self.grammar.aliases.items())),
+            repr(KINDS),
+        ])
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def generate(self):
+        for name, expr in self.grammar.rules.items():
+            if self.grammar.references(expr):
+                self.rule(name)
+                self.function(f'b_{name}', expr)
+            else:
+                self.leaf(name, expr)
+        lines = [
+            '# Generated by wabbit/pegen.py from a PEG grammar.  Do not edit.',
+            '#',
+            f'# digest: {self.digest()}',
+            '',
+            'from array import array',
+            '',
+            'def build(actions, capacity, EOF, syntax_error):',
+        ]
+        for name in self.grammar.rules:
+            lines.append(f'    a_{name} = actions.get({name!r})')
+        lines += [
+            '',
+            '    def matcher(buffer):',
+            "        kinds = buffer.kinds + array('B', [EOF])",
+            '        lexeme = buffer.lexeme',
+            '        text = buffer.text',
+            '        memo = {}',
+            '        failure = [-1, set()]',
+            '',
+            '        def fail(pos, what):',
+            '            if pos > failure[0]:',
+            '                failure[0] = pos',
+            '                failure[1] = {what}',
+            '            elif pos == failure[0]:',
+            '                failure[1].add(what)',
+            '',
+        ]
+        for function in self.functions:
+            lines += ['        ' + line if line else '' for line in function]
+            lines.append('')
+        rules = ', '.join(f'{name!r}: r_{name}' for name in self.grammar.rules)
+        lines += [
+            f'        return {{{rules}}}, memo, failure',
+            '',
+            f'    def parse(buffer, start={self.grammar.start!r}):',
+            '        rules, memo, failure = matcher(buffer)',
+            '        result = rules[start](0)',
+            '        if result is None:',
+            '            raise syntax_error(buffer, failure[0], failure[1])',
+            '        return result[0]',
+            '',
+            '    def stream(buffer, rule):',
+            '        rules, memo, failure = matcher(buffer)',
+            '        match = rules[rule]',
+            '        pos = 0',
+            '        while pos < len(buffer):',
+            '            result = match(pos)',
+            '            if result is None:',
+            '                if pos > failure[0]:',
+            "                    failure[:] = [pos, {'EOF'}]",
+            '                elif pos == failure[0]:',
+            "                    failure[1].add('EOF')",
+            '                raise syntax_error(buffer, failure[0], failure[1])',
+            '            value, pos = result',
+            '            memo.clear()',
+            '            yield value',
+            '',
+            '    return parse, stream',
+            '',
+        ]
+        return '\n'.join(lines)
+
+    def rule(self, name):
+        self.functions.append([
+            f'def r_{name}(pos):',
+            '    entries = memo.get(pos)',
+            '    if entries is None:',
+            '        entries = memo[pos] = {}',
+            '        if len(memo) > capacity:',
+            '            del memo[next(iter(memo))]',
+            f'    elif {name!r} in entries:',
+            f'        return entries[{name!r}]',
+            f'    result = b_{name}(pos)',
+            f'    if result is not None and a_{name} is not None:',
+            f'        result = (a_{name}(result[0]), result[1])',
+            f'    entries[{name!r}] = result',
+            '    return result',
+        ])
+
+    def leaf(self, name, expr):
+        # A rule that references no other rule only ever looks at a token
+        # or two, which is cheaper to do again than to memoize
+        self.function(f'b_{name}', expr)
+        self.functions.append([
+            f'def r_{name}(pos):',
+            f'    result = b_{name}(pos)',
+            f'    if result is not None and a_{name} is not None:',
+            f'        result = (a_{name}(result[0]), result[1])',
+            '    return result',
+        ])
+
+    def function(self, fname, expr):
+        lines = [f'def {fname}(pos):']
+        lines += ['    ' + line for line in self.body(expr)]
+        self.functions.append(lines)
+        return fname
+
+    def call(self, expr):
+        # Name of a function that matches expr
+        op, arg = expr
+        if op == 'rule':
+            return f'r_{arg}'
+        self.helpers += 1
+        return self.function(f'e_{self.helpers}', expr)
+
+    def terminal(self, expr):
+        # (test, value, width, description) for a terminal
+        op, arg = expr
+        code, text = self.grammar.terminal(op, arg)
+        what = f"'{arg}'" if op == 'literal' else arg
+        if code == EOF:
+            return f'kinds[pos] == {code}', 'None', 0, what
+        test = f'kinds[pos] == {code}'
+        if text is not None:
+            test += f' and lexeme(pos) == {text!r}'
+        value = repr(arg) if op == 'literal' else 'text(pos)'
+        return test, value, 1, what
+
+    def terminals(self, expr):
+        # The terminals of expr if it is a terminal or a choice of
+        # terminals that each consume a token, otherwise None
+        op, arg = expr
+        alternatives = arg if op == 'choice' else [expr]
+        matches = []
+        for alternative in alternatives:
+            if alternative[0] not in ('literal', 'token'):
+                return None
+            test, value, width, what = self.terminal(alternative)
+            if not width:
+                return None
+            matches.append((test.replace('kinds[pos]', 'kind'), value, what))
+        return matches
+
+    def switch(self, matches, var, fallback):
+        # if-chain over the current token kind, leaving the value of the
+        # matching terminal in var and running fallback if none match
+        lines = ['kind = kinds[pos]']
+        for index, (test, value, what) in enumerate(matches):
+            lines += [f'{"elif" if index else "if"} {test}:', f'    {var} = {value}']
+        lines += ['else:', '    if pos >= failure[0]:']
+        lines += [f'        fail(pos, {what!r})' for test, value, what in matches]
+        return lines + ['    ' + line for line in fallback]
+
+    @staticmethod
+    def advance(width):
+        return [f'pos += {width}'] if width else []
+
+    @staticmethod
+    def fail(what):
+        return [
+            'if pos >= failure[0]:',
+            f'    fail(pos, {what!r})',
+        ]
+
+    def body(self, expr):
+        # Statements that match expr at pos and return (value, pos) or None
+        op, arg = expr
+        if op in ('literal', 'token'):
+            test, value, width, what = self.terminal(expr)
+            return [
+                f'if {test}:',
+                f'    return {value}, pos + {width}',
+                *self.fail(what),
+                'return None',
+            ]
+        matches = self.terminals(expr)
+        if matches:
+            return self.switch(matches, 'value', ['return None']) + ['return value, pos + 1']
+        if op == 'rule':
+            return [f'return r_{arg}(pos)']
+        if op == 'seq':
+            lines = []
+            for index, item in enumerate(arg):
+                lines += self.item(item, f'v{index}')
+            values = ', '.join(f'v{index}' for index in range(len(arg)))
+            return lines + [f'return [{values}], pos']
+        if op == 'choice':
+            lines = []
+            fails = []
+            for alternative in arg:
+                if alternative[0] in ('literal', 'token'):
+                    test, value, width, what = self.terminal(alternative)
+                    lines += [f'if {test}:', f'    return {value}, pos + {width}']
+                    fails.append(what)
+                else:
+                    lines += [
+                        f'result = {self.call(alternative)}(pos)',
+                        'if result is not None:',
+                        '    return result',
+                    ]
+            if fails:
+                lines += ['if pos >= failure[0]:']
+                lines += [f'    fail(pos, {what!r})' for what in fails]
+            return lines + ['return None']
+        if op == 'opt':
+            return self.item(expr, 'value') + ['return value, pos']
+        if op == 'star':
+            return self.item(expr, 'values') + ['return values, pos']
+        if op == 'plus':
+            return self.item(arg, 'value') + self.item(('star', arg), 'values') + ['return [value] + values, pos']
+        raise ValueError(f'unknown expression {op}')
+
+    def item(self, expr, var):
+        # Statements that match expr at pos inside a sequence: on success
+        # the value is left in var and pos is advanced, on failure the
+        # function returns None.
+        op, arg = expr
+        if op in ('literal', 'token'):
+            test, value, width, what = self.terminal(expr)
+            return [
+                f'if not ({test}):',
+                *['    ' + line for line in self.fail(what)],
+                '    return None',
+                f'{var} = {value}',
+                *self.advance(width),
+            ]
+        matches = self.terminals(expr)
+        if matches:
+            return self.switch(matches, var, ['return None']) + ['pos += 1']
+        if op == 'opt' and arg[0] in ('literal', 'token'):
+            test, value, width, what = self.terminal(arg)
+            return [
+                f'if {test}:',
+                f'    {var} = {value}',
+                *['    ' + line for line in self.advance(width)],
+                'else:',
+                *['    ' + line for line in self.fail(what)],
+                f'    {var} = None',
+            ]
+        if op == 'opt':
+            return [
+                f'result = {self.call(arg)}(pos)',
+                'if result is None:',
+                f'    {var} = None',
+                'else:',
+                f'    {var}, pos = result',
+            ]
+        if op == 'star' and arg[0] in ('literal', 'token'):
+            test, value, width, what = self.terminal(arg)
+            return [
+                f'{var} = []',
+                f'while {test}:',
+                f'    {var}.append({value})',
+                *['    ' + line for line in self.advance(width) or ['break']],
+                *self.fail(what),
+            ]
+        if op == 'star':
+            return [
+                f'{var} = []',
+                'while True:',
+                f'    result = {self.call(arg)}(pos)',
+                '    if result is None or result[1] == pos:',
+                '        break',
+                f'    {var}.append(result[0])',
+                '    pos = result[1]',
+            ]
+        return [
+            f'result = {self.call(expr)}(pos)',
+            'if result is None:',
+            '    return None',
+            f'{var}, pos = result',
+        ]
+
+class GeneratedParser:
+    # Same interface as peg.Packrat, backed by a generated module
+
+    def __init__(self, module, actions, capacity=256):
+        assert capacity > 0, 'capacity must be > 0'
+        self.module = module
+        self.capacity = capacity
+        self._parse, self._stream = module.build(dict(actions or {}), capacity, EOF, syntax_error)
+
+    def parse(self, source, start=None):
+        buffer = source if isinstance(source, TokenBuffer) else TokenBuffer.scan(source)
+        return self._parse(buffer, start) if start else self._parse(buffer)
+
+    def stream(self, source, rule):
+        buffer = source if isinstance(source, TokenBuffer) else TokenBuffer.scan(source)
+        return self._stream(buffer, rule)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(module={self.module.__name__}, capacity={self.capacity})'
+
+def load(grammar, cache_dir=CACHE_DIR):
+    # Import the generated module for grammar, generating it first if the
+    # cache does not have it
+    generator = Generator(grammar)
+    name = f'wabbit_peg_{generator.digest()[:20]}'
+    filename = os.path.join(cache_dir, f'{name}.py')
+    if not os.path.exists(filename):
+        source = generator.generate()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, temp = tempfile.mkstemp(suffix='.py', dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(source)
+            os.replace(temp, filename)
+        except OSError:
+            # Unwritable cache: use the source without caching it
+            module = type(sys)(name)
+            exec(compile(source, f'<{name}>', 'exec'), module.__dict__)
+            return module
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main(args):
+    from wabbit.peg import Grammar
+    from wabbit.parser import PEG_GRAMMAR, PEG_TOKENS
+    print(Generator(Grammar(PEG_GRAMMAR, PEG_TOKENS)).generate())
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
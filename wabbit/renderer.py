@@ -23,42 +23,72 @@ class WabbitRenderer(Visitor):
         return str(literal.value)
 
     def visit(self, location: Location):
-        return location.value
+        value = yield location.value
+        return f'`{value}'
 
     def visit(self, unop: UnOp):
-        return f'{self.visit(unop.operator)}{self.visit(unop.expr)}'
+        operator = yield unop.operator
+        expr = yield unop.expr
+        return f'{operator}{expr}'
 
     def visit(self, binop: BinOp):
-        return f'({self.visit(binop.left)} {self.visit(binop.operator)} {self.visit(binop.right)})'
+        left = yield binop.left
+        operator = yield binop.operator
+        right = yield binop.right
+        return f'({left} {operator} {right})'
 
     def visit(self, definition: Definition):
         prefix = 'var' if definition.mutable else 'const'
-        suffix = f' = {self.visit(definition.value)}' if definition.value else ''
-        return f'{prefix} {self.visit(definition.name)} {self.visit(definition.type)}{suffix};'
+        suffix = ''
+        if definition.value:
+            value = yield definition.value
+            suffix = f' = {value}'
+        name = yield definition.name
+        type = yield definition.type
+        return f'{prefix} {name} {type}{suffix};'
 
     def visit(self, assignment: Assignment):
-        return f'{self.visit(assignment.name)} = {self.visit(assignment.expr)};'
+        name = yield assignment.name
+        expr = yield assignment.expr
+        return f'{name} = {expr};'
 
     def visit(self, cast: Cast):
-        return f'{self.visit(cast.type)}({self.visit(cast.expr)})'
+        type = yield cast.type
+        expr = yield cast.expr
+        return f'{type}({expr})'
 
     def _render_block(self, stmts, prefix='{\n', suffix='\n}\n'):
-        return f'{prefix}{NL.join([self.visit(stmt) for stmt in stmts])}{suffix}'
+        lines = []
+        for stmt in stmts:
+            lines.append((yield stmt))
+        return f'{prefix}{NL.join(lines)}{suffix}'
 
-    def visit(self, block):
-        return self._render_block(block.stmts)
+    def _render_list(self, nodes):
+        items = []
+        for node in nodes:
+            items.append((yield node))
+        return ', '.join(items)
 
-    def visit(self, prog):
-        return self._render_block(prog.stmts, prefix='', suffix='')
+    def visit(self, block: Block):
+        return (yield from self._render_block(block.stmts))
+
+    def visit(self, prog: Prog):
+        return (yield from self._render_block(prog.stmts, prefix='', suffix=''))
 
     def visit(self, print: Print):
-        return f'print {self.visit(print.expr)};'
+        expr = yield print.expr
+        return f'print {expr};'
 
     def visit(self, if_: If):
-        return f'if {self.visit(if_.test)} {self.visit(if_.consequence)}else {self.visit(if_.alternative)}'
+        test = yield if_.test
+        consequence = yield if_.consequence
+        alternative = yield if_.alternative
+        return f'if {test} {consequence}else {alternative}'
 
     def visit(self, while_: While):
-        return f'while {self.visit(while_.test)} {self.visit(while_.block)}'
+        test = yield while_.test
+        block = yield while_.block
+        return f'while {test} {block}'
 
     def visit(self, break_: Break):
         return 'break;'
@@ -67,21 +97,31 @@ class WabbitRenderer(Visitor):
         return 'continue;'
 
     def visit(self, return_: Return):
-        return f'return {self.visit(return_.expr)};'
+        expr = yield return_.expr
+        return f'return {expr};'
 
     def visit(self, param: Parameter):
-        suffix = f' = {self.visit(param.value)}' if param.value else ''
-        return f'{self.visit(param.name)} {self.visit(param.type)}{suffix}'
+        suffix = ''
+        if param.value:
+            value = yield param.value
+            suffix = f' = {value}'
+        name = yield param.name
+        type = yield param.type
+        return f'{name} {type}{suffix}'
 
     def visit(self, func: Func):
-        params = ', '.join([self.visit(param) for param in func.params])
-        return f'func {self.visit(func.name)}({params}) {self.visit(func.type)} {self.visit(func.block)}'
+        params = yield from self._render_list(func.params)
+        name = yield func.name
+        type = yield func.type
+        block = yield func.block
+        return f'func {name}({params}) {type} {block}'
 
     def visit(self, import_: Import):
-        params = ', '.join([self.visit(param) for param in func.params])
-        return f'import {self.visit(import_.name)} ({params});'
+        params = yield from self._render_list(import_.params)
+        name = yield import_.name
+        return f'import {name} ({params});'
 
     def visit(self, call: Call):
-        args = ', '.join([self.visit(param) for param in call.params])
-        return f"{self.visit(call.name)}({args})"
-
+        args = yield from self._render_list(call.params)
+        name = yield call.name
+        return f"{name}({args})"
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# resolver.py
+#
+# Name resolution.  Runs before the type checker and ties every use of
+# a name to its declaration:
+#
+#     Definition, Parameter, Func, Import : .slot, where it is declared
+#     Func                                : .frame, its local declarations
+#     Name (a use, or an assigned name)   : .slot and .decl
+#     Call                                : .name.slot and .name.decl
+#
+# Names resolve in program order, as they are executed: a variable can
+# only be used after its definition, a function's own name is visible
+# in its body, and a function's locals shadow the globals.  Undefined
+# and duplicate names and nested functions are reported to the error
+# sink here, so the checker and the code generators never look a name
+# up by its string.
+
+from wabbit.visitor import Visitor
+from wabbit.model import *
+from wabbit.errors import *
+from wabbit.env import Scope
+
+class NameResolver(Visitor):
+
+    def __init__(self, errors=None):
+        self.errors = ErrorSink() if errors is None else errors
+        self.globals = Scope()
+
+    @classmethod
+    def resolve(cls, model, errors=None):
+        resolver = cls(errors)
+        model.accept(resolver, resolver.globals)
+        return resolver
+
+    def declare(self, decl, scope):
+        decl.slot = decl.name.slot = scope.declare(decl.name.value, decl)
+        decl.name.decl = decl
+
+    def visit(self, node: Node, scope: Scope):
+        pass
+
+    def visit(self, name: Name, scope: Scope):
+        slot = scope.lookup(name.value)
+        if slot is None:
+            self.errors.report(NameLookupError, f'undefined name {name.value}', name)
+            return
+        name.slot = slot
+        name.decl = scope.decl(slot)
+
+    def visit(self, location: Location, scope: Scope):
+        yield location.value, scope
+
+    def visit(self, unop: UnOp, scope: Scope):
+        yield unop.expr, scope
+
+    def visit(self, binop: BinOp, scope: Scope):
+        yield binop.left, scope
+        yield binop.right, scope
+
+    def visit(self, definition: Definition, scope: Scope):
+        if definition.name.value in scope:
+            self.errors.report(DefineError, f'{definition.name.value} already defined', definition)
+        # The value is resolved before the name is declared
+        yield definition.value, scope
+        self.declare(definition, scope)
+
+    def visit(self, assignment: Assignment, scope: Scope):
+        yield assignment.name, scope
+        yield assignment.expr, scope
+
+    def visit(self, cast: Cast, scope: Scope):
+        yield cast.expr, scope
+
+    def visit(self, block: Block, scope: Scope):
+        for stmt in block.stmts:
+            yield stmt, scope
+
+    def visit(self, prog: Prog, scope: Scope):
+        for stmt in prog.stmts:
+            yield stmt, scope
+
+    def visit(self, print: Print, scope: Scope):
+        yield print.expr, scope
+
+    def visit(self, if_: If, scope: Scope):
+        yield if_.test, scope
+        yield if_.consequence, scope
+        yield if_.alternative, scope
+
+    def visit(self, while_: While, scope: Scope):
+        yield while_.test, scope
+        yield while_.block, scope
+
+    def visit(self, return_: Return, scope: Scope):
+        yield return_.expr, scope
+
+    def visit(self, param: Parameter, scope: Scope):
+        yield param.value, scope
+
+    def visit(self, func: Func, scope: Scope):
+        self.define(func, scope)
+        self.body(func, scope)
+
+    # A function is resolved in two parts.  define() declares its name,
+    # and after that the body can be resolved at any time, as long as
+    # scope looks the way it did then (see GlobalsView in env.py).
+
+    def define(self, func, scope):
+        if scope.parent is not None:
+            self.errors.report(DefineError, 'nested functions are not allowed', func)
+        if func.name.value in scope:
+            self.errors.report(DefineError, f'{func.name.value} already defined', func)
+        self.declare(func, scope)
+
+    def body(self, func, scope):
+        frame = scope.child()
+        func.frame = frame.decls
+        for param in func.params:
+            self.visit(param, frame)
+        for param in func.params:
+            self.declare(param, frame)
+        self.visit(func.block, frame)
+
+    def visit(self, import_: Import, scope: Scope):
+        for param in import_.params:
+            yield param, scope
+        self.declare(import_, scope)
+
+    def visit(self, call: Call, scope: Scope):
+        for arg in call.params:
+            yield arg, scope
+        slot = scope.lookup(call.name.value)
+        if slot is None:
+            self.errors.report(NameLookupError, f'undefined function {call.name.value}', call)
+            return
+        call.name.slot = slot
+        call.name.decl = scope.decl(slot)
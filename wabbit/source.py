@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# source.py
+#
+# Source input.  A SourceFile memory-maps a .wb file read-only so that
+# the lexer can scan the mapped pages directly.  Nothing is copied into
+# a Python string up front; the OS pages the input in on demand as the
+# scanner walks through it.
+#
+# The mapping behaves like a bytes object (indexing, slicing, find,
+# regular expression matching).  Offsets are byte offsets.
+
+import os
+import sys
+import mmap
+
+class SourceFile:
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap refuses zero-length files
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return len(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def location(self, offset):
+        # (lineno, column) of a byte offset, both counted from 1
+        lineno = 1
+        start = self.data.find(b'\n', 0, offset)
+        while start != -1:
+            lineno += 1
+            start = self.data.find(b'\n', start + 1, offset)
+        return lineno, offset - self.data.rfind(b'\n', 0, offset)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(filename={self.filename!r}, size={len(self)})'
+
+def main(args):
+    for filename in args:
+        with SourceFile(filename) as source:
+            print(source)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+
+# ssa.py
+#
+# Register (SSA) form of IR code.  In the stack IR the value an
+# instruction works on is wherever the stack happens to be; here every
+# value is a numbered virtual register, defined once, and every
+# instruction names the registers it reads:
+#
+#     func in_mandelbrot(x0 F, y0 F, n I) I
+#     b0:
+#         %3 = GLOBAL_GET in_mandelbrot.x
+#         %4 = MULF %3 %3
+#         ...
+#         IF %9 -> b1 b2
+#     b3:
+#         %12 = phi b1:%10 b2:%11
+#
+# The code of a function is cut into basic blocks.  A block ends in one
+# of the structured control flow instructions of the IR, which also say
+# where control goes next:
+#
+#     IF cond -> then else        start of an if (consequence, alternative)
+#     ELSE -> merge               end of the consequence
+#     ENDIF -> merge              end of the alternative
+#     LOOP -> header              into a loop
+#     CBREAK cond -> exit next    out of the loop if cond, else on
+#     CONTINUE -> header          back to the top of the loop
+#     ENDLOOP -> header           end of the loop body
+#     RET value
+#
+# Where paths meet (the merge of an if, the header of a loop and the
+# exit after it) phis pick the value a variable or stack entry had on
+# the way in.  Local variables (LOCAL_GET/LOCAL_SET) become registers
+# and phis; globals stay loads and stores (GLOBAL_GET/GLOBAL_SET), as
+# any call may change them.
+#
+# Blocks are kept in the order of the stack code, with an empty
+# placeholder where a block marker follows unreachable code (after RET
+# or CONTINUE), so the stack form can be written back with the same
+# structure (see to_stack).  Registers go back into locals named %n,
+# except those used once, right where they are computed, which stay on
+# the stack.
+#
+#     bash % python3 -m wabbit.ssa someprogram.wb
+
+import sys
+
+from wabbit.bytecode import EFFECTS_BY_NAME, reachable
+
+# Instructions with an effect other than their result
+SIDE_EFFECTS = {'CALL', 'GLOBAL_SET', 'PRINTI', 'PRINTF', 'PRINTB', 'POKEI', 'POKEF', 'POKEB', 'GROW'}
+
+class Instr:
+    __slots__ = ('dest', 'op', 'args', 'operand')
+
+    def __init__(self, dest, op, args, operand=None):
+        self.dest = dest            # register defined, or None
+        self.op = op                # IR opcode name
+        self.args = args            # registers read
+        self.operand = operand      # constant or name, or None
+
+    def __repr__(self):
+        parts = [self.op] + ([str(self.operand)] if self.operand is not None else []) + [f'%{arg}' for arg in self.args]
+        return (f'%{self.dest} = ' if self.dest is not None else '') + ' '.join(parts)
+
+class Phi:
+    __slots__ = ('dest', 'incoming')
+
+    def __init__(self, dest):
+        self.dest = dest
+        self.incoming = {}          # predecessor Block: register
+
+class Block:
+    __slots__ = ('label', 'phis', 'instrs', 'end', 'preds', 'live')
+
+    def __init__(self, live=True):
+        self.label = None
+        self.phis = []
+        self.instrs = []
+        self.end = None             # (opcode, *registers and Blocks)
+        self.preds = []
+        self.live = live            # False for a placeholder after dead code
+
+    def successors(self):
+        return [part for part in self.end[1:] if isinstance(part, Block)] if self.end else []
+
+    def __repr__(self):
+        return f'b{self.label}'
+
+class SSAFunction:
+
+    def __init__(self, irfunc):
+        self.irfunc = irfunc
+        self.blocks = []
+        self.params = []
+        self.types = {}             # register: 'I' or 'F'
+        self.count = 0
+
+    def register(self, irtype):
+        reg = self.count
+        self.count += 1
+        self.types[reg] = irtype
+        return reg
+
+    def append(self, block):
+        block.label = len(self.blocks)
+        self.blocks.append(block)
+        return block
+
+    def __str__(self):
+        irfunc = self.irfunc
+        params = ', '.join(f'%{reg} {self.types[reg]}' for reg in self.params)
+        lines = [f'func {irfunc.name}({params}) {irfunc.return_type}']
+        for block in self.blocks:
+            preds = ' '.join(map(repr, block.preds))
+            lines.append(f'{block!r}:' + (f'    ; preds {preds}' if preds else '') + ('' if block.live else '    ; unreachable'))
+            for phi in block.phis:
+                incoming = ' '.join(f'{pred!r}:%{reg}' for pred, reg in phi.incoming.items())
+                lines.append(f'    %{phi.dest} = phi {incoming}')
+            lines += [f'    {instr!r}' for instr in block.instrs]
+            if block.end:
+                op, *parts = block.end
+                line = ' '.join([op] + [f'%{part}' for part in parts if isinstance(part, int)])
+                targets = [repr(part) for part in parts if isinstance(part, Block)]
+                lines.append(f'    {line} -> {" ".join(targets)}' if targets else f'    {line}')
+        return '\n'.join(lines)
+
+# ----------------------------------------------------------------------
+# Stack form to SSA form
+
+# Opcodes whose result is a float.  All others give an int, apart from
+# GLOBAL_GET and CALL, which take the type of the global or function.
+_float_results = {'CONSTF', 'ADDF', 'SUBF', 'MULF', 'DIVF', 'PEEKF', 'ITOF'}
+
+class Builder:
+    # Turns the stack code of one function into an SSAFunction, walking
+    # it once with the registers on the stack and in each variable
+
+    def __init__(self, irfunc, callees=None):
+        self.irfunc = irfunc
+        self.func = SSAFunction(irfunc)
+        self.callees = callees if callees is not None else functions(irfunc.module)
+        self.current = None
+        self.env = None
+        self.stack = None
+
+    def new_block(self):
+        return self.func.append(Block())
+
+    def edge(self, source, target):
+        target.preds.append(source)
+
+    def emit(self, op, args, operand=None, irtype=None):
+        dest = self.func.register(irtype) if irtype else None
+        self.current.instrs.append(Instr(dest, op, args, operand))
+        return dest
+
+    def merge(self, block, states):
+        # The variables and stack at the start of block, reached from
+        # the (Block, env, stack) in states, with phis where they differ
+        if len(states) == 1:
+            _, env, stack = states[0]
+            return dict(env), list(stack)
+        def join(values):
+            if all(value == values[0] for value in values):
+                return values[0]
+            phi = Phi(self.func.register(self.func.types[values[0]]))
+            for (pred, _, _), value in zip(states, values):
+                phi.incoming[pred] = value
+            block.phis.append(phi)
+            return phi.dest
+        env = {name: join([state[1][name] for state in states]) for name in states[0][1]}
+        stack = [join([state[2][i] for state in states]) for i in range(len(states[0][2]))]
+        return env, stack
+
+    def build(self):
+        irfunc = self.irfunc
+        func = self.func
+        module = irfunc.module
+        self.current = self.new_block()
+        func.params = [func.register(irtype) for irtype in irfunc.params.values()]
+        self.stack = list(func.params)
+        # Variables start out as zero
+        self.env = {name: self.emit(f'CONST{irtype}', (), '0', irtype) for name, irtype in irfunc.locals.items()}
+        # The open ifs and loops, innermost last:
+        #     ['IF' or 'ELSE', state at IF, alternative, merge, states into merge]
+        #     ['LOOP', header, phis by variable, exit, states into exit]
+        # where a state is (block, variables, stack)
+        blocks = []
+        for pc, instr in reachable(irfunc.code, lambda: self.current is not None):
+            op = instr[0]
+            if self.current is None:
+                # The marker that ends unreachable code, in a placeholder
+                self.current = func.append(Block(live=False))
+            if op == 'IF':
+                cond = self.stack.pop()
+                then, else_ = Block(), Block()
+                self.end('IF', cond, then, else_)
+                blocks.append(['IF', self.state(), else_, Block(), []])
+                self.enter(then, self.state())
+            elif op == 'ELSE':
+                block = blocks[-1]
+                block[0] = 'ELSE'
+                self.leave('ELSE', block[3], block[4])
+                self.enter(block[2], block[1])
+            elif op == 'ENDIF':
+                block = blocks[-1]
+                if block[0] == 'IF':
+                    # No ELSE: the alternative is empty
+                    block[0] = 'ELSE'
+                    self.leave('ELSE', block[3], block[4])
+                    self.enter(block[2], block[1])
+                blocks.pop()
+                self.leave('ENDIF', block[3], block[4])
+                self.join(block[3], block[4])
+            elif op == 'LOOP':
+                header = Block()
+                self.end('LOOP', header)
+                entry = self.current
+                func.append(header)
+                self.edge(entry, header)
+                phis = {}
+                for name, value in self.env.items():
+                    phi = Phi(func.register(func.types[value]))
+                    phi.incoming[entry] = value
+                    header.phis.append(phi)
+                    phis[name] = phi
+                blocks.append(['LOOP', header, phis, Block(), []])
+                self.current = header
+                self.env = {name: phi.dest for name, phi in phis.items()}
+            elif op == 'CBREAK':
+                cond = self.stack.pop()
+                loop = next(block for block in reversed(blocks) if block[0] == 'LOOP')
+                next_ = Block()
+                self.end('CBREAK', cond, loop[3], next_)
+                loop[4].append(self.state())
+                self.edge(self.current, loop[3])
+                self.enter(next_, self.state())
+            elif op == 'CONTINUE' or op == 'ENDLOOP':
+                loop = next(block for block in reversed(blocks) if block[0] == 'LOOP')
+                header, phis = loop[1], loop[2]
+                if self.current.live:
+                    for name, phi in phis.items():
+                        phi.incoming[self.current] = self.env[name]
+                    self.edge(self.current, header)
+                self.end(op, header)
+                self.current = None
+                if op == 'ENDLOOP':
+                    blocks.pop()
+                    self.join(loop[3], loop[4])
+            elif op == 'RET':
+                self.end('RET', self.stack.pop())
+                self.current = None
+            elif op == 'LOCAL_GET':
+                self.stack.append(self.env[instr[1]])
+            elif op == 'LOCAL_SET':
+                self.env[instr[1]] = self.stack.pop()
+            else:
+                operand = instr[1] if len(instr) > 1 else None
+                if op == 'CALL':
+                    pops, pushes = len(self.callees[operand].params), 1
+                    irtype = self.callees[operand].return_type
+                else:
+                    pops, pushes = EFFECTS_BY_NAME[op]
+                    if op == 'GLOBAL_GET':
+                        irtype = module.globals[operand]
+                    else:
+                        irtype = 'F' if op in _float_results else 'I'
+                args = tuple(self.stack[len(self.stack) - pops:]) if pops else ()
+                if pops:
+                    del self.stack[-pops:]
+                if not pushes:
+                    irtype = None
+                dest = self.emit(op, args, operand, irtype)
+                if pushes:
+                    self.stack.append(dest)
+        simplify(func)
+        return func
+
+    def state(self):
+        return (self.current, dict(self.env), list(self.stack))
+
+    def end(self, op, *parts):
+        self.current.end = (op, *parts)
+
+    def enter(self, block, state):
+        # Start block, reached from the block of state with its values
+        self.func.append(block)
+        if state[0].live:
+            self.edge(state[0], block)
+        self.current = block
+        self.env = dict(state[1])
+        self.stack = list(state[2])
+
+    def leave(self, op, merge, states):
+        # End the current block of an if with a jump to its merge
+        if self.current.live:
+            self.edge(self.current, merge)
+            states.append(self.state())
+        self.end(op, merge)
+
+    def join(self, block, states):
+        # Start block, where the paths in states meet, or go on with
+        # unreachable code if there are none
+        if not states:
+            self.current = None
+            return
+        self.func.append(block)
+        self.current = block
+        self.env, self.stack = self.merge(block, states)
+
+def simplify(func):
+    # Remove phis whose incoming values are all the same (other than the
+    # phi itself), then instructions and phis whose results are never
+    # used and that have no other effect
+    replace = {}
+    def find(reg):
+        while reg in replace:
+            reg = replace[reg]
+        return reg
+    changed = True
+    while changed:
+        changed = False
+        for block in func.blocks:
+            for phi in list(block.phis):
+                values = {find(value) for value in phi.incoming.values()} - {phi.dest}
+                if len(values) == 1:
+                    replace[phi.dest] = values.pop()
+                    block.phis.remove(phi)
+                    changed = True
+    for block in func.blocks:
+        for phi in block.phis:
+            phi.incoming = {pred: find(value) for pred, value in phi.incoming.items()}
+        for instr in block.instrs:
+            instr.args = tuple(find(arg) for arg in instr.args)
+        if block.end:
+            block.end = tuple(find(part) if isinstance(part, int) else part for part in block.end)
+    # Dead code
+    while True:
+        used = set()
+        for block in func.blocks:
+            for phi in block.phis:
+                used.update(phi.incoming.values())
+            for instr in block.instrs:
+                used.update(instr.args)
+            if block.end:
+                used.update(part for part in block.end[1:] if isinstance(part, int))
+        removed = False
+        for block in func.blocks:
+            kept = [instr for instr in block.instrs
+                    if instr.dest is None or instr.dest in used or instr.op in SIDE_EFFECTS]
+            phis = [phi for phi in block.phis if phi.dest in used]
+            if len(kept) != len(block.instrs) or len(phis) != len(block.phis):
+                block.instrs = kept
+                block.phis = phis
+                removed = True
+        if not removed:
+            return
+
+def functions(irmodule):
+    # Every function that can be called, by name
+    callees = dict(irmodule.imports)
+    callees.update((irfunc.name, irfunc) for irfunc in irmodule.functions)
+    return callees
+
+def to_ssa(irfunc, callees=None):
+    return Builder(irfunc, callees).build()
+
+# ----------------------------------------------------------------------
+# SSA form back to stack form
+
+def operand_lists(block):
+    # The registers read by each instruction of block, and by its end
+    for instr in block.instrs:
+        yield instr.args
+    if block.end:
+        yield tuple(part for part in block.end[1:] if isinstance(part, int))
+
+def to_stack(func):
+    # The stack code for func.  Replaces the code and locals of its
+    # IRFunction and returns the new code.
+    irfunc = func.irfunc
+    name = '%{}'.format
+    uses = {}
+    for block in func.blocks:
+        for phi in block.phis:
+            for value in phi.incoming.values():
+                uses[value] = uses.get(value, 0) + 2     # never kept on the stack
+        for args in operand_lists(block):
+            for arg in args:
+                uses[arg] = uses.get(arg, 0) + 1
+    consts = {}
+    for block in func.blocks:
+        for instr in block.instrs:
+            if instr.op.startswith('CONST'):
+                consts[instr.dest] = (instr.op, instr.operand)
+    # The registers left on the stack where they are computed: those used
+    # once, in the same block.  A constant is only left there if the
+    # operands before it are too and those after it are computed after
+    # it; otherwise it is written out again where it is used.
+    stacked = set()
+    for block in func.blocks:
+        position = {instr.dest: index for index, instr in enumerate(block.instrs) if instr.dest is not None}
+        for args in operand_lists(block):
+            for index, arg in enumerate(args):
+                if uses.get(arg) != 1 or arg not in position:
+                    continue
+                if arg not in consts or (
+                        all(earlier in stacked and position[earlier] < position[arg] for earlier in args[:index])
+                        and all(later in consts or (uses.get(later) == 1 and position.get(later, -1) > position[arg])
+                                for later in args[index + 1:])):
+                    stacked.add(arg)
+    code = []
+    locals_ = {}
+    pending = []
+
+    def store(reg):
+        locals_[name(reg)] = func.types[reg]
+        code.append(('LOCAL_SET', name(reg)))
+
+    def flush():
+        for reg in reversed(pending):
+            store(reg)
+        pending.clear()
+
+    def push(args):
+        # Get args onto the stack, in order
+        count = len(args)
+        while count and pending[len(pending) - count:] != list(args[:count]):
+            count -= 1
+        if any(arg in pending for arg in args[count:]):
+            flush()
+            count = 0
+        del pending[len(pending) - count:]
+        for arg in args[count:]:
+            if arg in consts:
+                code.append(consts[arg])
+            else:
+                locals_[name(arg)] = func.types[arg]
+                code.append(('LOCAL_GET', name(arg)))
+
+    def copies(source, target):
+        # Set the phis of target for the edge from source
+        phis = [phi for phi in target.phis if source in phi.incoming]
+        push(tuple(phi.incoming[source] for phi in phis))
+        for phi in reversed(phis):
+            store(phi.dest)
+
+    for reg in reversed(func.params):
+        store(reg)
+    for block in func.blocks:
+        for instr in block.instrs:
+            if instr.dest in consts and instr.dest not in stacked:
+                # Written out where it is used
+                continue
+            push(instr.args)
+            code.append((instr.op,) if instr.operand is None else (instr.op, instr.operand))
+            if instr.dest is None:
+                continue
+            if instr.dest in stacked:
+                consts.pop(instr.dest, None)
+                pending.append(instr.dest)
+            else:
+                store(instr.dest)
+        end = block.end
+        if end is None:
+            continue
+        op = end[0]
+        # Everything left on the stack has been used by now
+        if op == 'IF' or op == 'RET':
+            push((end[1],))
+        elif op == 'CBREAK':
+            push((end[1],))
+            if block.live:
+                copies(block, end[2])
+        else:
+            flush()
+            if block.live:
+                copies(block, end[1])
+        code.append((op,))
+    irfunc.code[:] = code
+    irfunc.locals = locals_
+    return code
+
+def roundtrip(irmodule):
+    # A pass: every function into SSA form and back
+    callees = functions(irmodule)
+    for irfunc in irmodule.functions:
+        to_stack(to_ssa(irfunc, callees))
+
+def main(args):
+    from wabbit.ircache import compile_module
+    from wabbit.driver import listing
+    for filename in args:
+        irmodule = compile_module(filename)
+        if irmodule is None:
+            continue
+        for irfunc in irmodule.functions:
+            func = to_ssa(irfunc)
+            print(func)
+            to_stack(func)
+            print(listing(irfunc))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
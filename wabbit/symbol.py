@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from types import MappingProxyType
+
 from wabbit.lexer import Token
 
 from leatherman.dbg import dbg
@@ -28,16 +30,30 @@ class SymbolTable(dict):
         key = SymbolTable.make_key(obj)
         super().__setitem__(key, value)
 
-class Symbol:
+class SymbolType(type):
+    # Symbol classes can be changed while a grammar is being built, but
+    # not after Grammar has frozen them.
+    frozen = False
+
+    def __setattr__(cls, name, value):
+        if cls.frozen:
+            raise AttributeError(f'{cls.__name__} is frozen')
+        super().__setattr__(name, value)
+
+class Symbol(metaclass=SymbolType):
+    id = None
     lbp = 0
-    Table = SymbolTable()
+    nud = None
+    led = None
+    std = None
 
     def __init__(self, parser, token):
         self.parser = parser
         self.token = token
-        self.led = None
-        self.nud = None
-        self.std = None
+
+    @classmethod
+    def subclass(cls, key, bp=0):
+        return SymbolType(f'Symbol {key}', (cls,), {'id': key, 'lbp': bp})
 
     @property
     def type(self):
@@ -58,3 +74,26 @@ class Symbol:
             f'value={self.value}',
         ])
         return f'{self.__class__.__name__}({fields})'
+
+class Grammar:
+    # An immutable symbol table: the symbol classes of a parser, looked up
+    # like a SymbolTable (by key or by token).  Building one freezes every
+    # symbol class in it, so a single Grammar can be shared by any number
+    # of parsers, including parsers running in different threads.
+
+    def __init__(self, table):
+        for symbol_class in table.values():
+            type.__setattr__(symbol_class, 'frozen', True)
+        self.table = MappingProxyType(SymbolTable(table))
+
+    def __getitem__(self, obj):
+        return self.table[obj]
+
+    def __contains__(self, obj):
+        return SymbolTable.make_key(obj) in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(symbols={len(self)})'
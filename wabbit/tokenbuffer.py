@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+# tokenbuffer.py
+#
+# Compact token storage.  Instead of one Token object per token, a
+# TokenBuffer keeps four parallel typed arrays:
+#
+#    kinds    : token kind code (index into KINDS)
+#    starts   : byte offset of the token in the source
+#    lengths  : length of the token in bytes
+#    lines    : line number the token starts on
+#
+# The source itself is held as a bytes-like object and lexemes are
+# handed out as memoryview slices of it, so no per-token strings are
+# ever copied.  Offsets and lengths are in bytes; a str source is
+# encoded as UTF-8 first.
+#
+# The scanner uses the same rules as WabbitLexer (its master regular
+# expression, keyword remapping and ignored tokens), compiled for bytes.
+#
+# TokenBuffer.map() scans a memory-mapped SourceFile in place.  Its
+# lexemes are views into the mapping, so the buffer must be closed (and
+# any lexemes dropped) before the file is unmapped.
+
+import re
+import sys
+from array import array
+from bisect import bisect_left
+
+from sly.lex import Token
+
+from wabbit.lexer import WabbitLexer
+from wabbit.source import SourceFile
+
+# Kind codes.  Code 0 is reserved for the end of input.
+KINDS = ('EOF',) + tuple(sorted(WabbitLexer.tokens))
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+EOF = KIND_CODES['EOF']
+
+def _build_scanner(lexer):
+    ignore = ''.join(re.escape(char) for char in lexer.ignore)
+    pattern = '|'.join([
+        f'(?P<_skip>[{ignore}]+)',
+        lexer._master_re.pattern,
+        r'(?P<_error>[\s\S])',
+    ])
+    master = re.compile(pattern.encode('ascii'), lexer.reflags)
+    codes = {name: KIND_CODES.get(name) for name in master.groupindex}
+    remapping = {
+        KIND_CODES[name]: {value.encode('ascii'): KIND_CODES[kind] for value, kind in remap.items()}
+        for name, remap in lexer._remapping.items()
+    }
+    return master, codes, remapping
+
+_master, _codes, _remapping = _build_scanner(WabbitLexer)
+
+def scan(source, start, stop, lineno):
+    # Generate (kind code, start, end, lineno) for each token in
+    # source[start:stop]
+    codes = _codes
+    for match in _master.finditer(source, start, stop):
+        name = match.lastgroup
+        code = codes[name]
+        if code is None:
+            if name == '_skip':
+                continue
+            if name == '_error':
+                print("Illegal character '%s'" % chr(source[match.start()]))
+                continue
+            # Ignored tokens (newlines)
+            lineno += match.group().count(b'\n')
+            continue
+        begin, end = match.span()
+        if code in _remapping:
+            code = _remapping[code].get(source[begin:end], code)
+        yield code, begin, end, lineno
+
+class _Ends:
+    # Sequence of token end offsets, computed on demand for bisection
+    def __init__(self, buffer):
+        self.starts = buffer.starts
+        self.lengths = buffer.lengths
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, position):
+        return self.starts[position] + self.lengths[position]
+
+class BufferToken(Token):
+    # A lightweight view of one entry in a TokenBuffer.  It looks like a
+    # sly Token to code that expects one, but reads every field from the
+    # buffer's arrays on demand.
+    __slots__ = ('buffer', 'position')
+
+    def __init__(self, buffer, position):
+        self.buffer = buffer
+        self.position = position
+
+    @property
+    def type(self):
+        return KINDS[self.buffer.kinds[self.position]]
+
+    @property
+    def value(self):
+        return self.buffer.text(self.position)
+
+    @property
+    def lineno(self):
+        return self.buffer.lines[self.position]
+
+    @property
+    def index(self):
+        return self.buffer.starts[self.position]
+
+    @property
+    def end(self):
+        return self.buffer.starts[self.position] + self.buffer.lengths[self.position]
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(type={self.type!r}, value={self.value!r}, lineno={self.lineno}, index={self.index}, end={self.end})'
+
+class TokenBuffer:
+    __slots__ = ('file', 'source', 'view', 'kinds', 'starts', 'lengths', 'lines')
+
+    def __init__(self, source, file=None):
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        self.file = file
+        self.source = source
+        self.view = memoryview(source)
+        self.kinds = array('B')
+        self.starts = array('Q')
+        self.lengths = array('I')
+        self.lines = array('I')
+
+    @classmethod
+    def scan(cls, source, lineno=1):
+        buffer = cls(source)
+        buffer.extend(0, len(buffer.source), lineno)
+        return buffer
+
+    @classmethod
+    def map(cls, filename):
+        file = SourceFile(filename)
+        buffer = cls(file.data, file)
+        buffer.extend(0, len(file), 1)
+        return buffer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.view.release()
+        if self.file:
+            self.file.close()
+
+    def extend(self, start, stop, lineno):
+        # Scan source[start:stop] and append the tokens found.
+        kinds = self.kinds.append
+        starts = self.starts.append
+        lengths = self.lengths.append
+        lines = self.lines.append
+        for code, begin, end, lineno in scan(self.source, start, stop, lineno):
+            kinds(code)
+            starts(begin)
+            lengths(end - begin)
+            lines(lineno)
+
+    def relex(self, offset, deleted, inserted):
+        # Apply an edit (replace deleted bytes at offset with inserted) and
+        # return a new buffer for the edited source.  Only the tokens around
+        # the edit are scanned again.  Scanning starts one token before the
+        # first token the edit touches (an insertion can extend or merge
+        # with its neighbour) and stops at the first new token that begins
+        # where an old token began, shifted by the edit.  The lexer has no
+        # state beyond its position, so every old token from there on is
+        # reused with its offset and line number shifted.
+        if isinstance(inserted, str):
+            inserted = inserted.encode('utf-8')
+        view = self.view
+        removed = view[offset:offset + deleted]
+        source = b''.join([view[:offset], inserted, view[offset + deleted:]])
+        delta = len(inserted) - deleted
+        line_delta = inserted.count(b'\n') - bytes(removed).count(b'\n')
+        removed.release()
+
+        buffer = TokenBuffer(source)
+        starts = self.starts
+        # First token ending at or after the edit, then one more back.  An
+        # edit before the first token (say, in a header comment) rescans
+        # from the top of the source.
+        first = bisect_left(_Ends(self), offset)
+        restart = max(first - 1, 0)
+        if restart < len(self) and offset >= starts[restart]:
+            start, lineno = starts[restart], self.lines[restart]
+        else:
+            start, lineno = 0, 1
+        buffer.kinds = self.kinds[:restart]
+        buffer.starts = starts[:restart]
+        buffer.lengths = self.lengths[:restart]
+        buffer.lines = self.lines[:restart]
+
+        edited = offset + len(inserted)
+        for code, begin, end, lineno in scan(source, start, len(source), lineno):
+            if begin >= edited:
+                old = bisect_left(starts, begin - delta)
+                if old < len(starts) and starts[old] == begin - delta:
+                    buffer.kinds += self.kinds[old:]
+                    buffer.lengths += self.lengths[old:]
+                    buffer.starts += array('Q', [at + delta for at in starts[old:]]) if delta else starts[old:]
+                    lines = self.lines[old:]
+                    buffer.lines += array('I', [line + line_delta for line in lines]) if line_delta else lines
+                    break
+            buffer.kinds.append(code)
+            buffer.starts.append(begin)
+            buffer.lengths.append(end - begin)
+            buffer.lines.append(lineno)
+        return buffer
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self.kinds)
+        if not 0 <= position < len(self.kinds):
+            raise IndexError('token index out of range')
+        return BufferToken(self, position)
+
+    def __iter__(self):
+        for position in range(len(self.kinds)):
+            yield BufferToken(self, position)
+
+    def kind(self, position):
+        return KINDS[self.kinds[position]]
+
+    def lexeme(self, position):
+        start = self.starts[position]
+        return self.view[start:start + self.lengths[position]]
+
+    def text(self, position):
+        return str(self.lexeme(position), 'utf-8')
+
+    def column(self, position):
+        start = self.starts[position]
+        return start - self.source.rfind(b'\n', 0, start)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(tokens={len(self)}, bytes={len(self.view)})'
+
+def main(args):
+    for filename in args:
+        with TokenBuffer.map(filename) as buffer:
+            for token in buffer:
+                print(token)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
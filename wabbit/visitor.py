@@ -1,6 +1,125 @@
 #!/usr/bin/env python3
 
-from multimethod import multimeta
+# visitor.py
+#
+# Visitor base class.  A visitor defines visit() once per node class,
+# with the node parameter annotated with the class it handles:
+#
+#     class Renderer(Visitor):
+#         def visit(self, literal: Literal): ...
+#         def visit(self, integer: Integer): ...
+#
+# The metaclass collects the definitions instead of letting each one
+# replace the one before.  visit(node, ...) then calls the definition
+# for the nearest class in type(node).__mro__, so visit(Integer(1))
+# uses the Integer method and visit(Float(1.0)) falls back to Literal.
+# A definition without an annotation handles object, i.e. anything.
+#
+# Dispatch only looks at the node, never at the other arguments.  The
+# method for each node class is looked up once and cached, so a call
+# costs a dict lookup.  Subclasses of a visitor inherit its methods and
+# can override them per node class.
+#
+# A visit method may be a generator.  Instead of calling self.visit()
+# on a child, it yields the child (or a tuple of the child and the
+# arguments to visit it with) and gets the child's result back:
+#
+#     def visit(self, binop: BinOp, env):
+#         left = yield binop.left, env
+#         right = yield binop.right, env
+#         return f'({left} {binop.operator.value} {right})'
+#
+# visit() runs such methods on an explicit stack of suspended
+# generators rather than on the Python call stack, so the depth of the
+# tree is limited by memory and not by sys.getrecursionlimit().  Code
+# before a yield runs on the way down the tree and code after it on
+# the way back up.  Methods for leaves can stay plain functions.
 
-class Visitor(metaclass=multimeta):
+from types import GeneratorType
+
+class DispatchError(TypeError):
+    pass
+
+class VisitorNamespace(dict):
+    # Class body namespace that keeps every definition of visit
+
+    def __init__(self):
+        super().__init__()
+        self.overloads = []
+
+    def __setitem__(self, key, value):
+        if key == 'visit' and callable(value):
+            self.overloads.append(value)
+        else:
+            super().__setitem__(key, value)
+
+def handled_class(func):
+    # The class named by the annotation on the node parameter
+    names = func.__code__.co_varnames[:func.__code__.co_argcount]
+    annotation = func.__annotations__.get(names[1], object) if len(names) > 1 else object
+    if isinstance(annotation, str):
+        annotation = eval(annotation, func.__globals__)
+    return annotation
+
+class VisitorType(type):
+
+    @classmethod
+    def __prepare__(metacls, name, bases, **kwargs):
+        return VisitorNamespace()
+
+    def __new__(metacls, name, bases, namespace, **kwargs):
+        cls = super().__new__(metacls, name, bases, dict(namespace), **kwargs)
+        handlers = {}
+        for base in reversed(cls.__mro__[1:]):
+            handlers.update(getattr(base, '_handlers', {}))
+        for func in namespace.overloads:
+            handlers[handled_class(func)] = func
+        cls._handlers = handlers
+        cls._cache = cache = {}
+        if handlers:
+            cls.visit = make_visit(cls, handlers, cache)
+        return cls
+
+def make_visit(cls, handlers, cache):
+    def resolve(node_class):
+        for klass in node_class.__mro__:
+            if klass in handlers:
+                cache[node_class] = handlers[klass]
+                return handlers[klass]
+        raise DispatchError(f'{cls.__name__} has no visit() for {node_class.__name__}')
+
+    def visit(self, node, *args, **kwargs):
+        try:
+            handler = cache[node.__class__]
+        except KeyError:
+            handler = resolve(node.__class__)
+        result = handler(self, node, *args, **kwargs)
+        if result.__class__ is not GeneratorType:
+            return result
+        # Run the generator, and those of the children it asks for, on
+        # an explicit stack
+        stack = [result]
+        value = None
+        while True:
+            try:
+                request = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                if not stack:
+                    return value
+                continue
+            if request.__class__ is not tuple:
+                request = (request,)
+            try:
+                handler = cache[request[0].__class__]
+            except KeyError:
+                handler = resolve(request[0].__class__)
+            value = handler(self, *request)
+            if value.__class__ is GeneratorType:
+                stack.append(value)
+                value = None
+    return visit
+
+class Visitor(metaclass=VisitorType):
     pass